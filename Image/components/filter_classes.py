@@ -2,13 +2,16 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from constants import *
-from image_filtering.image_processing import *
+from image_filtering.pipeline import *
 
 
 class FilterListItem(QWidget):
     """
     class that provides an icon, name, checkbox, title, and layout to items in the filter list
     """
+    # emitted when the filter is checked or unchecked or one of its inputs changes
+    changed = pyqtSignal()
+
     def __init__(self):
         super().__init__()
 
@@ -16,6 +19,7 @@ class FilterListItem(QWidget):
         name_layout.setContentsMargins(0, 0, 0, 0)
 
         self.activate = QCheckBox()
+        self.activate.toggled.connect(self.changed)
         name_layout.addWidget(self.activate)
 
         self.icon = QLabel()
@@ -67,6 +71,22 @@ class FilterListItem(QWidget):
         """
         self.description.setText(text)
 
+    def get_spec(self) -> FilterSpec:
+        """
+        gets the plain data spec of the filter with the current values of the inputs
+        every filter overrides it, this class can't be an abc as pyqt widgets have their own metaclass
+        :return: the spec
+        """
+        raise NotImplementedError
+
+    def set_spec(self, spec: FilterSpec):
+        """
+        sets the inputs to the values in a spec
+        :param spec: the spec to read the values from
+        :return: nothing
+        """
+        pass
+
 
 class Scan(FilterListItem):
     """
@@ -89,10 +109,14 @@ class Scan(FilterListItem):
         self.slider.setMinimum(0)
         self.slider.setMaximum(255)
         self.slider.setValue(200)
+        self.slider.valueChanged.connect(self.changed)
         self.content_layout.addWidget(self.slider)
 
-    def apply_to_image(self, img: Image.Image):
-        return filter_scan(img, self.slider.value())
+    def get_spec(self) -> ScanSpec:
+        return ScanSpec(self.slider.value())
+
+    def set_spec(self, spec: ScanSpec):
+        self.slider.setValue(spec.threshold)
 
 
 class Rotate(FilterListItem):
@@ -132,12 +156,24 @@ class Rotate(FilterListItem):
         self.angle_selector.setMinimum(-360)
         self.angle_selector.setMaximum(360)
         self.angle_selector.setSingleStep(10)
+        self.angle_selector.valueChanged.connect(self.changed)
         angle_selector_layout.addWidget(self.angle_selector, 0)
 
+        # resampling used for angles that aren't right angles, from fastest to smoothest
+        self.resample_selector = QComboBox()
+        self.resample_selector.addItems(list(ROTATE_RESAMPLING))
+        self.resample_selector.setToolTip('Resampling for angles that are not multiples of 90')
+        self.resample_selector.currentTextChanged.connect(self.changed)
+        angle_selector_layout.addWidget(self.resample_selector, 0)
+
         self.content_layout.addLayout(angle_selector_layout)
 
-    def apply_to_image(self, img: Image.Image):
-        return rotate(img, self.angle_selector.value())
+    def get_spec(self) -> RotateSpec:
+        return RotateSpec(self.angle_selector.value(), self.resample_selector.currentText())
+
+    def set_spec(self, spec: RotateSpec):
+        self.angle_selector.setValue(spec.angle)
+        self.resample_selector.setCurrentText(spec.resample)
 
     def set_rotate_left(self):
         self.angle_selector.setValue(90)
@@ -165,6 +201,7 @@ class Flip(FilterListItem):
         self.flip_horizontal.setIcon(QIcon(FLIP_HOR_IMG))
         self.flip_horizontal.setText('Flip Horizontal')
         self.flip_horizontal.clicked.connect(self.horizontal_selected)
+        self.flip_horizontal.clicked.connect(self.changed)
         self.content_layout.addWidget(self.flip_horizontal)
 
         self.flip_vertical = QPushButton()
@@ -172,13 +209,19 @@ class Flip(FilterListItem):
         self.flip_vertical.setIcon(QIcon(FLIP_VER_IMG))
         self.flip_vertical.setText('Flip Vertical')
         self.flip_vertical.clicked.connect(self.vertical_selected)
+        self.flip_vertical.clicked.connect(self.changed)
         self.content_layout.addWidget(self.flip_vertical)
 
-    def apply_to_image(self, img: Image.Image):
-        if self.flip_horizontal.isChecked():
-            return flip(img, True)
+    def get_spec(self) -> FlipSpec:
+        return FlipSpec(self.flip_horizontal.isChecked())
+
+    def set_spec(self, spec: FlipSpec):
+        if spec.horizontal:
+            self.flip_horizontal.setChecked(True)
+            self.horizontal_selected()
         else:
-            return flip(img, False)
+            self.flip_vertical.setChecked(True)
+            self.vertical_selected()
 
     def vertical_selected(self):
         self.flip_horizontal.setChecked(False)
@@ -216,6 +259,7 @@ class Crop(FilterListItem):
         self.left_spinbox.setMaximum(100)
         self.left_spinbox.setSingleStep(5)
         self.left_spinbox.valueChanged.connect(self.left_changed)
+        self.left_spinbox.valueChanged.connect(self.changed)
         left_input.addWidget(self.left_spinbox)
         col_1.addLayout(left_input)
 
@@ -228,6 +272,7 @@ class Crop(FilterListItem):
         self.top_spinbox.setMaximum(100)
         self.top_spinbox.setSingleStep(5)
         self.top_spinbox.valueChanged.connect(self.top_changed)
+        self.top_spinbox.valueChanged.connect(self.changed)
         top_input.addWidget(self.top_spinbox)
         col_1.addLayout(top_input)
 
@@ -240,6 +285,7 @@ class Crop(FilterListItem):
         self.right_spinbox.setMaximum(100)
         self.right_spinbox.setSingleStep(5)
         self.right_spinbox.valueChanged.connect(self.right_changed)
+        self.right_spinbox.valueChanged.connect(self.changed)
         right_input.addWidget(self.right_spinbox)
         col_2.addLayout(right_input)
 
@@ -252,21 +298,30 @@ class Crop(FilterListItem):
         self.bottom_spinbox.setMaximum(100)
         self.bottom_spinbox.setSingleStep(5)
         self.bottom_spinbox.valueChanged.connect(self.bottom_changed)
+        self.bottom_spinbox.valueChanged.connect(self.changed)
         bottom_input.addWidget(self.bottom_spinbox)
         col_2.addLayout(bottom_input)
 
         self.content_layout.addLayout(col_1)
         self.content_layout.addLayout(col_2)
 
-    def apply_to_image(self, img: Image.Image):
-        return crop(
-            img,
+    def get_spec(self) -> CropSpec:
+        return CropSpec(
             self.left_spinbox.value(),
             self.top_spinbox.value(),
             self.right_spinbox.value(),
             self.bottom_spinbox.value()
         )
 
+    def set_spec(self, spec: CropSpec):
+        # clear the values first so the maximums of opposite sides don't clamp the new values
+        for spinbox in [self.left_spinbox, self.top_spinbox, self.right_spinbox, self.bottom_spinbox]:
+            spinbox.setValue(0)
+        self.left_spinbox.setValue(spec.left)
+        self.top_spinbox.setValue(spec.top)
+        self.right_spinbox.setValue(spec.right)
+        self.bottom_spinbox.setValue(spec.bottom)
+
     def right_changed(self):
         self.left_spinbox.setMaximum(100 - self.right_spinbox.value())
 
@@ -292,8 +347,8 @@ class Sharpen(FilterListItem):
         icon = QPixmap(SHARPEN_IMG)
         self.set_icon(icon)
 
-    def apply_to_image(self, img: Image.Image):
-        return sharpen(img)
+    def get_spec(self) -> SharpenSpec:
+        return SharpenSpec()
 
 
 class Blur(FilterListItem):
@@ -314,13 +369,17 @@ class Blur(FilterListItem):
         self.slider.setMinimum(0)
         self.slider.setMaximum(7)
         self.slider.setSingleStep(1)
+        self.slider.valueChanged.connect(self.changed)
         self.content_layout.addWidget(self.slider)
 
         icon = QPixmap(BLUR_IMG)
         self.set_icon(icon)
 
-    def apply_to_image(self, img: Image.Image):
-        return blur(img, self.slider.value())
+    def get_spec(self) -> BlurSpec:
+        return BlurSpec(self.slider.value())
+
+    def set_spec(self, spec: BlurSpec):
+        self.slider.setValue(spec.intensity)
 
 
 class Smooth(FilterListItem):
@@ -341,13 +400,17 @@ class Smooth(FilterListItem):
         self.slider.setMinimum(1)
         self.slider.setMaximum(5)
         self.slider.setSingleStep(1)
+        self.slider.valueChanged.connect(self.changed)
         self.content_layout.addWidget(self.slider)
 
         icon = QPixmap(SMOOTH_IMG)
         self.set_icon(icon)
 
-    def apply_to_image(self, img: Image.Image):
-        return smooth(img, self.slider.value())
+    def get_spec(self) -> SmoothSpec:
+        return SmoothSpec(self.slider.value())
+
+    def set_spec(self, spec: SmoothSpec):
+        self.slider.setValue(spec.intensity)
 
 
 class Emboss(FilterListItem):
@@ -362,8 +425,8 @@ class Emboss(FilterListItem):
         icon = QPixmap(EMBOSS_IMG)
         self.set_icon(icon)
 
-    def apply_to_image(self, img: Image.Image):
-        return emboss(img)
+    def get_spec(self) -> EmbossSpec:
+        return EmbossSpec()
 
 
 class Greyscale(FilterListItem):
@@ -378,6 +441,6 @@ class Greyscale(FilterListItem):
         icon = QPixmap(GREYSCALE_IMG)
         self.set_icon(icon)
 
-    def apply_to_image(self, img: Image.Image):
-        return greyscale(img)
+    def get_spec(self) -> GreyscaleSpec:
+        return GreyscaleSpec()
 
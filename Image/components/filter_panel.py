@@ -40,6 +40,9 @@ class FiltersSelector(QListWidget):
     """
     list widget that holds all the filters
     """
+    # emitted whenever the pipeline from get_pipeline may have changed
+    pipeline_changed = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setAlternatingRowColors(True)
@@ -55,4 +58,34 @@ class FiltersSelector(QListWidget):
             list_item.setSizeHint(new_filter.sizeHint())
             self.addItem(list_item)
             self.setItemWidget(list_item, new_filter)
+            new_filter.changed.connect(self.pipeline_changed)
             self.filters.append(new_filter)
+
+    def get_pipeline(self) -> Pipeline:
+        """
+        gets the pipeline made up of all checked filters, in the order they are listed
+        :return: the pipeline
+        """
+        return Pipeline(tuple(
+            image_filter.get_spec() for image_filter in self.filters if image_filter.activate.isChecked()
+        ))
+
+    def set_pipeline(self, pipeline: Pipeline):
+        """
+        checks the filters used by a pipeline, sets their inputs and unchecks all other filters
+        filters always run in the order they are listed, so the pipeline has to use each
+        filter at most once and in that order
+        :param pipeline: the pipeline to show
+        :return: nothing
+        """
+        filters = {type(image_filter.get_spec()): image_filter for image_filter in self.filters}
+        positions = [self.filters.index(filters[type(spec)]) for spec in pipeline]
+        if positions != sorted(set(positions)):
+            raise ValueError('pipeline uses a filter more than once or out of order')
+
+        for image_filter in self.filters:
+            image_filter.activate.setChecked(False)
+        for spec in pipeline:
+            image_filter = filters[type(spec)]
+            image_filter.set_spec(spec)
+            image_filter.activate.setChecked(True)
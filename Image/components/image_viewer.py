@@ -1,15 +1,16 @@
 from PyQt6.QtWidgets import (
     QWidget,
-    QTabWidget,
+    QListView,
     QVBoxLayout,
     QLabel,
     QSizePolicy
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer, QStringListModel, pyqtSignal
 from PyQt6.QtGui import QPixmap
 from constants import *
 from PIL import Image
 from PIL.ImageQt import ImageQt
+from image_filtering.profiling import stage
 
 # im = ImageQt(Image.open('notes.png'))
 # pixmap = QtGui.QPixmap.fromImage(im)
@@ -22,12 +23,28 @@ from PIL.ImageQt import ImageQt
 class ImageViewer(QWidget):
     """
     image viewer that displays the edited images
+    the opened images are listed in a strip that only draws the names in view, and only the
+    shown image and the VIEWER_NEARBY images on either side of it are kept in memory with
+    their pixmaps, so any number of images can be opened
     """
+    # emitted when other images come next to the shown one, their previews can be made then
+    nearby_changed = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setMinimumWidth(IMAGE_VIEWER_MIN_WIDTH)
-        # stores all opened images as PIL images
-        self.opened_images = dict()
+        # stores the file path of every opened image by name, images are only loaded when
+        # they are near the shown one and workers load the full images themselves
+        self.image_paths = dict()
+        # names of the opened images in the order they are listed, and the row of each name
+        self.names = []
+        self.rows = dict()
+        # ImagePreview of the shown image and the ones next to it, by name
+        self.previews = dict()
+        # names of the images near the shown one that couldn't be opened
+        self.unreadable = set()
+        # set while the list is refilled, the rows it goes through on the way aren't shown
+        self.updating = False
 
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
@@ -36,145 +53,243 @@ class ImageViewer(QWidget):
         label.setStyleSheet(TITLE_LABEL_STYLE)
         layout.addWidget(label)
 
-        self.image_tabs = QTabWidget()
-        self.image_tabs.currentChanged.connect(self.scale_current_tab)
-        layout.addWidget(self.image_tabs)
+        # strip of names that replaces a row of tabs, the view only draws the rows in view
+        self.name_model = QStringListModel()
+        self.name_list = QListView()
+        self.name_list.setModel(self.name_model)
+        self.name_list.setFlow(QListView.Flow.LeftToRight)
+        self.name_list.setWrapping(False)
+        self.name_list.setUniformItemSizes(True)
+        self.name_list.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.name_list.setFixedHeight(IMAGE_LIST_HEIGHT)
+        self.name_list.selectionModel().currentRowChanged.connect(self.row_changed)
+        layout.addWidget(self.name_list)
+
+        self.image_label = QLabel()
+        self.image_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.image_label, 1)
 
         self.setLayout(layout)
 
-    def update_tabs(self, selection, selected_dir):
+        # smoothly rescales the image once the viewer stops being resized
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_SMOOTH_DELAY)
+        self.resize_timer.timeout.connect(self.show_current)
+
+    def update_selection(self, selection, selected_dir):
         """
-        updates tabs to only include the files chosen by the user
+        updates the list to only include the files chosen by the user
         :param selection: selection the user chose
         :param selected_dir: directory where the selection items are located
         :return: nothing
         """
-        # add tabs that are newly selected
+        current = self.current_name()
+        image_paths = dict()
         for item_name in selection:
-            newly_selected = True
-
-            for i in range(self.image_tabs.count()):
-                if item_name == self.image_tabs.tabText(i):
-                    newly_selected = False
-                    break
-
-            if newly_selected:
-                # if the item was just selected, add to the tabs
-                path = selected_dir + '\\' + item_name
-                image = Image.open(path)
-                self.add_image(image, item_name)
-                self.opened_images[item_name] = image
-
-        # remove all the tabs that are not in the current selection
-        for i in range(self.image_tabs.count() - 1, -1, -1):
-            tab_name = self.image_tabs.tabText(i)
-            if tab_name not in selection:
-                self.image_tabs.removeTab(i)
-                self.opened_images.pop(tab_name)
-
-    def add_image(self, image, tab_name) -> None:
-        """
-        adds a new tab with an image
-        :param image: image to be in the tab
-        :param tab_name: name of the tab
+            # images that stay selected keep their path, even if the directory changed
+            image_paths[item_name] = self.image_paths.get(item_name, selected_dir + '\\' + item_name)
+        self.image_paths = image_paths
+        self.names = list(image_paths)
+        self.rows = {name: row for row, name in enumerate(self.names)}
+
+        # the shown image stays shown if it is still selected, the list loses its current row
+        # when it is refilled so the change is only handled once it is set again
+        self.updating = True
+        try:
+            self.name_model.setStringList(self.names)
+            if len(self.names) > 0:
+                self.name_list.setCurrentIndex(self.name_model.index(self.rows.get(current, 0)))
+        finally:
+            self.updating = False
+        self.current_changed()
+
+    def current_name(self):
+        """
+        :return: name of the shown image, None if no image is opened
+        """
+        row = self.name_list.currentIndex().row()
+        return self.names[row] if 0 <= row < len(self.names) else None
+
+    def nearby_paths(self) -> dict:
+        """
+        gets the images whose previews are kept, the shown one first
+        :return: dict of name to path
+        """
+        current = self.name_list.currentIndex().row()
+        if not 0 <= current < len(self.names):
+            return dict()
+        rows = [current] + [
+            row for offset in range(1, VIEWER_NEARBY + 1) for row in (current - offset, current + offset)
+            if 0 <= row < len(self.names)
+        ]
+        return {self.names[row]: self.image_paths[self.names[row]] for row in rows}
+
+    def row_changed(self):
+        """
+        handles the user picking another image in the list
         :return: nothing
         """
-        # convert image to format usable for pyqt
-        image_tab = ImageTab()
-        image_tab.set_image(image, self.width(), self.height())
-        self.image_tabs.addTab(image_tab, tab_name)
+        if not self.updating:
+            self.current_changed()
 
-    def set_multiple_images(self, image_dict: dict):
+    def current_changed(self):
         """
-        sets the images of tabs to be images from the image_dict dictionary
-        :param image_dict: format is {tab-name: image-to-be-set}
-        :return:
+        drops the previews that are no longer next to the shown image and shows the new one
+        :return: nothing
         """
-        for tab_name in image_dict:
-            img = image_dict[tab_name]
-            self.set_image(tab_name, img)
+        nearby = self.nearby_paths()
+        for name in [name for name in self.previews if name not in nearby]:
+            del self.previews[name]
+        self.unreadable &= set(nearby)
+        self.show_current()
+        self.nearby_changed.emit()
 
-    def set_image(self, tab_name, img):
+    def set_image(self, name, img):
         """
-        sets the image of a single tab given the tab name
-        :param tab_name: str name of the tab where the image is contained
+        sets the image shown for a name, images that aren't near the shown one are left out
+        :param name: str name of the image
         :param img: image to be set
         :return: nothing
         """
-        for i in range(self.image_tabs.count()):
-            if self.image_tabs.tabText(i) == tab_name:
-                image_tab = self.image_tabs.widget(i)
-                image_tab.set_image(img, self.width(), self.height())
-                break
+        row = self.rows.get(name)
+        current = self.name_list.currentIndex().row()
+        if row is None or abs(row - current) > VIEWER_NEARBY:
+            return
+        self.previews[name] = ImagePreview(img)
+        self.unreadable.discard(name)
+        if row == current:
+            self.show_current()
+
+    def set_unreadable(self, name):
+        """
+        shows that an image couldn't be opened, until it is set
+        :param name: str name of the image
+        :return: nothing
+        """
+        if name not in self.rows:
+            return
+        self.unreadable.add(name)
+        if name == self.current_name():
+            self.show_current()
+
+    def preview_box(self) -> tuple:
+        """
+        gets the size in device pixels that the shown image can be shown at
+        :return: (width, height)
+        """
+        ratio = self.devicePixelRatioF()
+        return (
+            max(1, int(self.width() * IMAGE_VIEW_SCALE * ratio)),
+            max(1, int(self.height() * IMAGE_VIEW_SCALE * ratio))
+        )
 
     def resizeEvent(self, event):
         """
-        scales the image in the current tab whenever it is resized
+        quickly scales the shown image whenever it is resized, and smoothly once the
+        resizing stops
         """
-        self.scale_current_tab()
+        self.show_current(smooth=False)
+        self.resize_timer.start()
         return super().resizeEvent(event)
 
-    def scale_current_tab(self):
+    def show_current(self, smooth: bool = True):
         """
-        scales the image of the current tab to fit the width and height
+        scales the shown image to fit the width and height
+        images without a preview yet are shown once it is set, the files are only opened in
+        the background by the previews made on nearby_changed
+        :param smooth: smooth the scaled image, slower than a quick nearest neighbour scale
         :return: nothing
         """
-        current_tab = self.image_tabs.currentWidget()
-        if current_tab is not None:
-            current_tab.scale_image(self.width(), self.height())
+        name = self.current_name()
+        if name is None:
+            self.image_label.clear()
+            return
+        preview = self.previews.get(name)
+        if preview is None:
+            self.image_label.setText('Could not open image' if name in self.unreadable else 'Loading...')
+            return
+        self.image_label.setPixmap(preview.scaled(self.width(), self.height(), smooth))
 
 
-class ImageTab(QWidget):
+class ImagePreview:
     """
-    tab that can hold an image and resize it. Used with the ImageViewer
+    an image in the ImageViewer along with its pixmaps, the image is converted to a pixmap
+    once and smaller copies of it are kept so it can be rescaled quickly
     """
-    def __init__(self):
-        super().__init__()
-        # image that the tab is currently showing
-        self.img = None
-
-        # create layout
-        layout = QVBoxLayout()
-        layout.setContentsMargins(0, 0, 0, 0)
-
-        self.image_label = QLabel()
-        layout.addWidget(self.image_label, alignment=Qt.AlignmentFlag.AlignCenter)
-
-        self.setLayout(layout)
+    def __init__(self, img: Image.Image):
+        """
+        :param img: the image, kept in its own mode and only converted to be shown
+        """
+        self.img = img
+        # the image converted to a pixmap once, followed by copies of half the size of the one
+        # before, made the first time the image is shown
+        self.pyramid = []
+        # last scaled pixmap and the (width, height, smooth) it was scaled for
+        self.pixmap = None
+        self.shown = None
 
-    def set_image(self, img: Image.Image, width: int, height: int):
+    def make_pyramid(self):
         """
-        sets the image of the tab to the passed in image and scales it to width and
-        height while keeping the same aspect ratio
-        :param img: the image to be set
-        :param width: the width to be scaled to
-        :param height: the height to be scaled to
+        converts the image to a pixmap and makes the smaller copies of it
         :return: nothing
         """
-        # convert image to usable format
-        img = img.convert('RGBA')
-        self.img = img
-        # pixmap from image
-        pixmap = QPixmap.fromImage(ImageQt(img))
-        pixmap = pixmap.scaled(
-            int(width * IMAGE_VIEW_SCALE),
-            int(height * IMAGE_VIEW_SCALE),
-            Qt.AspectRatioMode.KeepAspectRatio
-        )
-        self.image_label.setPixmap(pixmap)
+        with stage('display') as timed:
+            # the pixmap can share the memory of the QImage, which the ImageQt only keeps
+            # while it exists, so it is copied into a QImage that owns its memory first
+            pixmap = QPixmap.fromImage(ImageQt(display_image(self.img)).copy())
+            timed.image(self.img)
+        self.pyramid = [pixmap]
+        while min(pixmap.width(), pixmap.height()) // 2 >= MIPMAP_MIN_SIZE:
+            pixmap = pixmap.scaled(
+                pixmap.width() // 2,
+                pixmap.height() // 2,
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+            self.pyramid.append(pixmap)
 
-    def scale_image(self, width: int, height: int):
+    def scaled(self, width: int, height: int, smooth: bool = True) -> QPixmap:
         """
-        scales the current image to width and height while
-        keeping the same aspect ratio
+        scales the image to width and height while keeping the same aspect ratio
+        the smallest copy in the pyramid that is still big enough is scaled, so it never
+        shrinks more than twice
         :param width: the width to be scaled to
         :param height: the height to be scaled to
-        :return: nothing
+        :param smooth: smooth the scaled image, slower than a quick nearest neighbour scale
+        :return: the scaled pixmap
         """
-        pixmap = QPixmap.fromImage(ImageQt(self.img))
-        pixmap = pixmap.scaled(
-            int(width * IMAGE_VIEW_SCALE),
-            int(height * IMAGE_VIEW_SCALE),
-            Qt.AspectRatioMode.KeepAspectRatio
+        box_width, box_height = max(1, int(width * IMAGE_VIEW_SCALE)), max(1, int(height * IMAGE_VIEW_SCALE))
+        # a smooth pixmap for the same size is good enough for a quick scale too
+        if self.shown in ((box_width, box_height, smooth), (box_width, box_height, True)):
+            return self.pixmap
+        if len(self.pyramid) == 0:
+            self.make_pyramid()
+
+        # size the image will be shown at
+        full = self.pyramid[0]
+        fit = min(box_width / full.width(), box_height / full.height())
+        level = full
+        for pixmap in self.pyramid:
+            if pixmap.width() >= full.width() * fit and pixmap.height() >= full.height() * fit:
+                level = pixmap
+        self.pixmap = level.scaled(
+            box_width,
+            box_height,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation if smooth else Qt.TransformationMode.FastTransformation
         )
-        self.image_label.setPixmap(pixmap)
\ No newline at end of file
+        self.shown = (box_width, box_height, smooth)
+        return self.pixmap
+
+
+def display_image(img: Image.Image) -> Image.Image:
+    """
+    gets a version of an image that pyqt can show
+    :param img: the image
+    :return: img if its mode is one of DISPLAY_MODES, otherwise a converted copy
+    """
+    if img.mode in DISPLAY_MODES:
+        return img
+    return img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
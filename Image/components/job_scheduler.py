@@ -0,0 +1,250 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, pyqtSignal
+
+from image_filtering.batch import walk_image_paths, run_batch, PENDING_PER_WORKER
+from image_filtering.encoders import EncoderSettings
+from image_filtering.executor import BatchExecutor
+from image_filtering.manifest import ExportManifest
+from image_filtering.pipeline import Pipeline
+
+
+class JobBatch(QObject):
+    """
+    a group of jobs started together, e.g. the previews of the images in the viewer
+    results are handed back on the GUI thread through the signals
+    """
+    # emitted with the item and the result of a job
+    item_done = pyqtSignal(object, object)
+    # emitted with the item and the error of a job that failed
+    item_failed = pyqtSignal(object, str)
+    # emitted once every job has ended or was cancelled before it started
+    finished = pyqtSignal()
+    # emitted by each job from its thread when it ends
+    finished_job = pyqtSignal()
+
+    def __init__(self, executor: BatchExecutor, func, items: list, args: tuple, then: tuple = None):
+        """
+        :param executor: does the work of the jobs
+        :param func: module level function that does the work for one item
+        :param items: the items to process
+        :param args: extra arguments passed to every call
+        :param then: (executor, func, args) for a second step, func(item, result, *args) is run
+        on that executor with the result of each job and its result is the one handed back
+        """
+        super().__init__()
+        self.executor = executor
+        self.func = func
+        self.args = args
+        self.then = then
+        if then is not None:
+            # second steps started and not ended yet, they hold results in memory so only a
+            # few are let in at once
+            self.then_slots = threading.Semaphore(then[0].workers * PENDING_PER_WORKER)
+        self.jobs = [Job(self, item) for item in items]
+        self.finished_job.connect(self.job_ended)
+        self.total = len(self.jobs)
+        # number of jobs that have ended or were taken off the queue
+        self.ended = 0
+        self.cancelled = False
+
+    def job_ended(self):
+        """
+        counts a job that has ended, called on the GUI thread
+        :return: nothing
+        """
+        self.ended += 1
+        if self.ended == self.total:
+            self.finished.emit()
+
+
+class Job(QRunnable):
+    """
+    runs one item of a batch on a thread of the pool, the work itself is handed to the
+    executor so it can run in another process while this thread waits
+    """
+    def __init__(self, batch: JobBatch, item):
+        """
+        :param batch: the batch the job belongs to
+        :param item: the item to process
+        """
+        super().__init__()
+        # the batch keeps the job alive, so Qt must not delete it
+        self.setAutoDelete(False)
+        self.batch = batch
+        self.item = item
+
+    def run(self):
+        """
+        runs the job unless its batch was cancelled
+        a second step is handed to its executor without waiting for it, so the thread can go
+        on to the next job, e.g. filter the next image while this one is being written
+        :return: nothing
+        """
+        try:
+            if not self.batch.cancelled:
+                result = self.batch.executor.submit(self.batch.func, self.item, *self.batch.args).result()
+                if self.batch.then is not None:
+                    executor, func, args = self.batch.then
+                    # waits here when too many results are waiting for their second step
+                    self.batch.then_slots.acquire()
+                    executor.submit(func, self.item, result, *args).add_done_callback(self.then_done)
+                    return
+                self.batch.item_done.emit(self.item, result)
+        except Exception as e:
+            self.batch.item_failed.emit(self.item, f'{type(e).__name__}: {e}')
+        # the batch lives on the GUI thread, so this runs there once the results are in
+        self.batch.finished_job.emit()
+
+    def then_done(self, future):
+        """
+        hands back the result of the second step, called on the thread that ran it
+        :param future: the second step
+        :return: nothing
+        """
+        self.batch.then_slots.release()
+        try:
+            self.batch.item_done.emit(self.item, future.result())
+        except Exception as e:
+            self.batch.item_failed.emit(self.item, f'{type(e).__name__}: {e}')
+        self.batch.finished_job.emit()
+
+
+class JobScheduler(QObject):
+    """
+    runs preview and save jobs off the GUI thread so the window keeps responding
+    at most one job per worker runs at a time, the rest wait in a queue where jobs with a
+    higher priority go first, so previews don't wait for a long export to finish
+    """
+    def __init__(self, executor: BatchExecutor, parent=None):
+        """
+        :param executor: does the actual work, usually on worker processes
+        :param parent: owner of the scheduler
+        """
+        super().__init__(parent)
+        self.executor = executor
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(executor.workers)
+        # batches with jobs that haven't ended yet
+        self.batches = []
+
+    def set_workers(self, workers: int):
+        """
+        changes the number of workers of the executor and how many jobs run at a time
+        returns straight away, queued and running jobs carry on and the new size applies to
+        the jobs that start from now on
+        :param workers: the new number of workers
+        :return: nothing
+        """
+        self.executor.set_workers(workers)
+        self.pool.setMaxThreadCount(workers)
+
+    def run(self, func, items: list, *args, priority: int = 0, then: tuple = None) -> JobBatch:
+        """
+        queues func(item, *args) for every item
+        :param func: module level function that does the work for one item
+        :param items: the items to process
+        :param args: extra arguments passed to every call
+        :param priority: jobs with a higher priority start first
+        :param then: (executor, func, args) to run func(item, result, *args) on another executor
+        once each job is done, e.g. to write the outputs on a pool of writer threads while the
+        next images are filtered
+        :return: the batch, connect to its signals to get the results
+        """
+        batch = JobBatch(self.executor, func, items, args, then)
+        batch.finished.connect(lambda: self.batches.remove(batch))
+        self.batches.append(batch)
+        for job in batch.jobs:
+            self.pool.start(job, priority)
+        if batch.total == 0:
+            # once the caller has connected to it
+            QTimer.singleShot(0, batch.finished.emit)
+        return batch
+
+    def cancel(self, batch: JobBatch):
+        """
+        takes the jobs of a batch that haven't started off the queue
+        jobs that are already running still finish and report their results
+        :param batch: the batch to cancel
+        :return: nothing
+        """
+        batch.cancelled = True
+        for job in batch.jobs:
+            if self.pool.tryTake(job):
+                batch.job_ended()
+
+    def shutdown(self):
+        """
+        drops every queued job, stops the executor and waits for running jobs
+        :return: nothing
+        """
+        for batch in list(self.batches):
+            self.cancel(batch)
+        self.executor.shutdown()
+        self.pool.waitForDone()
+
+
+class FolderExport(QThread):
+    """
+    filters and saves every image in a folder and its subdirectories in the background
+    images are streamed through the executor a few at a time, so memory stays the same
+    however many images the folder holds
+    the output folder can be one exported to before, images whose output its manifest has as
+    up to date are skipped
+    """
+    # emitted with the number of images saved so far and the path of the last one
+    progress = pyqtSignal(int, str)
+    # emitted with the error that stopped the export
+    failed = pyqtSignal(str)
+    # emitted with the path and the error of an image that couldn't be exported, the export goes on
+    image_failed = pyqtSignal(str, str)
+
+    def __init__(self, executor: BatchExecutor, writer: BatchExecutor, directory: str, pipeline: Pipeline,
+                 output_dir: str, encoder: EncoderSettings, parent=None):
+        """
+        :param executor: filters the images
+        :param writer: encodes and writes the outputs
+        :param directory: the folder to export
+        :param pipeline: the filters to apply
+        :param output_dir: folder the outputs are saved in, with the same subdirectories
+        :param encoder: how the outputs are encoded
+        :param parent: owner of the thread
+        """
+        super().__init__(parent)
+        self.executor = executor
+        self.writer = writer
+        self.directory = directory
+        self.pipeline = pipeline
+        self.output_dir = output_dir
+        self.encoder = encoder
+        # number of images skipped since their output was up to date, set once the export ends
+        self.skipped = 0
+        # number of images that couldn't be exported
+        self.errors = 0
+
+    def run(self):
+        """
+        runs the export, stops after the image being saved when requestInterruption is called
+        images whose output in the folder is up to date are skipped, images that can't be
+        exported are reported through image_failed and the others go on
+        :return: nothing
+        """
+        def failed(path, error):
+            self.errors += 1
+            self.image_failed.emit(path, f'{type(error).__name__}: {error}')
+
+        paths = walk_image_paths(self.directory, recursive=True, exclude=self.output_dir)
+        with ExportManifest(self.output_dir) as manifest:
+            results = run_batch(paths, self.pipeline, self.output_dir, source_dir=self.directory,
+                                executor=self.executor, manifest=manifest, encoder=self.encoder, writer=self.writer,
+                                failed=failed)
+            try:
+                for done, (path, output_path) in enumerate(results, 1):
+                    self.progress.emit(done, output_path)
+                    if self.isInterruptionRequested():
+                        break
+            except Exception as e:
+                self.failed.emit(f'{type(e).__name__}: {e}')
+            finally:
+                results.close()
+                self.skipped = manifest.skipped
@@ -9,68 +9,149 @@ from PyQt6.QtWidgets import (
     QAbstractItemView,
     QLabel
 )
+from PyQt6.QtCore import QPoint, QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap, QIcon
+from PIL import Image
+from PIL.ImageQt import ImageQt
+from image_filtering.thumbnail_cache import ThumbnailCache
 import os
+import sqlite3
+import threading
+import time
 
 
-# file formats supported by pillow library
-SUPPORTED_FORMATS = (
-    '.blp',
-    '.bmp',
-    '.dds',
-    '.dib',
-    '.eps',
-    '.icns',
-    '.ico',
-    '.im',
-    '.jpeg',
-    '.jfif',
-    '.msp',
-    '.pcx',
-    '.png',
-    'jpg',
-    '.ppm',
-    '.sgi',
-    '.spider',
-    '.tga',
-    '.tiff',
-    '.webp',
-    '.xbm',
-    '.cur',
-    '.dcx',
-    '.fits',
-    '.fli',
-    '.flc',
-    '.fpx',
-    '.ftex',
-    '.gbr',
-    '.gd',
-    '.imt',
-    '.iptc',
-    '.naa',
-    '.mcidas',
-    '.mic',
-    '.mpo',
-    '.pcd',
-    '.pixar',
-    '.psd',
-    '.wal',
-    '.wmf',
-    '.xpm'
-)
+def iter_images_dir(path: str):
+    """
+    goes through the image names in the passed in path without listing the whole folder first
+    :param path: the folder to look in
+    :return: generator of file names ending in one of the `SUPPORTED_FORMATS`
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # uses SUPPORTED_FORMATS from constants.py
+            if entry.name.endswith(SUPPORTED_FORMATS) and entry.is_file():
+                yield entry.name
+
+
+class FolderScanner(QThread):
+    """
+    lists the images of a folder in the background and hands them over in batches,
+    so a slow folder, like one on a network share, doesn't freeze the app
+    """
+    # emitted with the folder and a list of image names in it
+    found = pyqtSignal(str, list)
+
+    def __init__(self, directory: str, parent=None):
+        """
+        :param directory: the folder to list
+        :param parent: owner of the thread, keeps it alive until it is deleted
+        """
+        super().__init__(parent)
+        self.directory = directory
+
+    def run(self):
+        """
+        lists the folder, stops early when requestInterruption is called
+        :return: nothing
+        """
+        batch = []
+        last_emit = time.monotonic()
+        try:
+            for name in iter_images_dir(self.directory):
+                if self.isInterruptionRequested():
+                    return
+                batch.append(name)
+                # send full batches, and whatever was found so far if the folder is slow
+                if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_emit > SCAN_BATCH_INTERVAL:
+                    self.found.emit(self.directory, batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        except OSError:
+            # the folder went away or can't be read, keep what was found
+            pass
+        if len(batch) > 0 and not self.isInterruptionRequested():
+            self.found.emit(self.directory, batch)
 
 
-def get_images_dir(path: str) -> list:
+class IconLoader(QThread):
     """
-    gets all image names from the passed in path
+    makes the thumbnails used as icons in the background
+    only the most recent request is worked on, so scrolling past rows skips their icons
     """
-    files = os.listdir(path)
-    images = []
-    for file in files:
-        # uses SUPPORTED_FORMATS from constants.py
-        if file.endswith(SUPPORTED_FORMATS):
-            images.append(file)
-    return images
+    # emitted with the path of the image and its thumbnail, or None if it can't be read
+    loaded = pyqtSignal(str, object)
+
+    def __init__(self, parent=None):
+        """
+        :param parent: owner of the thread
+        """
+        super().__init__(parent)
+        self._pending = []
+        self._stopping = False
+        self._condition = threading.Condition()
+
+    def request(self, paths: list):
+        """
+        replaces the images waiting for a thumbnail
+        :param paths: paths of the images, loaded in this order
+        :return: nothing
+        """
+        with self._condition:
+            self._pending = list(paths)
+            self._condition.notify()
+
+    def stop(self):
+        """
+        stops the thread once the current thumbnail is done and waits for it
+        :return: nothing
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.wait()
+
+    def _next_path(self):
+        """
+        waits for a path to load
+        :return: the path, None once the thread is stopping
+        """
+        with self._condition:
+            while len(self._pending) == 0 and not self._stopping:
+                self._condition.wait()
+            if self._stopping:
+                return None
+            return self._pending.pop(0)
+
+    def run(self):
+        """
+        loads thumbnails until stop is called
+        the cache is opened here since an sqlite connection can only be used by its own thread
+        :return: nothing
+        """
+        thumbnails = ThumbnailCache()
+        try:
+            path = self._next_path()
+            while path is not None:
+                try:
+                    thumbnail = thumbnails.thumbnail(path, MENU_ICON_SIZE).convert('RGBA')
+                except (OSError, sqlite3.Error, Image.DecompressionBombError):
+                    # a bad image or a locked cache only costs this icon, not the ones after it
+                    thumbnail = None
+                self.loaded.emit(path, thumbnail)
+                with self._condition:
+                    idle = len(self._pending) == 0
+                if idle:
+                    # save the new thumbnails while there is nothing else to do
+                    try:
+                        thumbnails.commit()
+                    except sqlite3.Error:
+                        pass
+                path = self._next_path()
+        finally:
+            try:
+                thumbnails.close()
+            except sqlite3.Error:
+                pass
 
 
 class SidePanel(QWidget):
@@ -92,6 +173,18 @@ class SidePanel(QWidget):
         self.menu = QListWidget()
         self.menu.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
         layout.addWidget(self.menu)
+        self.menu.verticalScrollBar().valueChanged.connect(self.request_visible_icons)
+
+        # lists the selected folder, replaced whenever another folder is selected
+        self.scanner = None
+        # path of every image in the menu to its row
+        self.items = dict()
+        # paths of the images that can't be read, so their icons aren't requested again
+        self.no_icon = set()
+        self.icon_loader = IconLoader(self)
+        self.icon_loader.loaded.connect(self.icon_loaded)
+        self.icon_loader.start()
+
         self.selected_dir = DEFAULT_FOLDER
         self.update_menu()
 
@@ -116,18 +209,98 @@ class SidePanel(QWidget):
         """
         updates the menu with the files in the current selected directory
         only shows files ending in one of the `SUPPORTED_FORMATS`
+        the folder is listed in the background and the files are added as they are found,
+        a folder that is still being listed when another one is selected is abandoned
         :return: nothing
         """
         if len(self.selected_dir) > 0:
+            if self.scanner is not None:
+                self.scanner.requestInterruption()
             self.menu.clear()
-            files = get_images_dir(self.selected_dir)
-            for file in files:
-                item = QListWidgetItem()
-                item.setText(file)
+            self.items.clear()
+            self.icon_loader.request([])
+
+            self.scanner = FolderScanner(self.selected_dir, self)
+            self.scanner.found.connect(self.add_files)
+            self.scanner.finished.connect(self.scan_finished)
+            self.scanner.start()
+
+    def add_files(self, directory: str, files: list):
+        """
+        adds a batch of files found by the scanner to the menu
+        :param directory: the folder the files are in
+        :param files: names of the files
+        :return: nothing
+        """
+        if self.sender() is not self.scanner:
+            # left over from a folder that is no longer selected
+            return
+        for file in files:
+            item = QListWidgetItem()
+            item.setText(file)
+            self.menu.addItem(item)
+            self.items[directory + '\\' + file] = item
+        self.request_visible_icons()
+
+    def scan_finished(self):
+        """
+        deletes a scanner once it is done
+        :return: nothing
+        """
+        scanner = self.sender()
+        if scanner is self.scanner:
+            self.scanner = None
+        scanner.deleteLater()
+
+    def request_visible_icons(self):
+        """
+        asks for the icons of the rows that are visible, and a few after them, that don't have one
+        :return: nothing
+        """
+        count = self.menu.count()
+        if count == 0:
+            return
+        first = self.menu.indexAt(QPoint(0, 0)).row()
+        last = self.menu.indexAt(QPoint(0, self.menu.viewport().height() - 1)).row()
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = count - 1
+        paths = []
+        for row in range(first, min(last + 1 + ICON_PRELOAD_ROWS, count)):
+            path = self.selected_dir + '\\' + self.menu.item(row).text()
+            if self.menu.item(row).icon().isNull() and path not in self.no_icon:
+                paths.append(path)
+        self.icon_loader.request(paths)
+
+    def icon_loaded(self, path: str, thumbnail):
+        """
+        sets the icon of a row once its thumbnail is made
+        :param path: path of the image
+        :param thumbnail: RGBA thumbnail, None if pillow can't read the image
+        :return: nothing
+        """
+        item = self.items.get(path)
+        if item is None:
+            return
+        if thumbnail is None:
+            self.no_icon.add(path)
+            return
+        item.setIcon(QIcon(QPixmap.fromImage(ImageQt(thumbnail))))
 
-                # add icon
-                pixmap = QPixmap(self.selected_dir + '\\' + file)
-                icon = QIcon(pixmap)
-                item.setIcon(icon)
+    def resizeEvent(self, event):
+        """
+        loads the icons of rows that become visible when the panel gets taller
+        """
+        self.request_visible_icons()
+        return super().resizeEvent(event)
 
-                self.menu.addItem(item)
+    def stop(self):
+        """
+        stops the background threads, called when the app closes
+        :return: nothing
+        """
+        if self.scanner is not None:
+            self.scanner.requestInterruption()
+            self.scanner.wait()
+        self.icon_loader.stop()
@@ -26,9 +26,81 @@ FILTER_PANEL_WIDTH = 400
 # scale that images show in the image viewer
 IMAGE_VIEW_SCALE = 0.9
 IMAGE_VIEWER_MIN_WIDTH = 200
+# pixel modes the image viewer can show as they are, others are converted when shown
+DISPLAY_MODES = ('1', 'L', 'P', 'RGB', 'RGBA')
+# each image shown keeps copies of itself at half, a quarter... of its size, down to this size
+MIPMAP_MIN_SIZE = 64
+# milliseconds to wait after the image viewer stops being resized before rescaling the image
+# smoothly, while it is being resized a quick rescale of the nearest copy is shown
+RESIZE_SMOOTH_DELAY = 150
+# images on either side of the shown one that keep their previews, the rest are only listed
+VIEWER_NEARBY = 2
+# height of the strip listing the opened images in the image viewer
+IMAGE_LIST_HEIGHT = 32
+# size in pixels of the thumbnails used as icons in the side panel
+MENU_ICON_SIZE = 64
+# rows below the visible part of the side panel whose icons are loaded ahead of scrolling
+ICON_PRELOAD_ROWS = 10
+# the side panel gets the files of a folder in batches of this many,
+# or whatever was found after this many seconds on slow folders
+SCAN_BATCH_SIZE = 100
+SCAN_BATCH_INTERVAL = 0.1
+# milliseconds to wait after the last filter change before updating live previews
+LIVE_PREVIEW_DELAY = 150
+# jobs with a higher priority start first, so previews don't wait for saves
+PREVIEW_JOB_PRIORITY = 1
+SAVE_JOB_PRIORITY = 0
+# most missing images named in the warning when saving, the rest are only counted
+MISSING_LISTED = 10
 
 DEFAULT_FOLDER = 'C:\\Users\\tonyc\\PycharmProjects\\Image\\testing_images'
 
+# file formats supported by pillow library
+SUPPORTED_FORMATS = (
+    '.blp',
+    '.bmp',
+    '.dds',
+    '.dib',
+    '.eps',
+    '.icns',
+    '.ico',
+    '.im',
+    '.jpeg',
+    '.jfif',
+    '.msp',
+    '.pcx',
+    '.png',
+    'jpg',
+    '.ppm',
+    '.sgi',
+    '.spider',
+    '.tga',
+    '.tiff',
+    '.webp',
+    '.xbm',
+    '.cur',
+    '.dcx',
+    '.fits',
+    '.fli',
+    '.flc',
+    '.fpx',
+    '.ftex',
+    '.gbr',
+    '.gd',
+    '.imt',
+    '.iptc',
+    '.naa',
+    '.mcidas',
+    '.mic',
+    '.mpo',
+    '.pcd',
+    '.pixar',
+    '.psd',
+    '.wal',
+    '.wmf',
+    '.xpm'
+)
+
 # stylesheets TODO change stylesheet
 STYLESHEET = '''
 '''
@@ -0,0 +1,346 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+from PIL import Image
+
+from constants import SUPPORTED_FORMATS
+from image_filtering.encoders import EncoderSettings, DEFAULT_WRITERS, write_image
+from image_filtering.executor import BatchExecutor, DEFAULT_WORKERS, in_worker_process
+from image_filtering.lossless import save_lossless
+from image_filtering.manifest import ExportManifest
+from image_filtering.mapped import open_mapped, array_image
+from image_filtering.numpy_backend import get_backend, MODES
+from image_filtering.pipeline import Pipeline
+from image_filtering.planner import plan_pipeline, lower
+from image_filtering.profiling import stage
+from image_filtering.proxy import open_scaled, scale_pipeline
+from image_filtering.tiled import run_tiled, run_bands, TILED_MIN_PIXELS
+
+
+# images handed to each worker at once by run_batch, enough to keep them busy without
+# holding many decoded images
+PENDING_PER_WORKER = 2
+
+
+def get_image_paths(directory: str) -> list:
+    """
+    gets the paths of all images in the passed in directory
+    :param directory: directory to look in
+    :return: sorted list of paths ending in one of the `SUPPORTED_FORMATS`
+    """
+    paths = []
+    for file in sorted(os.listdir(directory)):
+        if file.endswith(SUPPORTED_FORMATS):
+            paths.append(os.path.join(directory, file))
+    return paths
+
+
+def walk_image_paths(directory: str, recursive: bool = False, exclude: str = None):
+    """
+    goes through the paths of the images in a directory without listing it all first,
+    so folders with any number of images can be streamed
+    :param directory: directory to look in
+    :param recursive: also look in every subdirectory
+    :param exclude: directory to skip, e.g. the output folder when it is inside directory
+    :return: generator of paths ending in one of the `SUPPORTED_FORMATS`, in the order the
+    file system lists them
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # symlinked folders aren't followed, they could loop back
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and not (exclude is not None and os.path.samefile(entry.path, exclude)):
+                    yield from walk_image_paths(entry.path, recursive, exclude)
+            elif entry.name.endswith(SUPPORTED_FORMATS):
+                yield entry.path
+
+
+def make_output_folder(directory: str) -> str:
+    """
+    gets the folder called "output" inside directory, creating it if needed
+    the same folder is used every time, its manifest decides which outputs have to be made again
+    :param directory: directory to create the folder in
+    :return: path to the folder
+    """
+    path_to_folder = os.path.join(directory, 'output')
+    os.makedirs(path_to_folder, exist_ok=True)
+    return path_to_folder
+
+
+def get_output_path(path: str, output_dir: str, source_dir: str = None,
+                    encoder: EncoderSettings = EncoderSettings()) -> str:
+    """
+    gets the path a filtered image is saved to
+    :param path: path of the source image
+    :param output_dir: folder the output is saved in
+    :param source_dir: folder the source images were found in, images in subdirectories of
+    it are saved in the same subdirectories of output_dir, None saves every image in output_dir
+    :param encoder: how the output is encoded, decides its extension, png by default
+    :return: path of the output image
+    """
+    filename = os.path.basename(path)
+    if source_dir is not None:
+        output_dir = os.path.join(output_dir, os.path.relpath(os.path.dirname(path), source_dir))
+    return os.path.normpath(os.path.join(output_dir, filename[:filename.index('.')] + encoder.extension(path)))
+
+
+def output_settings(pipeline: Pipeline, encoder: EncoderSettings) -> str:
+    """
+    gets the key of everything that decides the outputs, for the manifest of the output folder
+    :param pipeline: the filters applied
+    :param encoder: how the outputs are encoded
+    :return: the key
+    """
+    return pipeline.key() + ':' + encoder.key()
+
+
+def run_pipeline(im: Image.Image, pipeline: Pipeline, optimize: bool = True, backend: str = 'pil',
+                 tile_workers: int = None) -> Image.Image:
+    """
+    applies the pipeline to an image that is already loaded
+    :param im: the image to be filtered
+    :param pipeline: the filters to apply
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend,
+    'tiled' to run the PIL filters tile by tile, which pil also does for images with more
+    than TILED_MIN_PIXELS pixels
+    :param tile_workers: number of threads filtering tiles, None for one in a worker process
+    of a pool, whose other workers already use the cpus, and DEFAULT_WORKERS otherwise
+    :return: the filtered image
+    """
+    if optimize:
+        pipeline = plan_pipeline(pipeline, im.size, im.mode).pipeline
+    if backend == 'numpy':
+        return get_backend().apply(pipeline, im)
+    if backend == 'tiled' or im.width * im.height > TILED_MIN_PIXELS:
+        if tile_workers is None:
+            tile_workers = 1 if in_worker_process() else DEFAULT_WORKERS
+        return run_tiled(im, pipeline, workers=tile_workers)
+    return pipeline.apply(im)
+
+
+def run_mapped(arr: np.ndarray, pipeline: Pipeline, optimize: bool = True) -> np.ndarray:
+    """
+    applies the pipeline to an image mapped from its file by open_mapped, band by band
+    with the numpy backend so the image is never read into memory all at once
+    :param arr: (height, width, channels) uint8 array
+    :param pipeline: the filters to apply
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :return: the filtered array
+    """
+    size = arr.shape[1], arr.shape[0]
+    if optimize:
+        pipeline = plan_pipeline(pipeline, size, MODES[arr.shape[2]]).pipeline
+    else:
+        # still split rotations and greyscale into conversions and transposes, which give
+        # the same pixels and can be run band by band or as views
+        pipeline = Pipeline(tuple(lower(pipeline, size)))
+    return run_bands(arr, pipeline)
+
+
+def filter_file(path: str, pipeline: Pipeline, optimize: bool = True, backend: str = 'pil') -> Image.Image:
+    """
+    opens an image and applies the pipeline to it
+    large uncompressed images are mapped from their file instead, see run_mapped
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend
+    :return: the filtered image
+    """
+    arr = open_mapped(path)
+    if arr is not None:
+        return array_image(run_mapped(arr, pipeline, optimize))
+    with Image.open(path) as im:
+        with stage('decode', path=path) as timed:
+            im.load()
+            timed.image(im)
+        return run_pipeline(im, pipeline, optimize, backend)
+
+
+def filter_checkpoints(job: tuple, pipeline: Pipeline, optimize: bool = True, backend: str = 'pil') -> list:
+    """
+    applies the pipeline to an image, carrying on from an earlier result if there is one,
+    and keeps the result after some of the filters so they can be cached
+    :param job: (path, scale, done, im, stops) where im is the result of the first done filters,
+    or None to open the image at path, scale is the size to filter the image at relative to
+    the source, less than 1 for previews, and stops are the numbers of filters after which
+    the result is kept, in increasing order and ending with len(pipeline)
+    :param pipeline: the filters to apply
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend
+    :return: list of (number of filters applied, image) tuples, one per stop
+    """
+    path, scale, done, im, stops = job
+    arr = open_mapped(path) if im is None and scale >= 1 else None
+    if arr is not None:
+        results = []
+        for stop in stops:
+            if stop > done:
+                arr = run_mapped(arr, pipeline[done:stop], optimize)
+                done = stop
+            results.append((stop, array_image(arr)))
+        return results
+    if im is None:
+        im = open_scaled(path, scale)
+    pipeline = scale_pipeline(pipeline, scale)
+    results = []
+    for stop in stops:
+        if stop > done:
+            im = run_pipeline(im, pipeline[done:stop], optimize, backend)
+            done = stop
+        results.append((stop, im))
+    return results
+
+
+def export_file(path: str, pipeline: Pipeline, output_dir: str, optimize: bool = True, backend: str = 'pil',
+                source_dir: str = None, encoder: EncoderSettings = EncoderSettings()) -> tuple:
+    """
+    gets an image ready to be saved, jpegs that are only flipped or rotated by right angles
+    are saved right away with a lossless transform instead, see save_lossless
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :param output_dir: folder the output is saved in
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend
+    :param source_dir: keep the layout of subdirectories under this folder, see get_output_path
+    :param encoder: how the output is encoded
+    :return: (output path, filtered image) where the image is None if it was already saved
+    """
+    output_path = get_output_path(path, output_dir, source_dir, encoder)
+    if source_dir is not None:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if save_lossless(path, pipeline, output_path, encoder):
+        return output_path, None
+    return output_path, filter_file(path, pipeline, optimize, backend)
+
+
+def export_checkpoints(job: tuple, pipeline: Pipeline, output_dir: str, encoder: EncoderSettings = EncoderSettings(),
+                       optimize: bool = True, backend: str = 'pil') -> list:
+    """
+    filters an image for save_checkpoint, jpegs that are only flipped or rotated by right
+    angles are saved right away with a lossless transform instead, without being decoded or
+    filtered, see save_lossless
+    :param job: (path, scale, done, im, stops) like for filter_checkpoints
+    :param pipeline: the filters to apply
+    :param output_dir: folder the output is saved in
+    :param encoder: how the output is encoded
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend
+    :return: what filter_checkpoints returns, an empty list if the image was already saved
+    """
+    if save_lossless(job[0], pipeline, get_output_path(job[0], output_dir, encoder=encoder), encoder):
+        return []
+    return filter_checkpoints(job, pipeline, optimize, backend)
+
+
+def save_checkpoint(job: tuple, results: list, output_dir: str, encoder: EncoderSettings = EncoderSettings()) -> str:
+    """
+    saves the last result of filter_checkpoints or export_checkpoints for a job
+    :param job: the job that was filtered
+    :param results: what was returned for it, empty if export_checkpoints already saved it
+    :param output_dir: folder the output is saved in
+    :param encoder: how the output is encoded
+    :return: path of the saved image
+    """
+    output_path = get_output_path(job[0], output_dir, encoder=encoder)
+    if len(results) == 0:
+        return output_path
+    return write_image(results[-1][1], output_path, encoder)
+
+
+def run_batch(paths, pipeline: Pipeline, output_dir: str, workers: int = 1, optimize: bool = True,
+              backend: str = 'pil', source_dir: str = None, executor: BatchExecutor = None,
+              manifest: ExportManifest = None, force: bool = False, encoder: EncoderSettings = EncoderSettings(),
+              writer: BatchExecutor = None, failed=None):
+    """
+    filters and saves every image in paths
+    paths are taken as workers become free and only a few images are in flight at once,
+    so memory stays the same however many images there are
+    filtered images are encoded and written by a separate pool of writer threads, so the
+    workers go on to the next images while the outputs are compressed and written to disk
+    results are yielded as soon as each image is saved, not in input order
+    :param paths: paths of the source images, e.g. a generator from walk_image_paths
+    :param pipeline: the filters to apply
+    :param output_dir: folder the outputs are saved in
+    :param workers: number of worker processes, 1 runs everything in this process
+    :param optimize: run the plan from plan_pipeline instead of the filters as listed
+    :param backend: 'pil' to run each filter with PIL, 'numpy' to use the numpy backend
+    :param source_dir: keep the layout of subdirectories under this folder, see get_output_path
+    :param executor: executor to run on instead of a new one with workers workers
+    :param manifest: manifest of output_dir, images whose output is up to date are skipped
+    and every saved image is recorded in it
+    :param force: don't skip any image, they are still recorded in the manifest
+    :param encoder: how the outputs are encoded
+    :param writer: thread executor that encodes and writes the outputs instead of a new one
+    with DEFAULT_WRITERS threads
+    :param failed: called with the path and the error of each image that couldn't be filtered
+    or saved, e.g. a corrupt file, the batch goes on without it and it isn't recorded in the
+    manifest, None stops the batch with the first error
+    :return: generator of (source path, output path) tuples, skipped and failed images are left out
+    """
+    if executor is None:
+        with BatchExecutor(workers) as executor:
+            yield from run_batch(paths, pipeline, output_dir, workers, optimize, backend, source_dir, executor,
+                                 manifest, force, encoder, writer, failed)
+        return
+    if writer is None:
+        with BatchExecutor(DEFAULT_WRITERS, use_threads=True) as writer:
+            yield from run_batch(paths, pipeline, output_dir, workers, optimize, backend, source_dir, executor,
+                                 manifest, force, encoder, writer, failed)
+        return
+
+    settings = output_settings(pipeline, encoder)
+
+    def report(path: str, error: Exception):
+        if failed is None:
+            raise error
+        failed(path, error)
+
+    def outdated(paths):
+        # a source can be deleted between being listed and being checked
+        for path in paths:
+            try:
+                current = manifest.is_current(path, settings)
+            except OSError as e:
+                report(path, e)
+                continue
+            if not current:
+                yield path
+
+    if manifest is not None and not force:
+        paths = outdated(paths)
+    filtered = executor.map_unordered(export_file, paths, pipeline, output_dir, optimize, backend, source_dir, encoder,
+                                      max_pending=executor.workers * PENDING_PER_WORKER, failed=failed)
+    # filtered images waiting to be written, they hold memory so only a few are let in
+    writes = dict()
+    max_writes = writer.workers * PENDING_PER_WORKER
+
+    def saved(path: str, output_path: str):
+        if manifest is not None:
+            # or deleted while it was being filtered
+            try:
+                manifest.record(path, output_path, settings)
+            except OSError as e:
+                report(path, e)
+                return
+        yield path, output_path
+
+    def written(finished: set):
+        for future in finished:
+            path = writes.pop(future)
+            if future.exception() is None:
+                yield from saved(path, future.result())
+            else:
+                report(path, future.exception())
+
+    for path, (output_path, im) in filtered:
+        if im is None:
+            # saved by the worker with a lossless transform
+            yield from saved(path, output_path)
+            continue
+        writes[writer.submit(write_image, im, output_path, encoder)] = path
+        if len(writes) >= max_writes:
+            yield from written(wait(writes, return_when=FIRST_COMPLETED).done)
+    yield from written(wait(writes).done)
@@ -0,0 +1,299 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from image_filtering.batch import get_image_paths, run_batch, run_pipeline
+from image_filtering.executor import BatchExecutor, DEFAULT_WORKERS
+from image_filtering.pipeline import *
+
+
+# version of the results files, changed when the numbers in them stop being comparable
+RESULTS_VERSION = 1
+# every filter on its own, rotate twice because right angles and other angles take different paths
+FILTER_CASES = {
+    'scan': Pipeline((ScanSpec(200),)),
+    'rotate_90': Pipeline((RotateSpec(90),)),
+    'rotate_15': Pipeline((RotateSpec(15),)),
+    'flip': Pipeline((FlipSpec(True),)),
+    'crop': Pipeline((CropSpec(10, 10, 10, 10),)),
+    'sharpen': Pipeline((SharpenSpec(),)),
+    'blur': Pipeline((BlurSpec(3),)),
+    'smooth': Pipeline((SmoothSpec(5),)),
+    'emboss': Pipeline((EmbossSpec(),)),
+    'greyscale': Pipeline((GreyscaleSpec(),))
+}
+# pipelines like the ones people build in the filter panel
+PIPELINE_CASES = {
+    'document': Pipeline((CropSpec(5, 5, 5, 5), RotateSpec(-90), ScanSpec(180), SharpenSpec())),
+    'photo': Pipeline((CropSpec(10, 0, 10, 0), SharpenSpec(), SmoothSpec(3), FlipSpec(True))),
+    'everything': Pipeline((
+        ScanSpec(200), RotateSpec(15), FlipSpec(False), CropSpec(5, 5, 5, 5), SharpenSpec(),
+        BlurSpec(2), SmoothSpec(4), EmbossSpec(), GreyscaleSpec()
+    ))
+}
+# ways of running the pipelines, (backend, optimize) for run_pipeline
+PIPELINE_VARIANTS = {
+    'listed': ('pil', False),
+    'planned': ('pil', True),
+    'numpy': ('numpy', True)
+}
+# pipeline timed at each worker count by the batch benchmark
+BATCH_CASE = 'photo'
+# (width, height) of the synthetic images
+SIZES = {
+    'small': (640, 480),
+    'medium': (1920, 1080),
+    'large': (4000, 3000)
+}
+MODES = ('L', 'RGB', 'RGBA')
+# parts of the suite that can be run
+SUITES = ('filters', 'pipelines', 'batch')
+
+
+def synthetic_image(size: tuple, mode: str, seed: int = 0) -> Image.Image:
+    """
+    makes a test image with a gradient for flat areas and noise for edges, the same seed
+    always gives the same pixels so runs can be compared
+    :param size: (width, height)
+    :param mode: L, RGB or RGBA, alpha is solid
+    :param seed: seed of the noise
+    :return: the image
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    gradient = (np.arange(width)[np.newaxis, :] * 96 // width + np.arange(height)[:, np.newaxis] * 96 // height)
+    arr = rng.integers(0, 64, (height, width, len(mode)), dtype=np.uint8)
+    arr += gradient.astype(np.uint8)[:, :, np.newaxis]
+    if mode == 'RGBA':
+        arr[:, :, 3] = 255
+    return Image.fromarray(arr[:, :, 0] if mode == 'L' else arr, mode)
+
+
+def time_runs(func, repeat: int) -> list:
+    """
+    :param func: function to time, called without arguments
+    :param repeat: number of runs
+    :return: seconds each run took
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def make_result(group: str, case: str, variant: str, image: str, megapixels: float, times: list) -> dict:
+    """
+    :param group: part of the suite, one of SUITES
+    :param case: name of the filter or pipeline
+    :param variant: how it was run, e.g. the backend or number of workers
+    :param image: what it was run on
+    :param megapixels: megapixels filtered in each run
+    :param times: seconds each run took
+    :return: one entry of the results, the fastest run is the one compared
+    """
+    best = min(times)
+    return {
+        'key': '/'.join((group, case, variant, image)),
+        'megapixels': megapixels,
+        'best_seconds': best,
+        'median_seconds': statistics.median(times),
+        'megapixels_per_second': megapixels / best if best > 0 else 0,
+        'runs': len(times)
+    }
+
+
+def load_images(directory: str) -> list:
+    """
+    loads the images of a directory into memory so decoding isn't timed
+    :param directory: the directory, e.g. testing_images
+    :return: list of images
+    """
+    images = []
+    for path in get_image_paths(directory):
+        with Image.open(path) as im:
+            im.load()
+            images.append(im.copy())
+    return images
+
+
+def image_sets(sizes, modes, directory: str = None) -> dict:
+    """
+    gets the images the filters and pipelines are run on
+    :param sizes: names from SIZES
+    :param modes: modes from MODES
+    :param directory: directory of real images to add as one set, None for only synthetic ones
+    :return: dict of set name to list of images
+    """
+    sets = dict()
+    for size in sizes:
+        for mode in modes:
+            width, height = SIZES[size]
+            sets[f'synthetic-{width}x{height}-{mode}'] = [synthetic_image(SIZES[size], mode)]
+    if directory is not None and os.path.isdir(directory):
+        images = load_images(directory)
+        if len(images) > 0:
+            sets[os.path.basename(os.path.normpath(directory))] = images
+    return sets
+
+
+def bench_filters(sets: dict, repeat: int) -> list:
+    """
+    times every filter of FILTER_CASES on its own with the PIL functions
+    :param sets: images from image_sets
+    :param repeat: runs of each, the fastest is kept
+    :return: list of results
+    """
+    results = []
+    for name, images in sets.items():
+        megapixels = sum(im.width * im.height for im in images) / 1e6
+        for case, pipeline in FILTER_CASES.items():
+            times = time_runs(lambda: [pipeline.apply(im) for im in images], repeat)
+            results.append(make_result('filters', case, 'pil', name, megapixels, times))
+    return results
+
+
+def bench_pipelines(sets: dict, repeat: int) -> list:
+    """
+    times every pipeline of PIPELINE_CASES in each of PIPELINE_VARIANTS
+    :param sets: images from image_sets
+    :param repeat: runs of each, the fastest is kept
+    :return: list of results
+    """
+    results = []
+    for name, images in sets.items():
+        megapixels = sum(im.width * im.height for im in images) / 1e6
+        for case, pipeline in PIPELINE_CASES.items():
+            for variant, (backend, optimize) in PIPELINE_VARIANTS.items():
+                times = time_runs(lambda: [run_pipeline(im, pipeline, optimize, backend) for im in images], repeat)
+                results.append(make_result('pipelines', case, variant, name, megapixels, times))
+    return results
+
+
+def bench_batch(directory: str, worker_counts, repeat: int = 1) -> list:
+    """
+    times run_batch on a directory, decoding, filtering, encoding and writing included, with
+    a fresh pool for each number of workers so starting it is timed as well
+    :param directory: directory of images
+    :param worker_counts: numbers of worker processes to try
+    :param repeat: runs of each, the fastest is kept
+    :return: list of results
+    """
+    paths = get_image_paths(directory)
+    megapixels = 0
+    for path in paths:
+        with Image.open(path) as im:
+            megapixels += im.width * im.height / 1e6
+    name = os.path.basename(os.path.normpath(directory))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='mass_image_editor_bench_') as output_dir:
+        for workers in worker_counts:
+            def run():
+                with BatchExecutor(workers) as executor:
+                    for _ in run_batch(paths, PIPELINE_CASES[BATCH_CASE], output_dir, workers, executor=executor):
+                        pass
+            times = time_runs(run, repeat)
+            results.append(make_result('batch', BATCH_CASE, f'{workers}-workers', name, megapixels, times))
+    return results
+
+
+def environment() -> dict:
+    """
+    :return: what the results were measured on, they are only comparable on the same machine
+    """
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': DEFAULT_WORKERS
+    }
+
+
+def run_benchmarks(suites=SUITES, sizes=tuple(SIZES), modes=MODES, directory: str = None, repeat: int = 3,
+                   worker_counts=None, progress=None) -> dict:
+    """
+    runs the benchmark suite
+    :param suites: parts to run, from SUITES
+    :param sizes: sizes of the synthetic images, names from SIZES
+    :param modes: modes of the synthetic images
+    :param directory: directory of real images, also used for the batch benchmark, which is
+    skipped without one
+    :param repeat: runs of each filter and pipeline, the fastest is kept
+    :param worker_counts: numbers of workers for the batch benchmark, defaults to 1, 2 and
+    the number of cpus
+    :param progress: called with each result as it is measured
+    :return: the results, ready to be saved with save_results
+    """
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, DEFAULT_WORKERS})
+    sets = image_sets(sizes, modes, directory) if 'filters' in suites or 'pipelines' in suites else dict()
+    runs = []
+    if 'filters' in suites:
+        runs.append(lambda: bench_filters(sets, repeat))
+    if 'pipelines' in suites:
+        runs.append(lambda: bench_pipelines(sets, repeat))
+    if 'batch' in suites and directory is not None and os.path.isdir(directory):
+        runs.append(lambda: bench_batch(directory, worker_counts))
+
+    results = []
+    for run in runs:
+        for result in run():
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def save_results(results: dict, path: str):
+    """
+    :param results: results from run_benchmarks
+    :param path: json file to write
+    :return: nothing
+    """
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(path: str) -> dict:
+    """
+    :param path: json file written by save_results
+    :return: the results
+    """
+    with open(path) as file:
+        results = json.load(file)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f'{path} has results version {results.get("version")}, expected {RESULTS_VERSION}')
+    return results
+
+
+def compare_results(old: dict, new: dict) -> list:
+    """
+    compares the fastest times of two runs, entries only in one of them are left out
+    :param old: results of the earlier run
+    :param new: results of the later run
+    :return: list of (key, old seconds, new seconds, change) tuples in the order of new,
+    change is the fraction the time went up by, e.g. 0.1 for 10% slower, -0.5 for twice as fast
+    """
+    old_times = {result['key']: result['best_seconds'] for result in old['results']}
+    changes = []
+    for result in new['results']:
+        before = old_times.get(result['key'])
+        if before is not None and before > 0:
+            changes.append((result['key'], before, result['best_seconds'], result['best_seconds'] / before - 1))
+    return changes
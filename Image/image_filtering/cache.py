@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_filtering.pipeline import Pipeline
+from image_filtering.proxy import preview_scale
+
+
+# memory the cached images may use before the least recently used ones are dropped
+DEFAULT_CACHE_BUDGET = 512 * 1024 * 1024
+
+
+def source_identity(path: str) -> tuple:
+    """
+    gets what identifies the contents of a source file without reading it
+    a file that is edited or replaced gets a new identity, so old results are never reused
+    :param path: path of the source image
+    :return: (absolute path, modification time in ns, size in bytes)
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def image_bytes(im: Image.Image) -> int:
+    """
+    estimates the memory used by the pixels of an image
+    :param im: the image
+    :return: number of bytes
+    """
+    return im.width * im.height * len(im.getbands())
+
+
+def checkpoint_stops(length: int, done: int) -> tuple:
+    """
+    gets the numbers of filters after which the result of a pipeline is kept in the cache
+    the result after every filter is kept, so changing the settings of one filter only runs
+    that filter and the ones after it again
+    :param length: number of filters in the pipeline
+    :param done: number of filters already applied
+    :return: stops for filter_checkpoints
+    """
+    return tuple(range(done + 1, length + 1)) or (length,)
+
+
+class ResultCache:
+    """
+    keeps filtered images in memory keyed on (source identity, pipeline prefix)
+    a pipeline prefix is the first few filters of a pipeline, so pipelines that start the same
+    way share the results of the filters they have in common
+    when the images use more than the budget, the least recently used ones are dropped
+    the cached images are shared, callers must not modify them
+    """
+    def __init__(self, budget: int = DEFAULT_CACHE_BUDGET):
+        """
+        :param budget: bytes the cached images may use
+        """
+        self.budget = budget
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, source: tuple, pipeline: Pipeline):
+        """
+        gets the result of a pipeline and marks it as recently used
+        :param source: identity of the source image from source_identity
+        :param pipeline: the filters that were applied
+        :return: the filtered image, None if it isn't cached
+        """
+        key = (source, pipeline.key())
+        im = self._entries.get(key)
+        if im is not None:
+            self._entries.move_to_end(key)
+        return im
+
+    def put(self, source: tuple, pipeline: Pipeline, im: Image.Image):
+        """
+        adds the result of a pipeline, then drops old results until the budget is met
+        :param source: identity of the source image from source_identity
+        :param pipeline: the filters that were applied
+        :param im: the filtered image
+        :return: nothing
+        """
+        size = image_bytes(im)
+        if size > self.budget:
+            return
+        key = (source, pipeline.key())
+        if key in self._entries:
+            self.nbytes -= image_bytes(self._entries.pop(key))
+        self._entries[key] = im
+        self.nbytes += size
+        while self.nbytes > self.budget:
+            _, dropped = self._entries.popitem(last=False)
+            self.nbytes -= image_bytes(dropped)
+
+    def longest_prefix(self, source: tuple, pipeline: Pipeline) -> tuple:
+        """
+        finds the longest start of the pipeline whose result is cached
+        :param source: identity of the source image from source_identity
+        :param pipeline: the filters to apply
+        :return: (number of filters, image), (0, None) if nothing is cached
+        """
+        for done in range(len(pipeline), -1, -1):
+            im = self.get(source, pipeline[:done])
+            if im is not None:
+                return done, im
+        return 0, None
+
+    def clear(self):
+        """
+        drops every cached image
+        :return: nothing
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def preview_job(cache: ResultCache, path: str, pipeline: Pipeline, preview_box: tuple = None) -> tuple:
+    """
+    gets the work left to filter an image, starting from the longest cached result
+    :param cache: the cache to read
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :param preview_box: (width, height) the result is shown in, the filters then run on a
+    proxy of the image scaled down to fit it, None runs them at full resolution
+    :return: (source, job) where source is the key of the image in the cache and job is for
+    filter_checkpoints, its done is len(pipeline) and its im the result when that is cached
+    """
+    scale = 1.0
+    if preview_box is not None:
+        with Image.open(path) as im:
+            scale = preview_scale(im.size, preview_box)
+    # results of proxies and of the full image are kept apart
+    source = source_identity(path) + (scale,)
+    done, im = cache.longest_prefix(source, pipeline)
+    return source, (path, scale, done, im, checkpoint_stops(len(pipeline), done))
+
+
+def save_job(cache: ResultCache, path: str, pipeline: Pipeline) -> tuple:
+    """
+    gets the work left to filter and save an image at full resolution
+    :param cache: the cache to read
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :return: job for filter_checkpoints that only stops at the end, its result is saved by
+    save_checkpoint
+    """
+    done, im = cache.longest_prefix(source_identity(path) + (1.0,), pipeline)
+    return path, 1.0, done, im, (len(pipeline),)
+
+
+def store_checkpoints(cache: ResultCache, source: tuple, pipeline: Pipeline, results: list):
+    """
+    adds the results from filter_checkpoints to the cache
+    :param cache: the cache to fill
+    :param source: key of the image from preview_job
+    :param pipeline: the filters that were applied
+    :param results: list of (number of filters applied, image) tuples
+    :return: nothing
+    """
+    for done, im in results:
+        cache.put(source, pipeline[:done], im)
+
@@ -0,0 +1,263 @@
+import argparse
+import os
+
+from PIL import Image
+
+from image_filtering.batch import get_image_paths, walk_image_paths, make_output_folder, run_batch
+from image_filtering.benchmark import run_benchmarks, save_results, load_results, compare_results, SIZES, MODES, SUITES
+from image_filtering.encoders import EncoderSettings, OUTPUT_FORMATS, DEFAULT_COMPRESS_LEVEL, DEFAULT_WRITERS
+from image_filtering.executor import BatchExecutor, DEFAULT_WORKERS
+from image_filtering.manifest import ExportManifest
+from image_filtering.compare import compare_runs
+from image_filtering.pipeline import load_pipeline
+from image_filtering.planner import plan_pipeline
+from image_filtering.profiling import enable, disable, load_trace, save_chrome_trace, summarize, format_summary, \
+    TRACE_ENV
+
+
+def batch(args) -> int:
+    """
+    runs the "batch" command, filters every image in a directory
+    the images are streamed, so the directory is never listed all at once
+    running it again with the same output folder skips the images whose output is up to date
+    images that can't be filtered or saved are reported and the others go on
+    :param args: parsed command line arguments
+    :return: exit code, 1 if any image failed
+    """
+    try:
+        pipeline = load_pipeline(args.pipeline)
+    except (OSError, ValueError) as e:
+        print(f'could not load pipeline: {e}')
+        return 1
+    try:
+        encoder = EncoderSettings(args.format, args.quality, args.compress_level, args.optimize_output, args.lossless)
+    except ValueError as e:
+        print(f'invalid output settings: {e}')
+        return 1
+
+    if args.output is None:
+        output_dir = make_output_folder(args.directory)
+    else:
+        output_dir = args.output
+        os.makedirs(output_dir, exist_ok=True)
+    paths = walk_image_paths(args.directory, args.recursive, exclude=output_dir)
+
+    if args.explain:
+        # plans depend on the size and mode of the image, so show the one for the first image
+        first = next(walk_image_paths(args.directory, args.recursive, exclude=output_dir), None)
+        if first is not None:
+            with Image.open(first) as im:
+                print(f'plan for {first}:')
+                print(plan_pipeline(pipeline, im.size, im.mode).describe())
+
+    if args.profile is not None:
+        # started before the pools so their workers profile too
+        enable(args.profile)
+
+    # subdirectories are only kept when looking in them
+    source_dir = args.directory if args.recursive else None
+    errors = []
+
+    def failed(path, error):
+        errors.append(path)
+        print(f'failed {path}: {type(error).__name__}: {error}')
+
+    with ExportManifest(output_dir) as manifest, BatchExecutor(args.writers, use_threads=True) as writer:
+        results = run_batch(paths, pipeline, output_dir, args.workers, args.optimize, args.backend, source_dir,
+                            manifest=manifest, force=args.force, encoder=encoder, writer=writer, failed=failed)
+        for done, (path, output_path) in enumerate(results, 1):
+            print(f'[{done}] {path} -> {output_path}')
+        if manifest.skipped > 0:
+            print(f'skipped {manifest.skipped} images that are up to date')
+        if len(errors) > 0:
+            print(f'{len(errors)} images failed')
+
+    if args.profile is not None:
+        disable()
+        events = load_trace(args.profile)
+        save_chrome_trace(events, os.path.join(args.profile, 'trace.json'))
+        print(format_summary(summarize(events)))
+        print(f"chrome trace saved to {os.path.join(args.profile, 'trace.json')}")
+    return 1 if len(errors) > 0 else 0
+
+
+def compare(args) -> int:
+    """
+    runs the "compare" command, checks that the numpy backend, the tiled engine or the
+    reference versions of the filters give the same pixels as the PIL functions and prints how fast each one is
+    :param args: parsed command line arguments
+    :return: exit code, 1 if any image differs by more than the tolerance
+    """
+    try:
+        pipeline = load_pipeline(args.pipeline)
+    except (OSError, ValueError) as e:
+        print(f'could not load pipeline: {e}')
+        return 1
+
+    worst = 0
+    megapixels = 0
+    totals = {'pil': 0, args.against: 0}
+    for path in get_image_paths(args.directory):
+        with Image.open(path) as im:
+            im.load()
+            result = compare_runs(im, pipeline, 'pil', args.against, args.repeat, args.margin)
+            megapixels += im.width * im.height / 1e6
+        worst = max(worst, result['max_difference'])
+        for name in totals:
+            totals[name] += result[name + '_seconds']
+        print(f"{path}: max difference {result['max_difference']} "
+              f"({result['differing_values']} values), " +
+              ', '.join(f"{name} {result[name + '_seconds'] * 1000:.1f} ms" for name in totals))
+
+    for name, seconds in totals.items():
+        if seconds > 0:
+            print(f'{name}: {megapixels / seconds:.1f} megapixels/s')
+    return 0 if worst <= args.tolerance else 1
+
+
+def report(args) -> int:
+    """
+    runs the "report" command, prints the time spent in each stage of a profiled run
+    :param args: parsed command line arguments
+    :return: exit code
+    """
+    try:
+        events = load_trace(args.trace)
+    except (OSError, ValueError, KeyError) as e:
+        print(f'could not load trace: {e}')
+        return 1
+    print(format_summary(summarize(events)))
+    if args.chrome is not None:
+        save_chrome_trace(events, args.chrome)
+        print(f'chrome trace saved to {args.chrome}')
+    return 0
+
+
+def bench(args) -> int:
+    """
+    runs the "bench" command, times every filter, some typical pipelines and batch throughput
+    and optionally compares them with an earlier run
+    :param args: parsed command line arguments
+    :return: exit code, 1 if anything got slower than the threshold compared to the earlier run
+    """
+    baseline = None
+    if args.against is not None:
+        try:
+            baseline = load_results(args.against)
+        except (OSError, ValueError) as e:
+            print(f'could not load earlier results: {e}')
+            return 1
+
+    def progress(result):
+        print(f"{result['key']}: {result['best_seconds'] * 1000:.1f} ms, "
+              f"{result['megapixels_per_second']:.1f} megapixels/s")
+
+    results = run_benchmarks(args.suites, args.sizes, args.modes, args.images, args.repeat, args.workers, progress)
+    if args.output is not None:
+        save_results(results, args.output)
+        print(f'saved results to {args.output}')
+    if baseline is None:
+        return 0
+
+    if baseline['environment'] != results['environment']:
+        print('warning: the earlier results were measured on a different setup')
+    slower = 0
+    print(f"compared with {args.against} from {baseline['created']}:")
+    for key, before, after, change in compare_results(baseline, results):
+        flag = ''
+        if change * 100 > args.threshold:
+            flag = ' SLOWER'
+            slower += 1
+        elif -change * 100 > args.threshold:
+            flag = ' faster'
+        print(f'{key}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms ({change * 100:+.1f}%){flag}')
+    print(f'{slower} slower by more than {args.threshold}%')
+    return 0 if slower == 0 else 1
+
+
+def main(argv=None) -> int:
+    """
+    entry point for `python -m image_filtering`
+    never imports PyQt so it can be used on machines without a display
+    :param argv: command line arguments, defaults to sys.argv
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(prog='python -m image_filtering')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = commands.add_parser('batch', help='apply a pipeline to every image in a directory')
+    batch_parser.add_argument('directory', help='directory containing the images')
+    batch_parser.add_argument('--pipeline', required=True, help='json file listing the filters to apply')
+    batch_parser.add_argument('--output', help='output directory (default: the "output" folder in directory)')
+    batch_parser.add_argument('--force', action='store_true',
+                              help='redo every image, even the ones whose output is up to date')
+    batch_parser.add_argument('--recursive', action='store_true',
+                              help='also filter the images in subdirectories, keeping the same layout in the output')
+    batch_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                              help='number of worker processes (default: number of cpus)')
+    batch_parser.add_argument('--no-optimize', dest='optimize', action='store_false',
+                              help='run the filters exactly as listed instead of a planned version')
+    batch_parser.add_argument('--format', choices=[*OUTPUT_FORMATS, 'source'], default='png',
+                              help='format of the outputs, "source" keeps the format of each image (default: png)')
+    batch_parser.add_argument('--quality', type=int, default=90, help='jpeg and webp quality, 1 to 100 (default: 90)')
+    batch_parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESS_LEVEL,
+                              help=f'png compression, 0 (fastest) to 9 (smallest) (default: {DEFAULT_COMPRESS_LEVEL})')
+    batch_parser.add_argument('--optimize-output', action='store_true',
+                              help='spend more time encoding to make smaller files')
+    batch_parser.add_argument('--reencode', dest='lossless', action='store_false',
+                              help='decode and encode jpegs that are only flipped or rotated by right angles '
+                                   'instead of transforming them losslessly with jpegtran')
+    batch_parser.add_argument('--writers', type=int, default=DEFAULT_WRITERS,
+                              help=f'number of threads encoding and writing outputs (default: {DEFAULT_WRITERS})')
+    batch_parser.add_argument('--explain', action='store_true', help='print the plan chosen for the first image')
+    batch_parser.add_argument('--backend', choices=['pil', 'numpy', 'tiled'], default='pil',
+                              help='run the filters with PIL, on a single numpy array, or with PIL tile by tile to '
+                                   'bound memory, pil does that too for very large images (default: pil)')
+    batch_parser.add_argument('--profile', metavar='DIR',
+                              help='record the time spent in each stage of every image in DIR, replacing the '
+                                   'traces of an earlier run, then print a report and save DIR/trace.json for '
+                                   'chrome://tracing')
+    batch_parser.set_defaults(run=batch)
+
+    compare_parser = commands.add_parser('compare',
+                                         help='check the numpy backend, tiled engine or reference filters against PIL')
+    compare_parser.add_argument('directory', help='directory containing the images')
+    compare_parser.add_argument('--pipeline', required=True, help='json file listing the filters to apply')
+    compare_parser.add_argument('--against', choices=['numpy', 'tiled', 'reference'], default='numpy',
+                                help='numpy backend, tiled engine, or the unoptimized filters like smooth_iterated '
+                                     '(default: numpy)')
+    compare_parser.add_argument('--repeat', type=int, default=3, help='runs per image, the fastest is kept')
+    compare_parser.add_argument('--margin', type=int, default=0, help='pixels next to the edges to ignore')
+    compare_parser.add_argument('--tolerance', type=int, default=0,
+                                help='largest allowed difference in any pixel value (default: 0)')
+    compare_parser.set_defaults(run=compare)
+
+    report_parser = commands.add_parser('report', help='print the time spent in each stage of a profiled run')
+    report_parser.add_argument('trace', help=f'folder given to batch --profile or set in {TRACE_ENV} for the app, '
+                                             'or a chrome trace json')
+    report_parser.add_argument('--chrome', help='also save the events as a chrome trace json')
+    report_parser.set_defaults(run=report)
+
+    bench_parser = commands.add_parser('bench', help='time every filter, typical pipelines and batch throughput')
+    bench_parser.add_argument('--images', default='testing_images',
+                              help='directory of real images to time along with the synthetic ones and to run the '
+                                   'batch benchmark on (default: testing_images)')
+    bench_parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES),
+                              help='parts of the suite to run (default: all)')
+    bench_parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES),
+                              help='sizes of the synthetic images (default: all)')
+    bench_parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES),
+                              help='pixel modes of the synthetic images (default: all)')
+    bench_parser.add_argument('--repeat', type=int, default=3, help='runs of each filter and pipeline, the fastest '
+                                                                    'is kept (default: 3)')
+    bench_parser.add_argument('--workers', type=int, nargs='+',
+                              help='numbers of workers for the batch benchmark (default: 1, 2 and the number of cpus)')
+    bench_parser.add_argument('--output', help='json file to save the results to')
+    bench_parser.add_argument('--against', help='json file of earlier results to compare with')
+    bench_parser.add_argument('--threshold', type=float, default=10,
+                              help='percent a time may go up by before it counts as slower (default: 10)')
+    bench_parser.set_defaults(run=bench)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_filtering.numpy_backend import get_backend, to_array
+from image_filtering.pipeline import *
+from image_filtering.tiled import run_tiled
+
+
+def run_reference(pipeline: Pipeline, im: Image.Image) -> Image.Image:
+    """
+    applies a pipeline with the straightforward versions of the filters that the faster
+    ones are checked against, e.g. smooth_iterated instead of smooth
+    :param pipeline: the filters to apply
+    :param im: the image to be filtered
+    :return: the filtered image
+    """
+    for spec in pipeline:
+        if isinstance(spec, SmoothSpec):
+            im = smooth_iterated(im, spec.intensity)
+        else:
+            im = spec.apply(im)
+    return im
+
+
+# ways of running a pipeline that can be compared
+RUNNERS = {
+    'pil': lambda pipeline, im: pipeline.apply(im),
+    'numpy': lambda pipeline, im: get_backend().apply(pipeline, im),
+    # small tiles so the testing images are split into many of them
+    'tiled': lambda pipeline, im: run_tiled(im, pipeline, tile_size=256),
+    'reference': run_reference
+}
+
+
+def compare_runs(im: Image.Image, pipeline: Pipeline, first: str = 'pil', second: str = 'numpy',
+                 repeat: int = 3, margin: int = 0) -> dict:
+    """
+    runs a pipeline two different ways and compares the results
+    :param im: the image to be filtered
+    :param pipeline: the filters to apply
+    :param first: name of the first way to run it, from RUNNERS
+    :param second: name of the second way to run it, from RUNNERS
+    :param repeat: how many times each one runs, the fastest time is kept
+    :param margin: pixels next to the edges to leave out of the comparison
+    :return: dict with the largest pixel difference, how many values differ and the time each one took
+    """
+    times = dict()
+    results = dict()
+    for name in (first, second):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name] = RUNNERS[name](pipeline, im)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[name] = best
+
+    a, b = results[first], results[second]
+    if a.size != b.size or a.mode != b.mode:
+        raise ValueError(f'results disagree: {a.mode} {a.size} vs {b.mode} {b.size}')
+    diff = np.abs(to_array(a).astype(np.int16) - to_array(b))
+    if margin > 0:
+        diff = diff[margin:-margin, margin:-margin]
+    return {
+        'max_difference': int(diff.max()) if diff.size > 0 else 0,
+        'differing_values': int(np.count_nonzero(diff)),
+        first + '_seconds': times[first],
+        second + '_seconds': times[second]
+    }
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict
+
+from PIL import Image
+
+from image_filtering.profiling import stage
+
+
+# formats outputs can be saved in, with the extension given to the files
+OUTPUT_FORMATS = {
+    'png': '.png',
+    'jpeg': '.jpg',
+    'webp': '.webp',
+    'tiff': '.tiff',
+}
+# extensions of source images that keep their format when the format is "source",
+# sources in any other format are saved as png
+SOURCE_FORMATS = {
+    '.png': 'png',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.jfif': 'jpeg',
+    '.webp': 'webp',
+    '.tif': 'tiff',
+    '.tiff': 'tiff',
+}
+# pixel modes each format can store, images in other modes are converted by prepare_image
+FORMAT_MODES = {
+    'png': ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I;16'),
+    'jpeg': ('L', 'RGB', 'CMYK'),
+    'webp': ('RGB', 'RGBA'),
+    'tiff': ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'CMYK', 'I', 'F'),
+}
+# zlib level used for png when none is given, much faster than pillow's 6 for files only
+# a little bigger
+DEFAULT_COMPRESS_LEVEL = 3
+# threads that encode and write outputs when none is given
+DEFAULT_WRITERS = 2
+
+
+@dataclass(frozen=True, slots=True)
+class EncoderSettings:
+    """
+    how outputs are encoded
+    :param format: one of OUTPUT_FORMATS, or "source" to keep the format of each source image
+    :param quality: 1 to 100, used by jpeg and webp
+    :param compress_level: 0 (none, fastest) to 9 (smallest), used by png, tiff is deflated
+    unless it is 0
+    :param optimize: spend more time to make smaller files, png then always uses level 9
+    :param lossless: jpegs saved as jpeg that are only flipped or rotated by right angles
+    are transformed without decoding them when jpegtran is installed, so they lose no
+    quality, see lossless.py
+    """
+    format: str = 'png'
+    quality: int = 90
+    compress_level: int = DEFAULT_COMPRESS_LEVEL
+    optimize: bool = False
+    lossless: bool = True
+
+    def __post_init__(self):
+        if self.format != 'source' and self.format not in OUTPUT_FORMATS:
+            raise ValueError(f'unknown output format: {self.format}')
+        if not 1 <= self.quality <= 100:
+            raise ValueError(f'quality has to be between 1 and 100, not {self.quality}')
+        if not 0 <= self.compress_level <= 9:
+            raise ValueError(f'compress level has to be between 0 and 9, not {self.compress_level}')
+
+    def output_format(self, path: str) -> str:
+        """
+        gets the format the output of a source image is saved in
+        :param path: path of the source image
+        :return: one of OUTPUT_FORMATS
+        """
+        if self.format == 'source':
+            return SOURCE_FORMATS.get(os.path.splitext(path)[1].lower(), 'png')
+        return self.format
+
+    def extension(self, path: str) -> str:
+        """
+        gets the extension of the output of a source image
+        a source kept in its own format keeps its extension, e.g. .jpeg stays .jpeg
+        :param path: path of the source image
+        :return: the extension, with the dot
+        """
+        if self.format == 'source' and os.path.splitext(path)[1].lower() in SOURCE_FORMATS:
+            return os.path.splitext(path)[1]
+        return OUTPUT_FORMATS[self.output_format(path)]
+
+    def save_options(self, output_format: str) -> dict:
+        """
+        gets the keyword arguments passed to Image.save
+        :param output_format: one of OUTPUT_FORMATS
+        :return: the options
+        """
+        if output_format == 'png':
+            return {'compress_level': self.compress_level, 'optimize': self.optimize}
+        if output_format == 'jpeg':
+            return {'quality': self.quality, 'optimize': self.optimize}
+        if output_format == 'webp':
+            # method is how hard libwebp looks for a smaller file, 4 is its default
+            return {'quality': self.quality, 'method': 6 if self.optimize else 4}
+        return {'compression': 'tiff_adobe_deflate' if self.compress_level > 0 else 'raw'}
+
+    def key(self) -> str:
+        """
+        gets a key that identifies the settings, see Pipeline.key
+        :return: hex digest of the json form
+        """
+        return hashlib.sha1(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()
+
+
+def prepare_image(im: Image.Image, output_format: str) -> Image.Image:
+    """
+    converts an image to a pixel mode the format can store, alpha is dropped by jpeg
+    :param im: the image
+    :param output_format: one of OUTPUT_FORMATS
+    :return: the image, or a converted copy of it
+    """
+    modes = FORMAT_MODES[output_format]
+    if im.mode in modes:
+        return im
+    # pillow no longer saves 32 bit png, 16 bits keeps more of the image than L
+    if im.mode == 'I' and 'I;16' in modes:
+        return im.convert('I;16')
+    if ('A' in im.getbands() or 'transparency' in im.info) and 'RGBA' in modes:
+        return im.convert('RGBA')
+    return im.convert('L' if im.mode in ('1', 'LA', 'I', 'I;16', 'F') and 'L' in modes else 'RGB')
+
+
+def write_image(im: Image.Image, output_path: str, settings: EncoderSettings) -> str:
+    """
+    encodes an image and writes it to a file
+    pillow lets go of the GIL while encoding, so writer threads run alongside each other
+    :param im: the image, it isn't modified
+    :param output_path: path of the file to write
+    :param settings: how to encode it, an output that keeps the format of its source has the
+    extension of the source so the format is found from output_path
+    :return: output_path
+    """
+    output_format = settings.output_format(output_path)
+    with stage('convert_output', format=output_format) as timed:
+        prepared = prepare_image(im, output_format)
+        if prepared is not im:
+            timed.image(prepared)
+    with stage('encode', path=output_path, format=output_format) as timed:
+        prepared.save(output_path, output_format.upper(), **settings.save_options(output_format))
+        timed.set(file_bytes=os.path.getsize(output_path))
+    return output_path
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+
+# number of workers used when none is given
+DEFAULT_WORKERS = os.cpu_count() or 1
+# marks the end of the items in map_unordered
+_END = object()
+
+
+def in_worker_process() -> bool:
+    """
+    checks if the caller runs in a worker process of a pool, where starting more threads
+    for one image only fights over the cpus with the other workers
+    :return: True in a worker process, False in the app or the command line tool itself
+    """
+    return multiprocessing.parent_process() is not None
+
+
+class BatchExecutor:
+    """
+    runs per-image jobs on a pool of workers and hands back each result as soon as it finishes
+    the pool is created on first use and kept alive until shutdown so repeated batches
+    don't pay for starting new processes
+    """
+    def __init__(self, workers: int = DEFAULT_WORKERS, use_threads: bool = False):
+        """
+        :param workers: number of workers, 1 runs every job in the calling thread
+        :param use_threads: use a thread pool instead of a process pool, only worth it when
+        the filters spend most of their time in Pillow code that releases the GIL
+        """
+        self.workers = workers
+        self.use_threads = use_threads
+        self._pool = None
+        # jobs can be submitted from several threads, only one of them may create the pool
+        self._lock = threading.Lock()
+
+    def set_workers(self, workers: int):
+        """
+        changes the number of workers, jobs submitted from now on go to a new pool
+        jobs already handed to the old pool still run there and it goes away once they are
+        done, nothing is cancelled or waited for
+        :param workers: the new number of workers
+        :return: nothing
+        """
+        if workers == self.workers:
+            return
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self.workers = workers
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _submit(self, func, *args) -> Future:
+        """
+        hands a job to the pool, creating it if needed
+        done while holding the lock so set_workers can't shut the pool down in between
+        :param func: module level function that does the work
+        :param args: arguments passed to the call
+        :return: future holding the result
+        """
+        with self._lock:
+            if self._pool is None:
+                pool_class = ThreadPoolExecutor if self.use_threads else ProcessPoolExecutor
+                self._pool = pool_class(max_workers=self.workers)
+            return self._pool.submit(func, *args)
+
+    def submit(self, func, *args) -> Future:
+        """
+        calls func(*args) on the pool, can be called from any thread
+        with 1 worker it runs in the calling thread and the returned future is already done
+        :param func: module level function that does the work
+        :param args: arguments passed to the call
+        :return: future holding the result
+        """
+        if self.workers > 1:
+            return self._submit(func, *args)
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def map_unordered(self, func, items, *args, max_pending: int = None, failed=None):
+        """
+        calls func(item, *args) for every item
+        func and args have to be picklable when using a process pool
+        :param func: module level function that does the work for one item
+        :param items: the items to process, e.g. image paths, can be a generator
+        :param args: extra arguments passed to every call
+        :param max_pending: most items handed to the pool at once, items are only taken from
+        items when there is room so memory stays the same however many there are,
+        None hands over every item straight away
+        :param failed: called with the item and the error of each call that raised one, those
+        items are left out and the others go on, None raises the first error
+        :return: generator of (item, result) tuples in the order they finish
+        """
+        if self.workers <= 1:
+            for item in items:
+                try:
+                    result = func(item, *args)
+                except Exception as e:
+                    if failed is None:
+                        raise
+                    failed(item, e)
+                    continue
+                yield item, result
+            return
+
+        # each item goes to the pool of the moment, set_workers may replace it meanwhile
+        if max_pending is None:
+            futures = {self._submit(func, item, *args): item for item in items}
+        else:
+            futures = dict()
+            items = iter(items)
+        try:
+            if max_pending is None:
+                for future in as_completed(futures):
+                    yield from self._result(futures[future], future, failed)
+                return
+
+            exhausted = False
+            while True:
+                while not exhausted and len(futures) < max_pending:
+                    item = next(items, _END)
+                    if item is _END:
+                        exhausted = True
+                    else:
+                        futures[self._submit(func, item, *args)] = item
+                if len(futures) == 0:
+                    return
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield from self._result(futures.pop(future), future, failed)
+        finally:
+            # if the caller stops early, don't leave queued jobs running
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _result(item, future: Future, failed):
+        """
+        :param item: item of a finished job
+        :param future: future of the job
+        :param failed: see map_unordered
+        :return: generator of the (item, result) tuple, or nothing if the job failed
+        """
+        error = future.exception()
+        if error is None:
+            yield item, future.result()
+        elif failed is None:
+            raise error
+        else:
+            failed(item, error)
+
+    def shutdown(self):
+        """
+        stops the pool, waits for running jobs to finish
+        :return: nothing
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -1,5 +1,30 @@
+import math
+
 from PIL import Image, ImageFilter, ImageOps
-import numpy as np
+
+
+# spread (variance along each axis) of one pass of ImageFilter.SMOOTH, n passes spread n times as much
+SMOOTH_VARIANCE = 6 / 13
+# up to this many passes the 3x3 smooth filter is as fast as one gaussian blur, so it is used as is
+SMOOTH_MAX_PASSES = 2
+# above that, smooth() is within this many levels of smooth_iterated for intensities up to
+# SMOOTH_TOLERANCE_INTENSITY, leaving out the SMOOTH_TOLERANCE_MARGIN pixels next to the edges
+SMOOTH_TOLERANCE = 5
+SMOOTH_TOLERANCE_MARGIN = 5
+SMOOTH_TOLERANCE_INTENSITY = 10
+
+# transposes that rotate an image by right angles without resampling, keyed on the angle in degrees
+RIGHT_ANGLE_TRANSPOSES = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270
+}
+# resampling filters rotate can use for other angles, from the fastest to the smoothest
+ROTATE_RESAMPLING = {
+    'nearest': Image.Resampling.NEAREST,
+    'bilinear': Image.Resampling.BILINEAR,
+    'bicubic': Image.Resampling.BICUBIC
+}
 
 
 def filter_scan(im: Image.Image, threshold: int) -> Image.Image:
@@ -9,24 +34,31 @@ def filter_scan(im: Image.Image, threshold: int) -> Image.Image:
     :param threshold: threshold for scan
     :return: filtered image
     """
-    im_data = np.asarray(im.convert('L'))
-    im_data[im_data > threshold] = 255
+    # values above the threshold become white, point() does it with a lookup table on the
+    # converted image without copying it out to numpy and back
+    table = [value if value <= threshold else 255 for value in range(256)]
+    mod_im = im.convert('L').point(table)
 
     # filter_components edges
-    mod_im = Image.fromarray(im_data)
     mod_im = mod_im.filter(ImageFilter.EDGE_ENHANCE)
     return mod_im
 
 
-def rotate(im: Image.Image, angle: float) -> Image.Image:
+def rotate(im: Image.Image, angle: float, resample: str = 'nearest') -> Image.Image:
     """
     takes in an image and rotates it
+    rotating by a multiple of 90 degrees is an exact transpose that keeps the mode of the
+    image, any other angle is resampled and adds an alpha channel for the transparent corners
     :param im: the image to be rotated
-    :param angle: the angle to rotate the image
+    :param angle: the angle to rotate the image, counter-clockwise
+    :param resample: one of ROTATE_RESAMPLING, only used for angles that aren't right angles
     :return: the rotated image
     """
+    if angle % 90 == 0:
+        method = RIGHT_ANGLE_TRANSPOSES.get(int(angle % 360))
+        return im.copy() if method is None else im.transpose(method)
     im = im.convert('RGBA')
-    return im.rotate(angle, expand=True, fillcolor=(0, 0, 0, 0))
+    return im.rotate(angle, ROTATE_RESAMPLING[resample], expand=True, fillcolor=(0, 0, 0, 0))
 
 
 def flip(im: Image.Image, horizontal: bool = True) -> Image.Image:
@@ -82,6 +114,29 @@ def blur(im: Image.Image, intensity: int) -> Image.Image:
 def smooth(im: Image.Image, intensity: int) -> Image.Image:
     """
     takes in an image and puts it through a smooth filter
+    above SMOOTH_MAX_PASSES, one gaussian blur with the same spread replaces running the 3x3
+    smooth filter intensity times so the cost doesn't grow with intensity, like the 3x3 filter
+    it leaves the outermost pixels as they were
+    it is within SMOOTH_TOLERANCE levels of smooth_iterated away from the edges, see the
+    constants at the top
+    :param im: the image to be filtered
+    :param intensity: the amount of smooth
+    :return: the filtered image
+    """
+    if intensity <= SMOOTH_MAX_PASSES:
+        return smooth_iterated(im, intensity)
+
+    out = im.filter(ImageFilter.GaussianBlur(math.sqrt(intensity * SMOOTH_VARIANCE)))
+    width, height = im.size
+    for box in [(0, 0, width, 1), (0, height - 1, width, height), (0, 0, 1, height), (width - 1, 0, width, height)]:
+        out.paste(im.crop(box), box[:2])
+    return out
+
+
+def smooth_iterated(im: Image.Image, intensity: int) -> Image.Image:
+    """
+    takes in an image and puts it through the 3x3 smooth filter intensity times
+    this is what smooth() approximates, see `python -m image_filtering compare --against reference`
     :param im: the image to be filtered
     :param intensity: the amount of smooth
     :return: the filtered image
@@ -95,16 +150,16 @@ def emboss(im: Image.Image) -> Image.Image:
     """
     takes in an image and puts it through an "emboss" filter
     :param im: the image to be filtered
-    :return: the filtered image
+    :return: the filtered image, in L mode
     """
-    return im.convert('L').filter(ImageFilter.EMBOSS).convert('RGBA')
+    return im.convert('L').filter(ImageFilter.EMBOSS)
 
 
 def greyscale(im: Image.Image):
     """
     takes in an image and converts it to grayscale
     :param im: the image to be converted
-    :return: the converted image
+    :return: the converted image, in L mode
     """
-    return im.convert('L').convert('RGBA')
+    return im.convert('L')
 
@@ -0,0 +1,103 @@
+import os
+import shutil
+import subprocess
+
+from PIL import Image
+
+from image_filtering.encoders import EncoderSettings
+from image_filtering.pipeline import Pipeline
+from image_filtering.planner import plan_pipeline, TransposeSpec
+from image_filtering.profiling import stage
+
+
+# jpegtran arguments doing the same as each transpose, jpegtran rotates clockwise while
+# PIL rotates counter-clockwise
+JPEGTRAN_TRANSPOSES = {
+    Image.Transpose.FLIP_LEFT_RIGHT: ('-flip', 'horizontal'),
+    Image.Transpose.FLIP_TOP_BOTTOM: ('-flip', 'vertical'),
+    Image.Transpose.ROTATE_90: ('-rotate', '270'),
+    Image.Transpose.ROTATE_180: ('-rotate', '180'),
+    Image.Transpose.ROTATE_270: ('-rotate', '90'),
+    Image.Transpose.TRANSPOSE: ('-transpose',),
+    Image.Transpose.TRANSVERSE: ('-transverse',)
+}
+
+
+def find_jpegtran():
+    """
+    :return: path of the jpegtran program from libjpeg, None if it isn't installed
+    """
+    return shutil.which('jpegtran')
+
+
+def lossless_transpose(path: str, pipeline: Pipeline, encoder: EncoderSettings):
+    """
+    checks if a source image can be saved with a lossless jpeg transform, which it can when
+    it is a jpeg saved as jpeg and the pipeline only flips it or rotates it by right angles
+    only the header of the image is read
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :param encoder: how the output is encoded
+    :return: (transpose,) with the single transpose that does the whole pipeline, () if the
+    pipeline does nothing, None if the image has to be decoded and filtered
+    """
+    if not encoder.lossless or encoder.output_format(path) != 'jpeg':
+        return None
+    with Image.open(path) as im:
+        if im.format != 'JPEG':
+            return None
+        # the planner folds any number of flips and right angle rotations into one transpose
+        specs = plan_pipeline(pipeline, im.size, im.mode).pipeline
+    if len(specs) > 1 or not all(isinstance(spec, TransposeSpec) for spec in specs):
+        return None
+    return tuple(spec.method for spec in specs)
+
+
+def transform_jpeg(path: str, output_path: str, transpose: tuple, encoder: EncoderSettings) -> bool:
+    """
+    flips or rotates a jpeg with jpegtran, which moves the compressed blocks around instead
+    of decoding and encoding the image again, so no quality is lost
+    like outputs saved by pillow, the output has none of the metadata of the source
+    :param path: path of the source jpeg
+    :param output_path: path of the jpeg to write
+    :param transpose: what lossless_transpose returned for the image
+    :param encoder: how the output is encoded, only optimize is used
+    :return: True if the output was written, False if jpegtran isn't installed or can't
+    transform the image exactly, e.g. when its size isn't a multiple of the block size
+    """
+    jpegtran = find_jpegtran()
+    if jpegtran is None:
+        return False
+    # -perfect fails instead of leaving the partial blocks at the edges untransformed
+    args = [jpegtran, '-copy', 'none', '-perfect']
+    for method in transpose:
+        args += JPEGTRAN_TRANSPOSES[method]
+    if encoder.optimize:
+        args.append('-optimize')
+    args += ['-outfile', output_path, path]
+    try:
+        with stage('jpegtran', path=path):
+            finished = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    if finished.returncode != 0:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    return True
+
+
+def save_lossless(path: str, pipeline: Pipeline, output_path: str, encoder: EncoderSettings) -> bool:
+    """
+    saves the output of a source image with a lossless jpeg transform if it can be
+    :param path: path of the source image
+    :param pipeline: the filters to apply
+    :param output_path: path of the output image
+    :param encoder: how the output is encoded
+    :return: True if the output was written, False if the image has to be filtered and
+    saved the usual way
+    """
+    if not encoder.lossless or find_jpegtran() is None:
+        return False
+    transpose = lossless_transpose(path, pipeline, encoder)
+    return transpose is not None and transform_jpeg(path, output_path, transpose, encoder)
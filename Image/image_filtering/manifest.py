@@ -0,0 +1,78 @@
+import os
+import sqlite3
+
+
+# name of the manifest file kept in each output folder
+MANIFEST_NAME = '.export_manifest.sqlite'
+
+
+class ExportManifest:
+    """
+    records which source image, in which state, each output in a folder was made from and
+    with which settings, so exporting into the same folder again only redoes what changed
+    every output is written to the file as soon as it is recorded, so an export that was
+    stopped halfway carries on from where it was
+    the manifest can only be used by the thread that created it
+    """
+    def __init__(self, output_dir: str):
+        """
+        :param output_dir: the output folder, the manifest file is created in it if needed
+        """
+        self.connection = sqlite3.connect(os.path.join(output_dir, MANIFEST_NAME))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # a commit per output is cheap this way, the last few can be lost in a power cut
+        # but then they are just made again
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            'source TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, settings TEXT, output TEXT)'
+        )
+        self.connection.commit()
+        # number of sources found up to date by is_current
+        self.skipped = 0
+
+    def is_current(self, path: str, settings: str) -> bool:
+        """
+        checks if the output of a source image is up to date
+        :param path: path of the source image
+        :param settings: key of everything that decides the output, e.g. pipeline.key()
+        :return: True if the source hasn't changed since its output was made with the same
+        settings and the output is still there
+        """
+        stat = os.stat(path)
+        row = self.connection.execute(
+            'SELECT output FROM outputs WHERE source = ? AND mtime = ? AND size = ? AND settings = ?',
+            (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, settings)
+        ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return False
+        self.skipped += 1
+        return True
+
+    def record(self, path: str, output_path: str, settings: str):
+        """
+        records that the output of a source image was made and writes it to the file
+        :param path: path of the source image
+        :param output_path: path of the output
+        :param settings: key of everything that decided the output, as given to is_current
+        :return: nothing
+        """
+        stat = os.stat(path)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)',
+            (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, settings, os.path.abspath(output_path))
+        )
+        self.connection.commit()
+
+    def close(self):
+        """
+        closes the manifest file
+        :return: nothing
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,113 @@
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+
+# arrays bigger than this are backed by a temporary file instead of memory, so the system
+# can write them out and drop them from memory when it runs low
+SPILL_BYTES = 256 * 1024 * 1024
+# bytes of pixels copied at a time by array_image
+COPY_BYTES = 16 * 1024 * 1024
+# images with more pixels than this are mapped from their file by open_mapped when they can be
+MAPPED_MIN_PIXELS = 50 * 1000 * 1000
+# raw pixel layouts of each mode that can be used as they are, and whether the channels are
+# stored in reverse order
+MAPPABLE_RAWMODES = {
+    ('L', 'L'): False,
+    ('RGB', 'RGB'): False,
+    ('RGB', 'BGR'): True,
+    ('RGBA', 'RGBA'): False,
+}
+
+
+def scratch(shape: tuple, dtype) -> np.ndarray:
+    """
+    gets an uninitialized array, arrays bigger than SPILL_BYTES are mapped to a temporary
+    file that is deleted once the array is no longer used
+    :param shape: shape of the array
+    :param dtype: numpy dtype of the array
+    :return: the array
+    """
+    if int(np.prod(shape)) * np.dtype(dtype).itemsize <= SPILL_BYTES:
+        return np.empty(shape, dtype)
+    with tempfile.TemporaryFile(prefix='mass_image_editor_') as file:
+        # the mapping keeps the file around after it is closed
+        return np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+
+
+def map_image(im: Image.Image):
+    """
+    maps the pixels of an opened image straight from its file without decoding it, only
+    works for uncompressed files like ppm, most tiff and bmp, the pixels are read from the
+    file as they are used and can be dropped from memory again by the system
+    :param im: an image that was opened from a file and not loaded yet
+    :return: read-only (height, width, channels) uint8 array, None if the file is compressed
+    or its pixels are stored in a way that can't be used as they are
+    """
+    if getattr(im, 'filename', '') == '' or len(im.tile) == 0:
+        return None
+    first = im.tile[0]
+    args = first.args if isinstance(first.args, tuple) else (first.args,)
+    rawmode, stride, orientation = (args + (0, 1))[:3]
+    reverse = MAPPABLE_RAWMODES.get((im.mode, rawmode))
+    if reverse is None or orientation not in (1, -1) or (orientation == -1 and len(im.tile) > 1):
+        return None
+    row_bytes = im.width * len(im.mode)
+    stride = stride or row_bytes
+
+    # files split into strips can only be mapped when the strips follow each other
+    rows = 0
+    for tile in im.tile:
+        left, top, right, bottom = tile.extents
+        if tile.codec_name != 'raw' or tile.args != first.args or (left, right) != (0, im.width) or \
+                top != rows or tile.offset != first.offset + top * stride:
+            return None
+        rows = bottom
+    if rows != im.height:
+        return None
+
+    arr = np.memmap(im.filename, dtype=np.uint8, mode='r', offset=first.offset, shape=(im.height, stride))
+    arr = arr[:, :row_bytes].reshape(im.height, im.width, len(im.mode))
+    if orientation == -1:
+        arr = arr[::-1]
+    if reverse:
+        arr = arr[:, :, ::-1]
+    return arr
+
+
+def open_mapped(path: str, min_pixels: int = MAPPED_MIN_PIXELS):
+    """
+    maps the pixels of a large uncompressed image from its file, see map_image
+    :param path: path of the image
+    :param min_pixels: smaller images aren't mapped, decoding them is just as quick
+    :return: read-only (height, width, channels) uint8 array, None if the image is small or
+    can't be mapped
+    """
+    with Image.open(path) as im:
+        if im.width * im.height <= min_pixels:
+            return None
+        return map_image(im)
+
+
+def array_image(arr: np.ndarray) -> Image.Image:
+    """
+    turns a (height, width, channels) uint8 array into an image, L and RGBA arrays share
+    their memory with the image so a mapped array isn't read into memory
+    :param arr: the array, it must not be changed while the image is used
+    :return: the image
+    """
+    height, width, channels = arr.shape
+    mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[channels]
+    if channels != 3 and arr.flags.c_contiguous:
+        return Image.frombuffer(mode, (width, height), arr, 'raw', mode, 0, 1)
+    # anything else is copied into the image a few rows at a time instead of making a
+    # contiguous copy of the whole array first
+    im = Image.new(mode, (width, height))
+    if width == 0 or height == 0:
+        return im
+    rows = max(1, COPY_BYTES // (width * channels))
+    for top in range(0, height, rows):
+        band = np.ascontiguousarray(arr[top:top + rows])
+        im.paste(Image.frombuffer(mode, (width, len(band)), band, 'raw', mode, 0, 1), (0, top))
+    return im
@@ -0,0 +1,400 @@
+import numpy as np
+from PIL import Image, ImageFilter
+
+from image_filtering.mapped import scratch, array_image
+from image_filtering.pipeline import *
+from image_filtering.profiling import stage
+from image_filtering.planner import ConvertSpec, TransposeSpec, CropBoxSpec, EmbossKernelSpec
+from image_filtering.proxy import GaussianBlurSpec
+
+
+# pixel mode for each number of channels, arrays are always (height, width, channels)
+MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+# weights PIL uses to turn RGB into L, in 16 bit fixed point
+L_WEIGHTS = (19595, 38470, 7471)
+
+# how many unused scratch buffers are kept around for the next stage or image
+MAX_BUFFERS = 8
+
+# pixels worked on at a time by conversions that need wider numbers than the result
+CHUNK_PIXELS = 64 * 1024
+
+# number of box blurs PIL runs in each direction for a gaussian blur
+GAUSSIAN_PASSES = 3
+
+
+class NumpyBackend:
+    """
+    runs pipelines on a single ndarray instead of a new PIL image per filter
+    every filter follows the integer arithmetic of the PIL version in image_processing.py,
+    so both give the same pixels, rotating by angles other than multiples of 90 uses PIL
+    the backend keeps its scratch buffers between images, so use one per thread or process
+
+    who may write to which array:
+    - arrays handed to the backend, like the source image, are never written to
+    - the backend's buffers and views of them, e.g. a crop or flip of a buffer, are owned
+      by the backend, point filters like the scan threshold change them in place instead
+      of filling a new buffer
+    - so the array a filter returns is only valid until the next filter runs, apply() hands
+      back an image that doesn't share memory with any buffer
+    """
+    def __init__(self):
+        self._buffers = []
+
+    def buffer(self, shape: tuple, dtype, avoid: tuple = ()) -> np.ndarray:
+        """
+        gets a scratch array, reusing an old one of the same shape when possible
+        :param shape: shape of the array
+        :param dtype: numpy dtype of the array
+        :param avoid: arrays that are still being read, the buffer won't overlap them
+        :return: an uninitialized array
+        """
+        for i, buffer in enumerate(self._buffers):
+            if buffer.shape == shape and buffer.dtype == dtype and \
+                    not any(np.may_share_memory(buffer, arr) for arr in avoid):
+                # move to the end so the least recently used buffers are dropped first
+                self._buffers.append(self._buffers.pop(i))
+                return buffer
+        # buffers for huge images are spilled to a temporary file
+        buffer = scratch(shape, dtype)
+        self._buffers.append(buffer)
+        if len(self._buffers) > MAX_BUFFERS:
+            self._buffers.pop(0)
+        return buffer
+
+    def is_owned(self, arr: np.ndarray) -> bool:
+        """
+        checks if the backend may write to an array
+        :param arr: the array
+        :return: True if arr is one of the backend's buffers or a view of one
+        """
+        while isinstance(arr, np.ndarray):
+            if any(buffer is arr for buffer in self._buffers):
+                return True
+            arr = arr.base
+        return False
+
+    def owned(self, arr: np.ndarray) -> np.ndarray:
+        """
+        gets an array with the same pixels that the backend may write to
+        :param arr: an array that might be a read-only view of the source image
+        :return: arr if it is owned by the backend, otherwise a copy in a buffer
+        """
+        if self.is_owned(arr):
+            return arr
+        out = self.buffer(arr.shape, arr.dtype, avoid=(arr,))
+        out[...] = arr
+        return out
+
+    def convert(self, arr: np.ndarray, mode: str) -> np.ndarray:
+        """
+        converts between L, RGB and RGBA the same way PIL does
+        :param arr: (height, width, channels) uint8 array
+        :param mode: the mode to convert to
+        :return: the converted array
+        """
+        current = MODES[arr.shape[2]]
+        if current == mode:
+            return arr
+        height, width = arr.shape[:2]
+        if mode == 'L':
+            out = self.buffer((height, width, 1), np.uint8, avoid=(arr,))
+            for top, luma in self.luma_rows(arr):
+                out[top:top + len(luma), :, 0] = luma
+            return out
+        if mode == 'RGB' and current == 'RGBA':
+            return arr[:, :, :3]
+        out = self.buffer((height, width, len(mode)), np.uint8, avoid=(arr,))
+        # L is copied to every colour channel, RGB is copied as is
+        out[:, :, :3] = arr[:, :, :3]
+        if mode == 'RGBA':
+            out[:, :, 3] = 255
+        return out
+
+    def luma_rows(self, arr: np.ndarray):
+        """
+        works out the L values of an RGB or RGBA array a few rows at a time, so the 32 bit
+        sums never take more than CHUNK_PIXELS pixels of memory
+        :param arr: (height, width, channels) uint8 array with 3 or 4 channels
+        :return: generator of (first row, L values of the rows) tuples, the values are only
+        valid until the next one is made
+        """
+        height, width = arr.shape[:2]
+        rows = max(1, min(height, CHUNK_PIXELS // max(width, 1)))
+        acc = self.buffer((rows, width), np.uint32, avoid=(arr,))
+        tmp = self.buffer((rows, width), np.uint32, avoid=(arr, acc))
+        for top in range(0, height, rows):
+            part = arr[top:top + rows]
+            part_acc, part_tmp = acc[:len(part)], tmp[:len(part)]
+            np.multiply(part[:, :, 0], np.uint32(L_WEIGHTS[0]), out=part_acc)
+            for channel in (1, 2):
+                np.multiply(part[:, :, channel], np.uint32(L_WEIGHTS[channel]), out=part_tmp)
+                part_acc += part_tmp
+            part_acc += 0x8000
+            part_acc >>= 16
+            yield top, part_acc
+
+    def threshold(self, arr: np.ndarray, threshold: int) -> np.ndarray:
+        """
+        turns every value above the threshold white like filter_scan, in place when the
+        backend owns the array
+        :param arr: (height, width, channels) uint8 array
+        :param threshold: values above it become 255
+        :return: the changed array
+        """
+        table = np.arange(256, dtype=np.uint8)
+        table[max(threshold + 1, 0):] = 255
+        arr = self.owned(arr)
+        # each value is looked up and written back to the same place, so clip mode can work
+        # in place without the copy numpy makes of out in the default mode
+        np.take(table, arr, out=arr, mode='clip')
+        return arr
+
+    def kernel(self, arr: np.ndarray, image_filter: ImageFilter.Kernel) -> np.ndarray:
+        """
+        applies a 3x3 kernel the same way PIL does, in integer arithmetic
+        PIL applies the kernel rows bottom to top, rounds half up and leaves the
+        outermost pixels unchanged
+        :param arr: (height, width, channels) uint8 array
+        :param image_filter: a 3x3 PIL kernel filter like ImageFilter.SHARPEN
+        :return: the filtered array
+        """
+        _, scale, offset, weights = image_filter.filterargs
+        weights = np.array(weights, dtype=np.int16).reshape(3, 3)[::-1]
+        height, width, channels = arr.shape
+        out = self.buffer(arr.shape, np.uint8, avoid=(arr,))
+        out[...] = arr
+        if height < 3 or width < 3:
+            return out
+
+        src = self.buffer(arr.shape, np.int16, avoid=(arr, out))
+        src[...] = arr
+        inner = (height - 2, width - 2, channels)
+        acc = self.buffer(inner, np.int16, avoid=(src, out))
+        group = self.buffer(inner, np.int16, avoid=(src, out, acc))
+        acc[...] = 0
+        # the kernels have few distinct weights, so sum the pixels sharing a weight first
+        for weight in set(weights.flatten().tolist()) - {0}:
+            group[...] = 0
+            for dy, dx in zip(*np.nonzero(weights == weight)):
+                group += src[dy:dy + height - 2, dx:dx + width - 2]
+            if weight != 1:
+                group *= weight
+            acc += group
+
+        # round(acc / scale + offset) with halves rounded up, as whole numbers
+        acc *= 2
+        acc += 2 * offset * scale + scale
+        np.floor_divide(acc, 2 * scale, out=acc)
+        np.clip(acc, 0, 255, out=acc)
+        out[1:-1, 1:-1] = acc
+        return out
+
+    def box_blur_axis(self, arr: np.ndarray, radius: float, axis: int, avoid: tuple = ()) -> np.ndarray:
+        """
+        one pass of PIL's box blur with a fractional radius along one axis
+        edge pixels are repeated outside of the image
+        :param arr: (height, width, channels) uint8 array
+        :param radius: box radius, the fractional part weights the two outermost pixels
+        :param axis: 0 to blur vertically, 1 to blur horizontally
+        :param avoid: other arrays still needed after the pass, the result won't overlap them
+        :return: the blurred array
+        """
+        avoid = (arr,) + avoid
+        if arr.size == 0:
+            # nothing to blur, e.g. after cropping everything away
+            return self.buffer(arr.shape, np.uint8, avoid=avoid)
+        whole = int(radius)
+        size = arr.shape[axis]
+        weight = int(np.float32(1 << 24) / np.float32(radius * 2 + 1))
+        far_weight = ((1 << 24) - (whole * 2 + 1) * weight) // 2
+
+        def part(array, start, stop):
+            return array[start:stop] if axis == 0 else array[:, start:stop]
+
+        # pad by whole + 1 copies of the edge pixels, then prefix sums give every window in one go
+        pad = whole + 1
+        padded_shape = list(arr.shape)
+        padded_shape[axis] = size + 2 * pad
+        padded = self.buffer(tuple(padded_shape), np.uint32, avoid=avoid)
+        part(padded, 0, pad)[...] = part(arr, 0, 1)
+        part(padded, pad, pad + size)[...] = arr
+        part(padded, pad + size, None)[...] = part(arr, size - 1, size)
+        sums = self.buffer(tuple(padded_shape), np.uint32, avoid=avoid + (padded,))
+        if axis == 0:
+            # numpy's cumsum down the rows is slow, adding whole rows at a time is not
+            sums[0] = padded[0]
+            for row in range(1, len(sums)):
+                np.add(sums[row - 1], padded[row], out=sums[row])
+        else:
+            np.cumsum(padded, axis=axis, out=sums)
+
+        acc = self.buffer(arr.shape, np.uint32, avoid=avoid + (padded, sums))
+        np.subtract(part(sums, 2 * whole + 1, 2 * whole + 1 + size), part(sums, 0, size), out=acc)
+        acc *= np.uint32(weight)
+        far = self.buffer(arr.shape, np.uint32, avoid=avoid + (padded, sums, acc))
+        np.add(part(padded, 0, size), part(padded, 2 * whole + 2, 2 * whole + 2 + size), out=far)
+        far *= np.uint32(far_weight)
+        acc += far
+        acc += np.uint32(1 << 23)
+        acc >>= 24
+        out = self.buffer(arr.shape, np.uint8, avoid=avoid)
+        out[...] = acc
+        return out
+
+    def gaussian_blur(self, arr: np.ndarray, radius: float, avoid: tuple = ()) -> np.ndarray:
+        """
+        approximates a gaussian blur with three box blurs in each direction like PIL does
+        :param arr: (height, width, channels) uint8 array
+        :param radius: standard deviation of the gaussian
+        :param avoid: arrays still needed after the blur, e.g. arr itself, no pass writes over them
+        :return: the blurred array
+        """
+        box_radius = box_blur_radius(radius)
+        for axis in (1, 0):
+            for _ in range(GAUSSIAN_PASSES):
+                arr = self.box_blur_axis(arr, box_radius, axis, avoid)
+        return arr
+
+    def apply_spec(self, spec: FilterSpec, arr: np.ndarray) -> np.ndarray:
+        """
+        applies one filter to an array
+        :param spec: the filter, either from a pipeline or a plan
+        :param arr: (height, width, channels) uint8 array
+        :return: the filtered array, may be a view of arr
+        """
+        height, width = arr.shape[:2]
+        if isinstance(spec, ScanSpec):
+            return self.kernel(self.threshold(self.convert(arr, 'L'), spec.threshold), ImageFilter.EDGE_ENHANCE)
+        if isinstance(spec, RotateSpec) and spec.angle % 90 == 0:
+            return np.rot90(arr, int(spec.angle % 360) // 90)
+        if isinstance(spec, FlipSpec):
+            return arr[:, ::-1] if spec.horizontal else arr[::-1]
+        if isinstance(spec, CropSpec):
+            return arr[
+                int(spec.top * height/100):int(height * (1 - spec.bottom/100)),
+                int(spec.left * width/100):int(width * (1 - spec.right/100))
+            ]
+        if isinstance(spec, SharpenSpec):
+            return self.kernel(arr, ImageFilter.SHARPEN)
+        if isinstance(spec, BlurSpec):
+            return self.gaussian_blur(arr, 1 + 2*spec.intensity)
+        if isinstance(spec, SmoothSpec):
+            # same single blur with the outer pixels kept as smooth() in image_processing.py
+            if spec.intensity <= SMOOTH_MAX_PASSES:
+                for _ in range(spec.intensity):
+                    arr = self.kernel(arr, ImageFilter.SMOOTH)
+                return arr
+            # the outer pixels are copied from arr afterwards, so no pass may overwrite it
+            out = self.gaussian_blur(arr, np.sqrt(spec.intensity * SMOOTH_VARIANCE), avoid=(arr,))
+            if out.size == 0:
+                return out
+            out[[0, -1]] = arr[[0, -1]]
+            out[:, [0, -1]] = arr[:, [0, -1]]
+            return out
+        if isinstance(spec, EmbossSpec):
+            return self.kernel(self.convert(arr, 'L'), ImageFilter.EMBOSS)
+        if isinstance(spec, GreyscaleSpec):
+            return self.convert(arr, 'L')
+        # operations only found in plans and scaled pipelines
+        if isinstance(spec, ConvertSpec) and spec.mode in MODES.values():
+            return self.convert(arr, spec.mode)
+        if isinstance(spec, TransposeSpec):
+            return transpose_array(arr, spec.method)
+        if isinstance(spec, CropBoxSpec):
+            return arr[spec.top:spec.bottom, spec.left:spec.right]
+        if isinstance(spec, EmbossKernelSpec):
+            return self.kernel(arr, ImageFilter.EMBOSS)
+        if isinstance(spec, GaussianBlurSpec):
+            return self.gaussian_blur(arr, spec.radius)
+        # anything else, e.g. rotating by other angles, goes through PIL
+        return to_array(spec.apply(to_image(arr)))
+
+    def apply(self, pipeline: Pipeline, im: Image.Image) -> Image.Image:
+        """
+        applies a pipeline to an image, the image is only turned into a PIL image at the end
+        :param pipeline: the filters to apply, can be a pipeline or the pipeline of a plan
+        :param im: the image to be filtered
+        :return: the filtered image, it never shares memory with the backend's buffers
+        """
+        arr = to_array(im)
+        for spec in pipeline:
+            with stage(spec.name, backend='numpy') as timed:
+                arr = self.apply_spec(spec, arr)
+                timed.image(arr)
+        # PIL copies RGB into its own memory anyway, a few rows at a time by array_image, while
+        # L and RGBA would share the array
+        return array_image(arr) if arr.shape[2] == 3 else to_image(arr.copy())
+
+
+def box_blur_radius(radius: float) -> float:
+    """
+    works out the radius of the box blurs PIL uses to approximate a gaussian blur
+    :param radius: standard deviation of the gaussian
+    :return: radius of each of the GAUSSIAN_PASSES box blurs
+    """
+    sigma2 = radius * radius / GAUSSIAN_PASSES
+    box_length = np.sqrt(12.0 * sigma2 + 1.0)
+    whole = np.floor((box_length - 1.0) / 2.0)
+    fraction = (2 * whole + 1) * (whole * (whole + 1) - 3 * sigma2)
+    fraction /= 6 * (sigma2 - (whole + 1) * (whole + 1))
+    return float(np.float32(whole + fraction))
+
+
+def transpose_array(arr: np.ndarray, method: int) -> np.ndarray:
+    """
+    does a PIL transpose as a numpy view
+    :param arr: (height, width, channels) array
+    :param method: a PIL transpose method
+    :return: a view of arr
+    """
+    return {
+        Image.Transpose.FLIP_LEFT_RIGHT: lambda a: a[:, ::-1],
+        Image.Transpose.FLIP_TOP_BOTTOM: lambda a: a[::-1],
+        Image.Transpose.ROTATE_90: lambda a: np.rot90(a, 1),
+        Image.Transpose.ROTATE_180: lambda a: a[::-1, ::-1],
+        Image.Transpose.ROTATE_270: lambda a: np.rot90(a, 3),
+        Image.Transpose.TRANSPOSE: lambda a: a.transpose(1, 0, 2),
+        Image.Transpose.TRANSVERSE: lambda a: a[::-1, ::-1].transpose(1, 0, 2)
+    }[method](arr)
+
+
+def to_array(im: Image.Image) -> np.ndarray:
+    """
+    turns an image into a (height, width, channels) uint8 array
+    modes other than L, RGB and RGBA are converted to RGB or RGBA first
+    :param im: the image
+    :return: a read-only array
+    """
+    if im.mode not in MODES.values():
+        im = im.convert('RGBA' if 'transparency' in im.info or im.mode.endswith('A') else 'RGB')
+    arr = np.asarray(im)
+    if arr.ndim == 2:
+        arr = arr[:, :, np.newaxis]
+    return arr
+
+
+def to_image(arr: np.ndarray) -> Image.Image:
+    """
+    turns a (height, width, channels) uint8 array into an image
+    :param arr: the array, PIL may keep using its memory
+    :return: the image
+    """
+    if arr.shape[2] == 1:
+        arr = arr[:, :, 0]
+    return Image.fromarray(np.ascontiguousarray(arr))
+
+
+# one backend per process, worker processes each get their own buffers
+_backend = None
+
+
+def get_backend() -> NumpyBackend:
+    """
+    :return: the numpy backend of this process
+    """
+    global _backend
+    if _backend is None:
+        _backend = NumpyBackend()
+    return _backend
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import numbers
+from dataclasses import dataclass, fields
+from typing import ClassVar
+
+from PIL import Image
+
+from image_filtering.image_processing import *
+from image_filtering.profiling import stage
+
+
+def check_type(name: str, field_type: type, value):
+    """
+    checks that a parameter can be stored as the type of its field without changing it,
+    so "false" isn't taken as a true flip and 3.7 isn't cut down to an intensity of 3
+    :param name: name of the parameter
+    :param field_type: int, float, bool or str
+    :param value: the given value
+    :return: nothing
+    """
+    if field_type is bool:
+        valid = isinstance(value, bool)
+    elif field_type is int:
+        # whole floats are let through, e.g. 3.0 from a pipeline file written by another program
+        valid = isinstance(value, numbers.Real) and not isinstance(value, bool) and float(value).is_integer()
+    elif field_type is float:
+        valid = isinstance(value, numbers.Real) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, field_type)
+    if not valid:
+        raise TypeError(f'{name} must be {field_type.__name__}, not {type(value).__name__} {value!r}')
+
+
+@dataclass(frozen=True, slots=True)
+class FilterSpec:
+    """
+    plain data description of one filter and its parameters
+    specs are immutable, hashable and picklable so they can be sent to worker
+    processes, used as cache keys and saved to json
+    """
+    # name used for the filter in pipeline files
+    name: ClassVar[str] = ''
+
+    def __post_init__(self):
+        # make 90 and 90.0 the same angle so equal specs give equal json and keys
+        for field in fields(self):
+            value = getattr(self, field.name)
+            check_type(field.name, field.type, value)
+            object.__setattr__(self, field.name, field.type(value))
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        """
+        applies the filter to an image
+        :param im: the image to be filtered
+        :return: the filtered image
+        """
+        raise NotImplementedError
+
+    def to_dict(self) -> dict:
+        """
+        turns the spec into a dict that can be written to json
+        :return: dict like {"filter": "blur", "intensity": 3}
+        """
+        data = {'filter': self.name}
+        for field in fields(self):
+            data[field.name] = getattr(self, field.name)
+        return data
+
+
+@dataclass(frozen=True, slots=True)
+class ScanSpec(FilterSpec):
+    name: ClassVar[str] = 'scan'
+    threshold: int = 200
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return filter_scan(im, self.threshold)
+
+
+@dataclass(frozen=True, slots=True)
+class RotateSpec(FilterSpec):
+    name: ClassVar[str] = 'rotate'
+    angle: float = 0
+    # one of ROTATE_RESAMPLING, right angles are never resampled
+    resample: str = 'nearest'
+
+    def __post_init__(self):
+        FilterSpec.__post_init__(self)
+        if self.resample not in ROTATE_RESAMPLING:
+            raise ValueError(f'unknown resampling: {self.resample}')
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return rotate(im, self.angle, self.resample)
+
+
+@dataclass(frozen=True, slots=True)
+class FlipSpec(FilterSpec):
+    name: ClassVar[str] = 'flip'
+    horizontal: bool = True
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return flip(im, self.horizontal)
+
+
+@dataclass(frozen=True, slots=True)
+class CropSpec(FilterSpec):
+    name: ClassVar[str] = 'crop'
+    left: float = 0
+    top: float = 0
+    right: float = 0
+    bottom: float = 0
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return crop(im, self.left, self.top, self.right, self.bottom)
+
+
+@dataclass(frozen=True, slots=True)
+class SharpenSpec(FilterSpec):
+    name: ClassVar[str] = 'sharpen'
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return sharpen(im)
+
+
+@dataclass(frozen=True, slots=True)
+class BlurSpec(FilterSpec):
+    name: ClassVar[str] = 'blur'
+    intensity: int = 0
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return blur(im, self.intensity)
+
+
+@dataclass(frozen=True, slots=True)
+class SmoothSpec(FilterSpec):
+    name: ClassVar[str] = 'smooth'
+    intensity: int = 1
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return smooth(im, self.intensity)
+
+
+@dataclass(frozen=True, slots=True)
+class EmbossSpec(FilterSpec):
+    name: ClassVar[str] = 'emboss'
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return emboss(im)
+
+
+@dataclass(frozen=True, slots=True)
+class GreyscaleSpec(FilterSpec):
+    name: ClassVar[str] = 'greyscale'
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return greyscale(im)
+
+
+# maps the name used in pipeline files to the spec class of that filter
+FILTER_SPECS = {
+    spec_class.name: spec_class
+    for spec_class in [
+        ScanSpec,
+        RotateSpec,
+        FlipSpec,
+        CropSpec,
+        SharpenSpec,
+        BlurSpec,
+        SmoothSpec,
+        EmbossSpec,
+        GreyscaleSpec
+    ]
+}
+
+
+def spec_from_dict(data: dict) -> FilterSpec:
+    """
+    creates a spec from a dict like {"filter": "blur", "intensity": 3}
+    :param data: the dict to read
+    :return: the spec
+    """
+    params = dict(data)
+    name = params.pop('filter', None)
+    if name not in FILTER_SPECS:
+        raise ValueError(f'unknown filter: {name}')
+    try:
+        return FILTER_SPECS[name](**params)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'bad parameters for {name}: {e}')
+
+
+@dataclass(frozen=True, slots=True)
+class Pipeline:
+    """
+    an ordered list of filter specs
+    slicing a pipeline gives another pipeline, e.g. pipeline[:2] is the first two filters
+    """
+    specs: tuple = ()
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        """
+        applies every filter of the pipeline to an image in order
+        :param im: the image to be filtered
+        :return: the filtered image
+        """
+        for spec in self.specs:
+            with stage(spec.name) as timed:
+                im = spec.apply(im)
+                timed.image(im)
+        return im
+
+    def to_list(self) -> list:
+        """
+        :return: list of dicts, one per filter
+        """
+        return [spec.to_dict() for spec in self.specs]
+
+    def to_json(self) -> str:
+        """
+        :return: the pipeline as compact json with sorted keys, equal pipelines give equal strings
+        """
+        return json.dumps(self.to_list(), sort_keys=True, separators=(',', ':'))
+
+    def key(self) -> str:
+        """
+        gets a key that identifies the pipeline, stable between runs and processes unlike hash()
+        :return: hex digest of the json form
+        """
+        return hashlib.sha1(self.to_json().encode()).hexdigest()
+
+    @classmethod
+    def from_list(cls, data: list) -> 'Pipeline':
+        """
+        creates a pipeline from the decoded contents of a pipeline file
+        :param data: list of dicts with a "filter" key and the parameters of that filter
+        :return: the pipeline
+        """
+        if not isinstance(data, list):
+            raise ValueError('a pipeline must be a list of filters')
+        return cls(tuple(spec_from_dict(entry) for entry in data))
+
+    @classmethod
+    def from_json(cls, text: str) -> 'Pipeline':
+        return cls.from_list(json.loads(text))
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Pipeline(self.specs[index])
+        return self.specs[index]
+
+
+def load_pipeline(path: str) -> Pipeline:
+    """
+    reads a pipeline from a json file
+    :param path: path to the json file
+    :return: the pipeline
+    """
+    with open(path) as file:
+        return Pipeline.from_list(json.load(file))
+
+
+def save_pipeline(pipeline: Pipeline, path: str):
+    """
+    writes a pipeline to a json file
+    :param pipeline: the pipeline to write
+    :param path: path to the json file
+    :return: nothing
+    """
+    with open(path, 'w') as file:
+        json.dump(pipeline.to_list(), file, indent=4)
@@ -0,0 +1,395 @@
+from dataclasses import dataclass
+from typing import ClassVar
+
+from PIL import Image, ImageFilter
+
+from image_filtering.pipeline import *
+from image_filtering.proxy import GaussianBlurSpec
+
+
+# pixel modes where converting to RGBA and then to L gives the same values as converting straight to L
+PLAIN_MODES = ('L', 'RGB', 'RGBA')
+
+# transposes that swap the width and height of an image
+SWAPPING_TRANSPOSES = (
+    Image.Transpose.ROTATE_90,
+    Image.Transpose.ROTATE_270,
+    Image.Transpose.TRANSPOSE,
+    Image.Transpose.TRANSVERSE
+)
+
+
+@dataclass(frozen=True, slots=True)
+class ConvertSpec(FilterSpec):
+    """
+    converts the image to another pixel mode
+    only created by the planner
+    """
+    name: ClassVar[str] = 'convert'
+    mode: str = 'RGBA'
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return im.convert(self.mode)
+
+
+@dataclass(frozen=True, slots=True)
+class TransposeSpec(FilterSpec):
+    """
+    flips or rotates the image by a multiple of 90 degrees without resampling
+    only created by the planner
+    """
+    name: ClassVar[str] = 'transpose'
+    method: int = Image.Transpose.FLIP_LEFT_RIGHT
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return im.transpose(self.method)
+
+
+@dataclass(frozen=True, slots=True)
+class CropBoxSpec(FilterSpec):
+    """
+    crops the image to a box in pixels, unlike CropSpec which uses percentages
+    only created by the planner
+    """
+    name: ClassVar[str] = 'crop_box'
+    left: int = 0
+    top: int = 0
+    right: int = 0
+    bottom: int = 0
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return im.crop((self.left, self.top, self.right, self.bottom))
+
+
+@dataclass(frozen=True, slots=True)
+class EmbossKernelSpec(FilterSpec):
+    """
+    the emboss kernel on its own, without the conversions done by emboss()
+    only created by the planner
+    """
+    name: ClassVar[str] = 'emboss_kernel'
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return im.filter(ImageFilter.EMBOSS)
+
+
+# operations that only move pixels around, a crop or a mode conversion can be moved past them
+GEOMETRIC_SPECS = (TransposeSpec, CropBoxSpec)
+
+
+def _make_compose_table() -> dict:
+    """
+    works out which single transpose does the same as two transposes in a row
+    by trying every pair on a tiny image
+    :return: dict of {(first, second): combined}, None means no transpose
+    """
+    im = Image.frombytes('L', (3, 2), bytes(range(6)))
+    methods = [None] + list(Image.Transpose)
+
+    def run(method, image):
+        return image if method is None else image.transpose(method)
+
+    results = {run(method, im).tobytes() + bytes(run(method, im).size): method for method in methods}
+    table = dict()
+    for first in methods:
+        for second in methods:
+            out = run(second, run(first, im))
+            table[(first, second)] = results[out.tobytes() + bytes(out.size)]
+    return table
+
+
+COMPOSE_TRANSPOSES = _make_compose_table()
+
+INVERSE_TRANSPOSES = {
+    method: inverse
+    for (method, inverse), combined in COMPOSE_TRANSPOSES.items()
+    if method is not None and combined is None
+}
+
+
+def transposed_size(method: int, size: tuple) -> tuple:
+    """
+    :param method: a PIL transpose method
+    :param size: (width, height) before the transpose
+    :return: (width, height) after the transpose
+    """
+    if method in SWAPPING_TRANSPOSES:
+        return size[1], size[0]
+    return size
+
+
+def transpose_point(method: int, x: float, y: float, size: tuple) -> tuple:
+    """
+    finds where a point ends up after a transpose, points are pixel corners so (0, 0) is the
+    top left corner of the image and (width, height) the bottom right corner
+    :param method: a PIL transpose method
+    :param x: x coordinate before the transpose
+    :param y: y coordinate before the transpose
+    :param size: (width, height) before the transpose
+    :return: (x, y) after the transpose
+    """
+    w, h = size
+    return {
+        Image.Transpose.FLIP_LEFT_RIGHT: (w - x, y),
+        Image.Transpose.FLIP_TOP_BOTTOM: (x, h - y),
+        Image.Transpose.ROTATE_90: (y, w - x),
+        Image.Transpose.ROTATE_180: (w - x, h - y),
+        Image.Transpose.ROTATE_270: (h - y, x),
+        Image.Transpose.TRANSPOSE: (y, x),
+        Image.Transpose.TRANSVERSE: (h - y, w - x)
+    }[method]
+
+
+def crop_box_before_transpose(method: int, box: tuple, size: tuple) -> tuple:
+    """
+    finds the crop box that gives the same pixels when applied before a transpose
+    :param method: a PIL transpose method
+    :param box: (left, top, right, bottom) applied after the transpose
+    :param size: (width, height) before the transpose
+    :return: (left, top, right, bottom) to apply before the transpose
+    """
+    inverse = INVERSE_TRANSPOSES[method]
+    after_size = transposed_size(method, size)
+    x1, y1 = transpose_point(inverse, box[0], box[1], after_size)
+    x2, y2 = transpose_point(inverse, box[2], box[3], after_size)
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+def percent_crop_box(spec: CropSpec, size: tuple) -> tuple:
+    """
+    works out the pixel box crop() uses for a CropSpec
+    :param spec: the crop spec
+    :param size: (width, height) of the image being cropped
+    :return: (left, top, right, bottom)
+    """
+    w, h = size
+    return (
+        int(spec.left * w/100),
+        int(spec.top * h/100),
+        int(w * (1 - spec.right/100)),
+        int(h * (1 - spec.bottom/100))
+    )
+
+
+def output_size(spec: FilterSpec, size):
+    """
+    :param spec: an operation
+    :param size: (width, height) before the operation, or None if unknown
+    :return: (width, height) after the operation, or None if unknown
+    """
+    if size is None:
+        return None
+    if isinstance(spec, TransposeSpec):
+        return transposed_size(spec.method, size)
+    if isinstance(spec, CropBoxSpec):
+        return spec.right - spec.left, spec.bottom - spec.top
+    if isinstance(spec, (RotateSpec, CropSpec)):
+        return None
+    return size
+
+
+def output_mode(spec: FilterSpec, mode: str) -> str:
+    """
+    :param spec: an operation
+    :param mode: pixel mode before the operation
+    :return: pixel mode after the operation
+    """
+    if isinstance(spec, ConvertSpec):
+        return spec.mode
+    if isinstance(spec, (ScanSpec, EmbossSpec, GreyscaleSpec)):
+        return 'L'
+    if isinstance(spec, RotateSpec) and spec.angle % 90 != 0:
+        return 'RGBA'
+    return mode
+
+
+def input_sizes(ops: list, size: tuple) -> list:
+    """
+    :param ops: list of operations
+    :param size: (width, height) of the source image
+    :return: the size of the image going into each operation, None where it is unknown
+    """
+    sizes = []
+    for spec in ops:
+        sizes.append(size)
+        size = output_size(spec, size)
+    return sizes
+
+
+def lower(pipeline: Pipeline, size: tuple) -> list:
+    """
+    splits the filters into simpler operations the other passes can reorder, e.g. emboss
+    becomes a conversion to L followed by the emboss kernel
+    :param pipeline: the pipeline to lower
+    :param size: (width, height) of the source image
+    :return: list of operations
+    """
+    ops = []
+    for spec in pipeline:
+        if isinstance(spec, RotateSpec) and spec.angle % 90 == 0:
+            method = RIGHT_ANGLE_TRANSPOSES.get(int(spec.angle % 360))
+            lowered = [] if method is None else [TransposeSpec(method)]
+        elif isinstance(spec, FlipSpec):
+            if spec.horizontal:
+                lowered = [TransposeSpec(Image.Transpose.FLIP_LEFT_RIGHT)]
+            else:
+                lowered = [TransposeSpec(Image.Transpose.FLIP_TOP_BOTTOM)]
+        elif isinstance(spec, CropSpec) and size is not None:
+            lowered = [CropBoxSpec(*percent_crop_box(spec, size))]
+        elif isinstance(spec, GreyscaleSpec):
+            lowered = [ConvertSpec('L')]
+        elif isinstance(spec, EmbossSpec):
+            lowered = [ConvertSpec('L'), EmbossKernelSpec()]
+        elif isinstance(spec, ScanSpec):
+            lowered = [ConvertSpec('L'), spec]
+        else:
+            lowered = [spec]
+
+        for op in lowered:
+            size = output_size(op, size)
+        ops += lowered
+    return ops
+
+
+def push_crops(ops: list, size: tuple, notes: list) -> bool:
+    """
+    moves crops before the transposes, conversions and other crops in front of them so the
+    rest of the pipeline works on fewer pixels, crops are never moved past filters that look
+    at neighbouring pixels because that would change the edges
+    :return: whether anything changed
+    """
+    for i in range(1, len(ops)):
+        spec, prev = ops[i], ops[i - 1]
+        if not isinstance(spec, CropBoxSpec):
+            continue
+        prev_size = input_sizes(ops, size)[i - 1]
+        if isinstance(prev, ConvertSpec):
+            ops[i - 1:i + 1] = [spec, prev]
+            notes.append(f'moved crop before convert to {prev.mode}')
+        elif isinstance(prev, TransposeSpec) and prev_size is not None:
+            box = crop_box_before_transpose(prev.method, (spec.left, spec.top, spec.right, spec.bottom), prev_size)
+            ops[i - 1:i + 1] = [CropBoxSpec(*box), prev]
+            notes.append(f'moved crop before {Image.Transpose(prev.method).name.lower()}')
+        elif isinstance(prev, CropBoxSpec):
+            ops[i - 1:i + 1] = [CropBoxSpec(
+                prev.left + spec.left,
+                prev.top + spec.top,
+                prev.left + spec.right,
+                prev.top + spec.bottom
+            )]
+            notes.append('merged two crops')
+        else:
+            continue
+        return True
+    return False
+
+
+def move_conversions(ops: list, mode: str, notes: list) -> bool:
+    """
+    moves conversions to L before transposes and conversions to RGBA after transposes and
+    per-channel filters, so the other operations move and filter as few bytes as possible
+    crops are left in front of conversions, see push_crops
+    :return: whether anything changed
+    """
+    for i in range(1, len(ops)):
+        spec, prev = ops[i], ops[i - 1]
+        if isinstance(spec, ConvertSpec) and spec.mode == 'L' and isinstance(prev, TransposeSpec):
+            ops[i - 1:i + 1] = [spec, prev]
+            notes.append(f'moved convert to L before {Image.Transpose(prev.method).name.lower()}')
+            return True
+        if isinstance(prev, ConvertSpec) and prev.mode == 'RGBA':
+            # an alpha channel added to L or RGB is solid, the filters that average
+            # neighbouring pixels keep it solid and treat every channel the same
+            if isinstance(spec, TransposeSpec) or (
+                    mode in ('L', 'RGB') and isinstance(spec, (SharpenSpec, BlurSpec, SmoothSpec, GaussianBlurSpec))):
+                ops[i - 1:i + 1] = [spec, prev]
+                notes.append(f'moved convert to RGBA after {spec.name}')
+                return True
+        mode = output_mode(prev, mode)
+    return False
+
+
+def fold_transposes(ops: list, notes: list) -> bool:
+    """
+    replaces two transposes in a row with one, or none if they cancel out
+    :return: whether anything changed
+    """
+    for i in range(1, len(ops)):
+        spec, prev = ops[i], ops[i - 1]
+        if isinstance(spec, TransposeSpec) and isinstance(prev, TransposeSpec):
+            combined = COMPOSE_TRANSPOSES[(Image.Transpose(prev.method), Image.Transpose(spec.method))]
+            ops[i - 1:i + 1] = [] if combined is None else [TransposeSpec(combined)]
+            notes.append('folded two flips/rotations into one transpose')
+            return True
+    return False
+
+
+def drop_conversions(ops: list, mode: str, notes: list) -> bool:
+    """
+    removes conversions to the mode the image is already in, and conversions to RGBA that
+    are only followed by geometric operations and a conversion to L
+    :return: whether anything changed
+    """
+    for i, spec in enumerate(ops):
+        if isinstance(spec, ConvertSpec):
+            if spec.mode == mode:
+                del ops[i]
+                notes.append(f'dropped convert to {spec.mode}, image is already {mode}')
+                return True
+            if spec.mode == 'RGBA' and mode in PLAIN_MODES:
+                following = [op for op in ops[i + 1:] if not isinstance(op, GEOMETRIC_SPECS)]
+                if len(following) > 0 and following[0] == ConvertSpec('L'):
+                    del ops[i]
+                    notes.append(f'dropped convert {mode} to RGBA, it is converted to L next')
+                    return True
+        mode = output_mode(spec, mode)
+    return False
+
+
+@dataclass(frozen=True)
+class Plan:
+    """
+    the operations chosen to run a pipeline on one image, along with notes on what was changed
+    """
+    original: Pipeline
+    pipeline: Pipeline
+    notes: tuple = ()
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return self.pipeline.apply(im)
+
+    def describe(self) -> str:
+        """
+        :return: human readable summary of the plan
+        """
+        def step(spec):
+            params = spec.to_dict()
+            params.pop('filter')
+            if isinstance(spec, TransposeSpec):
+                params['method'] = Image.Transpose(spec.method).name
+            return spec.name + '(' + ', '.join(f'{k}={v}' for k, v in params.items()) + ')'
+
+        def steps(pipeline):
+            return ' -> '.join(step(spec) for spec in pipeline) or 'nothing'
+
+        lines = ['original: ' + steps(self.original), 'planned:  ' + steps(self.pipeline)]
+        lines += ['  - ' + note for note in self.notes]
+        return '\n'.join(lines)
+
+
+def plan_pipeline(pipeline: Pipeline, size: tuple, mode: str) -> Plan:
+    """
+    rewrites a pipeline into operations that give the same image with less work
+    the plan depends on the size and mode of the source image because crops are turned
+    into pixel boxes so they can be moved exactly
+    :param pipeline: the pipeline to plan
+    :param size: (width, height) of the source image
+    :param mode: pixel mode of the source image
+    :return: the plan
+    """
+    ops = lower(pipeline, size)
+    notes = []
+    while (push_crops(ops, size, notes) or move_conversions(ops, mode, notes)
+           or fold_transposes(ops, notes) or drop_conversions(ops, mode, notes)):
+        pass
+    return Plan(pipeline, Pipeline(tuple(ops)), tuple(dict.fromkeys(notes)))
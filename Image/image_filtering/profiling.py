@@ -0,0 +1,224 @@
+import glob
+import json
+import os
+import threading
+import time
+
+
+# environment variable holding the folder traces are written to, worker processes started
+# while profiling inherit it so they profile too, it can also be set before starting the app
+TRACE_ENV = 'MASS_IMAGE_EDITOR_TRACE'
+
+
+class Stage:
+    """
+    one timed stage of the work on an image, e.g. decoding it or one filter, recorded as a
+    chrome trace event when it ends
+    """
+    def __init__(self, profiler: 'Profiler', name: str, args: dict):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        self.cpu_start = time.thread_time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter_ns()
+        self.args['cpu_ms'] = (time.thread_time_ns() - self.cpu_start) / 1e6
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler.record({
+            'name': self.name,
+            'cat': 'stage',
+            'ph': 'X',
+            'ts': self.start / 1000,
+            'dur': (end - self.start) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'args': self.args
+        })
+        return False
+
+    def image(self, im):
+        """
+        records the size and mode of what the stage made
+        :param im: a PIL image, or a (height, width, channels) uint8 array from the numpy backend
+        :return: nothing
+        """
+        if hasattr(im, 'mode'):
+            width, height, mode = im.width, im.height, im.mode
+            bands = len(im.getbands())
+        else:
+            height, width, bands = im.shape
+            mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}.get(bands, str(bands))
+        self.args.update(width=width, height=height, mode=mode, bytes=width * height * bands)
+
+    def set(self, **args):
+        """
+        records anything else about the stage, e.g. the size of the file it wrote
+        :param args: values to record
+        :return: nothing
+        """
+        self.args.update(args)
+
+
+class _NoStage:
+    """
+    stands in for Stage when profiling is off, so timing a stage costs one function call
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def image(self, im):
+        pass
+
+    def set(self, **args):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class Profiler:
+    """
+    writes the stages of every image to a folder, one json lines file per process, so
+    worker processes can profile without sending anything back
+    """
+    def __init__(self, trace_dir: str):
+        """
+        :param trace_dir: folder the trace files are written to, created if needed
+        """
+        self.trace_dir = trace_dir
+        os.makedirs(trace_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def record(self, event: dict):
+        """
+        writes one event, straight away so nothing is lost when a worker process is stopped
+        :param event: chrome trace event
+        :return: nothing
+        """
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            # forked worker processes get a copy of the profiler, they need their own file
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._file = open(os.path.join(self.trace_dir, f'trace-{self._pid}.jsonl'), 'a')
+            self._file.write(line)
+            self._file.flush()
+
+
+_profiler = Profiler(os.environ[TRACE_ENV]) if os.environ.get(TRACE_ENV) else None
+
+
+def enable(trace_dir: str):
+    """
+    starts profiling this process and the worker processes it starts from now on
+    the traces of an earlier run in the folder are removed, otherwise load_trace would mix
+    their events in with the new ones
+    :param trace_dir: folder the trace files are written to
+    :return: nothing
+    """
+    global _profiler
+    trace_dir = os.path.abspath(trace_dir)
+    for part in glob.glob(os.path.join(trace_dir, 'trace-*.jsonl')):
+        os.remove(part)
+    os.environ[TRACE_ENV] = trace_dir
+    _profiler = Profiler(trace_dir)
+
+
+def disable():
+    """
+    stops profiling this process and the worker processes it starts from now on
+    :return: nothing
+    """
+    global _profiler
+    os.environ.pop(TRACE_ENV, None)
+    _profiler = None
+
+
+def stage(name: str, **args):
+    """
+    times a stage of the work on an image when profiling is on, use as
+    `with stage('decode', path=path) as s: ...; s.image(im)`, when profiling is off it is a
+    stand-in that ignores everything, so only its image and set methods can be used
+    :param name: name of the stage, e.g. a filter name
+    :param args: anything else to record, e.g. the path of the image
+    :return: context manager recording the wall time, cpu time of the thread and whatever is
+    given to its image and set methods
+    """
+    if _profiler is None:
+        return _NO_STAGE
+    return Stage(_profiler, name, args)
+
+
+def load_trace(path: str) -> list:
+    """
+    reads the events of a trace
+    :param path: folder written by a profiler, or a chrome trace json from save_chrome_trace
+    :return: list of events sorted by start time
+    """
+    if os.path.isdir(path):
+        events = []
+        for part in sorted(glob.glob(os.path.join(path, 'trace-*.jsonl'))):
+            with open(part) as file:
+                # the last line may be cut short if the process was killed while writing it
+                for line in file:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass
+    else:
+        with open(path) as file:
+            events = json.load(file)['traceEvents']
+    return sorted(events, key=lambda event: event['ts'])
+
+
+def save_chrome_trace(events: list, path: str):
+    """
+    writes events as a trace that chrome://tracing and ui.perfetto.dev can open
+    :param events: events from load_trace
+    :param path: json file to write
+    :return: nothing
+    """
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+def summarize(events: list) -> list:
+    """
+    adds up the events of each stage
+    :param events: events from load_trace
+    :return: list of dicts with the name, count, wall and cpu milliseconds and bytes made of
+    each stage, the slowest first
+    """
+    totals = dict()
+    for event in events:
+        total = totals.setdefault(event['name'], {'name': event['name'], 'count': 0, 'wall_ms': 0, 'cpu_ms': 0,
+                                                  'bytes': 0})
+        total['count'] += 1
+        total['wall_ms'] += event['dur'] / 1000
+        total['cpu_ms'] += event['args'].get('cpu_ms', 0)
+        total['bytes'] += event['args'].get('bytes', 0)
+    return sorted(totals.values(), key=lambda total: total['wall_ms'], reverse=True)
+
+
+def format_summary(summary: list) -> str:
+    """
+    :param summary: totals from summarize
+    :return: table of the totals, one line per stage
+    """
+    lines = [f"{'stage':<16}{'count':>8}{'wall ms':>12}{'mean ms':>10}{'cpu ms':>12}{'MB made':>10}"]
+    for total in summary:
+        lines.append(f"{total['name']:<16}{total['count']:>8}{total['wall_ms']:>12.1f}"
+                     f"{total['wall_ms'] / total['count']:>10.2f}{total['cpu_ms']:>12.1f}"
+                     f"{total['bytes'] / 2**20:>10.1f}")
+    return '\n'.join(lines)
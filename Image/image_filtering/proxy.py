@@ -0,0 +1,98 @@
+import math
+from dataclasses import dataclass
+from typing import ClassVar
+
+from PIL import Image, ImageFilter
+
+from image_filtering.pipeline import *
+from image_filtering.profiling import stage
+
+
+# the preview box is rounded up to a multiple of this many pixels, so small changes to the
+# size of the viewer keep the same proxies and the cached results made from them
+PREVIEW_SIZE_STEP = 256
+
+
+@dataclass(frozen=True, slots=True)
+class GaussianBlurSpec(FilterSpec):
+    """
+    gaussian blur with any radius, used for blur and smooth on proxies where the radius
+    no longer is a whole number
+    only created by scale_pipeline
+    """
+    name: ClassVar[str] = 'gaussian_blur'
+    radius: float = 0
+
+    def apply(self, im: Image.Image) -> Image.Image:
+        return im.filter(ImageFilter.GaussianBlur(self.radius))
+
+
+def preview_scale(size: tuple, box: tuple) -> float:
+    """
+    gets the scale of the proxy used to preview an image in a box
+    the longer side of the image is fit to the longer side of the box, so rotating by 90
+    degrees doesn't make the preview blurry
+    :param size: (width, height) of the source image
+    :param box: (width, height) the preview is shown in
+    :return: the scale, never more than 1
+    """
+    side = -(-max(box) // PREVIEW_SIZE_STEP) * PREVIEW_SIZE_STEP
+    return min(1.0, side / max(size))
+
+
+def open_scaled(path: str, scale: float = 1.0) -> Image.Image:
+    """
+    opens an image and loads it scaled down, jpegs are decoded at a reduced size straight away
+    :param path: path of the image
+    :param scale: size of the loaded image relative to the source, 1 loads it as is
+    :return: the loaded image
+    """
+    with stage('decode', path=path, scale=scale) as timed, Image.open(path) as im:
+        if scale < 1:
+            im.thumbnail((max(1, round(im.width * scale)), max(1, round(im.height * scale))))
+        im.load()
+        timed.image(im)
+    return im
+
+
+def open_thumbnail(path: str, box: tuple) -> Image.Image:
+    """
+    opens an image and loads it scaled down to fit in a box, keeping its aspect ratio
+    jpegs are decoded at a reduced size with draft() so the full image is never decoded,
+    and the file is closed once it is loaded
+    :param path: path of the image
+    :param box: (width, height) the image has to fit in
+    :return: the loaded image, never bigger than the source
+    """
+    with stage('decode_thumbnail', path=path) as timed, Image.open(path) as im:
+        im.thumbnail(box)
+        im.load()
+        timed.image(im)
+    return im
+
+
+def scale_spec(spec: FilterSpec, scale: float) -> FilterSpec:
+    """
+    gets the filter that does to a scaled image what spec does to the source image
+    only filters that work in pixels change, crops are in percent and stay the same
+    :param spec: the filter
+    :param scale: size of the image the filter is applied to relative to the source
+    :return: the filter to apply to the scaled image
+    """
+    if isinstance(spec, BlurSpec):
+        return GaussianBlurSpec((1 + 2*spec.intensity) * scale)
+    if isinstance(spec, SmoothSpec):
+        return GaussianBlurSpec(math.sqrt(spec.intensity * SMOOTH_VARIANCE) * scale)
+    return spec
+
+
+def scale_pipeline(pipeline: Pipeline, scale: float) -> Pipeline:
+    """
+    gets the pipeline that does to a scaled image what pipeline does to the source image
+    :param pipeline: the filters
+    :param scale: size of the image the filters are applied to relative to the source
+    :return: the pipeline to apply to the scaled image
+    """
+    if scale >= 1:
+        return pipeline
+    return Pipeline(tuple(scale_spec(spec, scale) for spec in pipeline))
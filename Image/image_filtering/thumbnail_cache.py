@@ -0,0 +1,159 @@
+import io
+import os
+import sqlite3
+import time
+
+from PIL import Image
+
+from image_filtering.proxy import open_thumbnail
+
+
+# file the thumbnails are kept in between runs
+DEFAULT_THUMBNAIL_CACHE = os.path.join(os.path.expanduser('~'), '.mass_image_editor', 'thumbnails.sqlite')
+# bytes of encoded thumbnails kept before the least recently used ones are dropped
+DEFAULT_THUMBNAIL_CACHE_SIZE = 64 * 1024 * 1024
+# pixel modes that png can store as they are, anything else is stored as RGBA
+STORED_MODES = ('L', 'RGB', 'RGBA')
+
+
+class ThumbnailCache:
+    """
+    keeps small versions of images in an sqlite file so they don't have to be decoded again
+    thumbnails are keyed on the path of the image and the size they fit in, and only used
+    while the modification time and size of the file are the same as when they were made
+    changes are written when commit is called, which also drops the least recently used
+    thumbnails until the file is under its size limit, the times thumbnails are used are
+    kept in memory until then so reading them never writes to the file
+    """
+    def __init__(self, path: str = DEFAULT_THUMBNAIL_CACHE, max_bytes: int = DEFAULT_THUMBNAIL_CACHE_SIZE):
+        """
+        :param path: path of the sqlite file, created if needed, if it can't be opened the
+        thumbnails are only kept in memory until the app closes
+        :param max_bytes: bytes of encoded thumbnails to keep
+        """
+        self.max_bytes = max_bytes
+        # time each stored thumbnail was last used by (path, box), written by commit
+        self._used = dict()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = self._connect(path)
+        except (OSError, sqlite3.Error):
+            self.connection = self._connect(':memory:')
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        """
+        opens the sqlite file and creates the table if it's new
+        :param path: path of the sqlite file
+        :return: the connection
+        """
+        connection = sqlite3.connect(path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS thumbnails ('
+            'path TEXT, box INTEGER, mtime INTEGER, size INTEGER, data BLOB, used REAL, '
+            'PRIMARY KEY (path, box))'
+        )
+        connection.commit()
+        return connection
+
+    def get(self, path: str, box: int):
+        """
+        gets the stored thumbnail of an image if the file hasn't changed since it was made
+        :param path: path of the image
+        :param box: the width and height the thumbnail fits in
+        :return: the thumbnail, None if there is no usable one
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        row = self.connection.execute(
+            'SELECT data FROM thumbnails WHERE path = ? AND box = ? AND mtime = ? AND size = ?',
+            (path, box, stat.st_mtime_ns, stat.st_size)
+        ).fetchone()
+        if row is None:
+            return None
+        self._used[(path, box)] = time.time()
+        with Image.open(io.BytesIO(row[0])) as im:
+            im.load()
+        return im
+
+    def put(self, path: str, box: int, im: Image.Image):
+        """
+        stores the thumbnail of an image, replacing any older one
+        :param path: path of the image
+        :param box: the width and height the thumbnail fits in
+        :param im: the thumbnail
+        :return: nothing
+        """
+        stat = os.stat(path)
+        if im.mode not in STORED_MODES:
+            im = im.convert('RGBA')
+        data = io.BytesIO()
+        im.save(data, 'PNG')
+        self._used.pop((os.path.abspath(path), box), None)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(path), box, stat.st_mtime_ns, stat.st_size, data.getvalue(), time.time())
+        )
+
+    def thumbnail(self, path: str, box: int) -> Image.Image:
+        """
+        gets the thumbnail of an image, making and storing it if there is no usable one
+        if the file can't be read or written, e.g. when another instance of the app has it
+        locked, the thumbnail is made without it
+        :param path: path of the image
+        :param box: the width and height the thumbnail fits in
+        :return: the thumbnail
+        """
+        try:
+            im = self.get(path, box)
+        except sqlite3.Error:
+            im = None
+        if im is None:
+            im = open_thumbnail(path, (box, box))
+            try:
+                self.put(path, box, im)
+            except sqlite3.Error:
+                pass
+        return im
+
+    def evict(self):
+        """
+        drops the least recently used thumbnails until they fit in max_bytes
+        :return: nothing
+        """
+        total = self.connection.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute('SELECT rowid, LENGTH(data) FROM thumbnails ORDER BY used').fetchall()
+        dropped = []
+        for rowid, nbytes in rows:
+            if total <= self.max_bytes:
+                break
+            dropped.append((rowid,))
+            total -= nbytes
+        self.connection.executemany('DELETE FROM thumbnails WHERE rowid = ?', dropped)
+
+    def commit(self):
+        """
+        drops old thumbnails if the cache is too big and writes the changes to the file, along
+        with the times the thumbnails were used since the last commit
+        :return: nothing
+        """
+        self.connection.executemany(
+            'UPDATE thumbnails SET used = ? WHERE path = ? AND box = ?',
+            [(used, path, box) for (path, box), used in self._used.items()]
+        )
+        self.evict()
+        self.connection.commit()
+        self._used.clear()
+
+    def close(self):
+        """
+        writes the changes and closes the file, the file is closed even if writing fails
+        :return: nothing
+        """
+        try:
+            self.commit()
+        finally:
+            self.connection.close()
@@ -0,0 +1,180 @@
+import numpy as np
+from PIL import Image
+
+from image_filtering.executor import BatchExecutor, DEFAULT_WORKERS
+from image_filtering.mapped import scratch
+from image_filtering.numpy_backend import box_blur_radius, get_backend, to_array, to_image, GAUSSIAN_PASSES
+from image_filtering.pipeline import *
+from image_filtering.planner import ConvertSpec, EmbossKernelSpec
+from image_filtering.profiling import stage as profiled
+from image_filtering.proxy import GaussianBlurSpec
+
+
+# width and height of the tiles, not counting the halo around them
+DEFAULT_TILE_SIZE = 1024
+# images with more pixels than this are filtered tile by tile by the pil backend
+TILED_MIN_PIXELS = 50 * 1000 * 1000
+# tiles handed to each thread at once, enough to keep them busy without holding many tiles
+PENDING_TILES_PER_WORKER = 2
+# bytes of pixels in each band filtered by run_bands, not counting the halo
+BAND_BYTES = 16 * 1024 * 1024
+
+
+def gaussian_halo(radius: float) -> int:
+    """
+    gets how far the pixels a gaussian blur reads reach, PIL runs GAUSSIAN_PASSES box blurs
+    that each read the whole part of their radius plus one pixel on either side
+    :param radius: standard deviation of the gaussian
+    :return: number of pixels
+    """
+    return GAUSSIAN_PASSES * (int(box_blur_radius(radius)) + 1)
+
+
+def kernel_halo(spec: FilterSpec):
+    """
+    gets how many pixels around a tile a filter needs to give the same result as on the
+    whole image, e.g. 1 for a 3x3 kernel
+    :param spec: the filter, from a pipeline or a plan
+    :return: number of pixels, None if the filter can't be run tile by tile because it moves
+    pixels around or changes the size of the image
+    """
+    if isinstance(spec, (ConvertSpec, GreyscaleSpec)):
+        return 0
+    if isinstance(spec, (ScanSpec, SharpenSpec, EmbossSpec, EmbossKernelSpec)):
+        return 1
+    if isinstance(spec, SmoothSpec):
+        if spec.intensity <= SMOOTH_MAX_PASSES:
+            return spec.intensity
+        # smooth() puts back the outermost pixels of what it is given, which must be in the halo
+        return max(1, gaussian_halo((spec.intensity * SMOOTH_VARIANCE) ** 0.5))
+    if isinstance(spec, BlurSpec):
+        return gaussian_halo(1 + 2*spec.intensity)
+    if isinstance(spec, GaussianBlurSpec):
+        return gaussian_halo(spec.radius)
+    return None
+
+
+def split_stages(pipeline: Pipeline) -> list:
+    """
+    splits a pipeline into stages that are run one after the other, each is either a run of
+    filters that can be run tile by tile or a single filter that needs the whole image
+    :param pipeline: the filters
+    :return: list of (pipeline, halo) tuples, halo is None for the filters run on the whole
+    image, otherwise the halo the filters of the stage need together
+    """
+    stages = []
+    for spec in pipeline:
+        halo = kernel_halo(spec)
+        if halo is not None and len(stages) > 0 and stages[-1][1] is not None:
+            specs, total = stages.pop()
+            stages.append((specs + (spec,), total + halo))
+        else:
+            stages.append(((spec,), halo))
+    return [(Pipeline(specs), halo) for specs, halo in stages]
+
+
+def tile_boxes(size: tuple, tile_size: int) -> list:
+    """
+    splits an image into tiles
+    :param size: (width, height) of the image
+    :param tile_size: width and height of the tiles, the ones on the right and bottom edges
+    can be smaller
+    :return: list of (left, top, right, bottom) boxes covering the image
+    """
+    width, height = size
+    return [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in range(0, height, tile_size)
+        for left in range(0, width, tile_size)
+    ]
+
+
+def filter_tile(box: tuple, im: Image.Image, pipeline: Pipeline, halo: int) -> Image.Image:
+    """
+    filters one tile of an image
+    :param box: (left, top, right, bottom) of the tile
+    :param im: the whole image, it isn't modified
+    :param pipeline: filters that can be run tile by tile
+    :param halo: pixels around the tile the filters need, less is read at the edges of the
+    image so the filters see the same edges as on the whole image
+    :return: the filtered tile, the size of box
+    """
+    left, top, right, bottom = box
+    region = (max(0, left - halo), max(0, top - halo), min(im.width, right + halo), min(im.height, bottom + halo))
+    out = pipeline.apply(im.crop(region))
+    return out.crop((left - region[0], top - region[1], right - region[0], bottom - region[1]))
+
+
+def run_tiled(im: Image.Image, pipeline: Pipeline, tile_size: int = DEFAULT_TILE_SIZE,
+              workers: int = DEFAULT_WORKERS) -> Image.Image:
+    """
+    applies a pipeline tile by tile, each tile is filtered along with a halo of the pixels
+    around it that the filters need, so the result is the same as filtering the whole image
+    only the source, the result and a few tiles are in memory at once instead of a copy of
+    the whole image for every filter
+    filters that move pixels around, like rotate and crop, are still run on the whole image,
+    the planner already moves crops to the start so they work on the source
+    :param im: the image to be filtered
+    :param pipeline: the filters to apply, can be a pipeline or the pipeline of a plan
+    :param tile_size: width and height of the tiles
+    :param workers: number of threads filtering tiles, pillow lets go of the GIL while filtering
+    :return: the filtered image
+    """
+    with BatchExecutor(workers, use_threads=True) as executor:
+        for stage, halo in split_stages(pipeline):
+            # an image without pixels, e.g. cropped away completely, has no tiles
+            empty = im.width == 0 or im.height == 0
+            if halo is None or empty or (im.width <= tile_size and im.height <= tile_size):
+                im = stage.apply(im)
+                continue
+
+            out = None
+            tiles = executor.map_unordered(filter_tile, tile_boxes(im.size, tile_size), im, stage, halo,
+                                           max_pending=executor.workers * PENDING_TILES_PER_WORKER)
+            for box, tile in tiles:
+                if out is None:
+                    out = Image.new(tile.mode, im.size)
+                    if tile.mode == 'P':
+                        out.putpalette(tile.getpalette())
+                out.paste(tile, box[:2])
+            im = out
+    return im
+
+
+def run_bands(arr: np.ndarray, pipeline: Pipeline, band_bytes: int = BAND_BYTES) -> np.ndarray:
+    """
+    applies a pipeline to an array, like run_tiled but in bands of whole rows so it works on
+    arrays mapped from a file by map_image without reading them into memory, only the band
+    being filtered is, and the results go into arrays from scratch() that are spilled to a
+    temporary file when they are big
+    flips, crops and rotations by right angles only make views of the array
+    :param arr: (height, width, channels) uint8 array, it isn't modified
+    :param pipeline: the filters to apply, can be a pipeline or the pipeline of a plan
+    :param band_bytes: bytes of pixels in each band
+    :return: the filtered array, may be a view of arr
+    """
+    for stage, halo in split_stages(pipeline):
+        if halo is None:
+            for spec in stage:
+                with profiled(spec.name, backend='numpy') as timed:
+                    arr = get_backend().apply_spec(spec, arr)
+                    timed.image(arr)
+            continue
+
+        height, width, channels = arr.shape
+        if height == 0 or width == 0:
+            # no rows to split into bands, this only finds the mode of the result
+            arr = to_array(stage.apply(to_image(arr)))
+            continue
+        rows = max(1, band_bytes // (width * channels))
+        out = None
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            start = max(0, top - halo)
+            band = to_array(stage.apply(to_image(arr[start:min(height, bottom + halo)])))
+            if out is None:
+                out = scratch((height, width, band.shape[2]), np.uint8)
+            out[top:bottom] = band[top - start:bottom - start]
+        if out is not None:
+            arr = out
+    return arr
@@ -1,5 +1,4 @@
 import sys
-import os
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -9,8 +8,15 @@ from PyQt6.QtWidgets import (
     QMenuBar,
     QMenu,
     QPushButton,
-    QVBoxLayout
+    QVBoxLayout,
+    QLabel,
+    QSpinBox,
+    QFileDialog,
+    QMessageBox,
+    QCheckBox,
+    QComboBox
 )
+from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QAction, QIcon, QPixmap
 
 from constants import *
@@ -18,6 +24,13 @@ from constants import *
 from components.side_panel import SidePanel
 from components.image_viewer import ImageViewer
 from components.filter_panel import FilterPanel
+from components.job_scheduler import JobScheduler, FolderExport
+from image_filtering.batch import make_output_folder, filter_checkpoints, export_checkpoints, save_checkpoint, output_settings
+from image_filtering.cache import ResultCache, preview_job, save_job, store_checkpoints
+from image_filtering.encoders import EncoderSettings, OUTPUT_FORMATS, DEFAULT_WRITERS
+from image_filtering.executor import BatchExecutor, DEFAULT_WORKERS
+from image_filtering.manifest import ExportManifest
+from image_filtering.pipeline import Pipeline, load_pipeline, save_pipeline
 
 
 def exit_app():
@@ -50,6 +63,19 @@ class MainWindow(QMainWindow):
         )
         self.setWindowIcon(window_icon)
 
+        # runs the filters on worker processes
+        self.executor = BatchExecutor()
+        # encodes and writes the saved images while the next ones are filtered
+        self.writer = BatchExecutor(DEFAULT_WRITERS, use_threads=True)
+        # runs the previews and saves off the GUI thread
+        self.scheduler = JobScheduler(self.executor, self)
+        # keeps filtered images so unchanged previews and saves aren't filtered again
+        self.cache = ResultCache()
+        # the batch of previews being made, replaced when the previews are updated again
+        self.preview_batch = None
+        # folders being exported
+        self.exports = []
+
         # create main windows
         layout = QVBoxLayout()
         layout.setContentsMargins(10, 10, 10, 10)
@@ -57,6 +83,7 @@ class MainWindow(QMainWindow):
         self.side_panel = SidePanel()
         self.side_panel.menu.itemSelectionChanged.connect(self.photo_selected)
         self.image_viewer = ImageViewer()
+        self.image_viewer.nearby_changed.connect(self.preview_nearby)
         self.filter_panel = FilterPanel()
 
         # holds folder selector and image viewer
@@ -76,6 +103,48 @@ class MainWindow(QMainWindow):
         preview_button.setFixedHeight(50)
         bottom_panel.addWidget(preview_button)
 
+        # updates the previews shortly after the filters stop changing
+        self.live_preview = QCheckBox('Live Preview')
+        self.live_preview.toggled.connect(self.schedule_live_preview)
+        bottom_panel.addWidget(self.live_preview)
+        self.live_preview_timer = QTimer(self)
+        self.live_preview_timer.setSingleShot(True)
+        self.live_preview_timer.setInterval(LIVE_PREVIEW_DELAY)
+        self.live_preview_timer.timeout.connect(self.update_images)
+        self.filter_panel.filters_selector.pipeline_changed.connect(self.schedule_live_preview)
+
+        # filters a copy of each image scaled down to the viewer instead of the full image
+        self.fast_preview = QCheckBox('Fast Preview')
+        self.fast_preview.setChecked(True)
+        self.fast_preview.toggled.connect(self.schedule_live_preview)
+        bottom_panel.addWidget(self.fast_preview)
+
+        # number of images filtered at the same time
+        workers_label = QLabel('Workers:')
+        bottom_panel.addWidget(workers_label)
+        self.workers_selector = QSpinBox()
+        self.workers_selector.setMinimum(1)
+        self.workers_selector.setMaximum(max(DEFAULT_WORKERS * 2, 8))
+        self.workers_selector.setValue(DEFAULT_WORKERS)
+        self.workers_selector.setFixedHeight(50)
+        self.workers_selector.valueChanged.connect(self.scheduler.set_workers)
+        bottom_panel.addWidget(self.workers_selector)
+
+        # format of the saved images and the quality of the lossy ones
+        format_label = QLabel('Format:')
+        bottom_panel.addWidget(format_label)
+        self.format_selector = QComboBox()
+        self.format_selector.addItems([*OUTPUT_FORMATS, 'source'])
+        self.format_selector.setFixedHeight(50)
+        bottom_panel.addWidget(self.format_selector)
+        quality_label = QLabel('Quality:')
+        bottom_panel.addWidget(quality_label)
+        self.quality_selector = QSpinBox()
+        self.quality_selector.setRange(1, 100)
+        self.quality_selector.setValue(EncoderSettings().quality)
+        self.quality_selector.setFixedHeight(50)
+        bottom_panel.addWidget(self.quality_selector)
+
         # add everything to outer layout
         layout.addWidget(splitter)
         layout.addLayout(bottom_panel)
@@ -88,8 +157,14 @@ class MainWindow(QMainWindow):
         # Create menu bar
         self.action_save = QAction('Save Copies', self)
         self.action_save.triggered.connect(self.save_all)
+        self.action_export_folder = QAction('Export Folder', self)
+        self.action_export_folder.triggered.connect(self.export_folder)
         self.action_open = QAction('Open', self)
         self.action_open.triggered.connect(self.side_panel.select_dir)
+        self.action_save_pipeline = QAction('Save Pipeline', self)
+        self.action_save_pipeline.triggered.connect(self.save_pipeline)
+        self.action_load_pipeline = QAction('Load Pipeline', self)
+        self.action_load_pipeline.triggered.connect(self.load_pipeline)
         self.action_quit = QAction('Quit', self)
         self.action_quit.triggered.connect(exit_app)
 
@@ -103,66 +178,258 @@ class MainWindow(QMainWindow):
 
         self.menu_file.addAction(self.action_open)
         self.menu_file.addAction(self.action_save)
+        self.menu_file.addAction(self.action_export_folder)
+        self.menu_file.addAction(self.action_save_pipeline)
+        self.menu_file.addAction(self.action_load_pipeline)
         self.menu_file.addAction(self.action_quit)
 
     def photo_selected(self):
         """
-        updates the image viewer tabs to match the selection in the side panel
+        updates the images in the image viewer to match the selection in the side panel
+        the previews of the newly opened images are made by preview_nearby
         :return: nothing
         """
         # selection is a list of strings with the selected items in the menu
         selection = self.side_panel.menu.selectedItems()
         selection = list(map(lambda n: n.text(), selection))
-        self.image_viewer.update_tabs(selection, self.side_panel.selected_dir)
+        self.image_viewer.update_selection(selection, self.side_panel.selected_dir)
+
+    def preview_nearby(self):
+        """
+        makes previews of the images that came next to the shown one in the image viewer, with
+        the current filters if live preview is on or the filters of the last update otherwise
+        images show unfiltered until the previews are updated for the first time, they are
+        opened in the background like any other preview
+        :return: nothing
+        """
+        if self.live_preview.isChecked():
+            self.schedule_live_preview()
+        elif self.preview_batch is not None:
+            self.preview_images(self.preview_batch.args[0])
+        else:
+            self.preview_images(Pipeline())
+
+    def schedule_live_preview(self):
+        """
+        restarts the live preview timer if live preview is on, so dragging a slider
+        updates the previews once it stops moving instead of on every step
+        :return: nothing
+        """
+        if self.live_preview.isChecked():
+            self.live_preview_timer.start()
 
     def update_images(self):
         """
-        updates all images in the image viewer to the current selected filters
+        updates the images in the image viewer to the current selected filters
+        :return: nothing
+        """
+        self.preview_images(self.filter_panel.filters_selector.get_pipeline())
+
+    def preview_images(self, pipeline):
+        """
+        filters the shown image and the ones next to it in the image viewer, the others are
+        filtered when they come next to the shown one
+        images are filtered in the background and each one is updated as soon as it is done,
+        previews that are still waiting from an earlier update are cancelled
+        the result after every filter is cached so changing one filter only runs it and the
+        ones after it again
+        with fast preview on, the filters run on copies of the images scaled down to the viewer
+        :param pipeline: the filters to preview
+        :return: nothing
+        """
+        if self.preview_batch is not None:
+            self.scheduler.cancel(self.preview_batch)
+
+        preview_box = self.image_viewer.preview_box() if self.fast_preview.isChecked() else None
+        names = dict()
+        sources = dict()
+        jobs = []
+        for name, path in self.image_viewer.nearby_paths().items():
+            try:
+                source, job = preview_job(self.cache, path, pipeline, preview_box)
+            except OSError:
+                self.image_viewer.set_unreadable(name)
+                continue
+            _, _, done, img, _ = job
+            if done == len(pipeline) and img is not None:
+                self.image_viewer.set_image(name, img)
+            else:
+                names[path] = name
+                sources[path] = source
+                jobs.append(job)
+
+        batch = self.scheduler.run(filter_checkpoints, jobs, pipeline, priority=PREVIEW_JOB_PRIORITY)
+        batch.item_done.connect(lambda job, results: self.preview_done(batch, job, results, names, sources))
+        batch.item_failed.connect(lambda job, error: self.preview_failed(batch, job, error, names))
+        self.preview_batch = batch
+
+    def preview_done(self, batch, job, results, names, sources):
+        """
+        caches the results of a preview job and shows the image if the previews weren't updated since
+        :param batch: the batch the job belongs to
+        :param job: the job given to filter_checkpoints
+        :param results: list of (number of filters applied, image) tuples
+        :param names: path of each image to its name in the image viewer
+        :param sources: path of each image to its key in the cache
+        :return: nothing
+        """
+        path = job[0]
+        # results of cancelled batches are still right for the filters they ran
+        store_checkpoints(self.cache, sources[path], batch.args[0], results)
+        if batch is self.preview_batch:
+            self.image_viewer.set_image(names[path], results[-1][1])
+            self.statusBar().showMessage(f'Updated {batch.ended + 1}/{batch.total} previews')
+
+    def preview_failed(self, batch, job, error, names):
+        """
+        shows that an image couldn't be previewed
+        :param batch: the batch the job belongs to
+        :param job: the job that failed
+        :param error: description of the error
+        :param names: path of each image to its name in the image viewer
         :return: nothing
         """
-        modified_images = self.image_viewer.opened_images.copy()
-        for key in modified_images:
-            img = modified_images[key]
-            modified_images[key] = self.apply_all_filters(img)
-        self.image_viewer.set_multiple_images(modified_images)
+        if batch is self.preview_batch:
+            self.image_viewer.set_unreadable(names[job[0]])
+        self.job_failed(job, error)
 
-    def apply_all_filters(self, img):
+    def job_failed(self, job, error):
         """
-        applies all selected filters to an image
-        :param img: the image to apply the filters to
-        :return: the modified image
+        shows that an image couldn't be filtered
+        :param job: the job that failed
+        :param error: description of the error
+        :return: nothing
+        """
+        self.statusBar().showMessage(f'Could not filter {job[0]}: {error}')
+
+    def encoder_settings(self) -> EncoderSettings:
+        """
+        gets how the saved images are encoded from the format and quality selectors
+        :return: the settings
         """
-        for image_filter in self.filter_panel.filters_selector.filters:
-            if image_filter.activate.isChecked():
-                img = image_filter.apply_to_image(img)
-        return img
+        return EncoderSettings(self.format_selector.currentText(), self.quality_selector.value())
 
     def save_all(self):
         """
-        creates a new folder called "output" then
+        creates a folder called "output" if there isn't one then
         filters all the selected images and then saves them as their filename
-        uses png for the created images
+        images saved there before with the same filters are skipped unless they changed, and
+        images whose file is gone since they were selected are skipped and listed
+        uses the selected format for the created images
         :return: nothing
         """
-        # creates a new folder
-        path_to_folder = self.side_panel.selected_dir + '/output'
-        if not os.path.exists(path_to_folder):
-            os.makedirs(path_to_folder)
-        else:
-            ending_num = 1
-            while os.path.exists(path_to_folder + str(ending_num)):
-                ending_num += 1
-            path_to_folder = path_to_folder + str(ending_num)
-            os.makedirs(path_to_folder)
-
-        # saves all images into that folder
-        modified_images = self.image_viewer.opened_images.copy()
-        for key in modified_images:
-            img = modified_images[key]
-            img = self.apply_all_filters(img)
-            filename = key[:key.index('.')]
-            path = path_to_folder + '/' + filename + '.png'
-            img.save(path)
+        # creates the folder
+        path_to_folder = make_output_folder(self.side_panel.selected_dir)
+        manifest = ExportManifest(path_to_folder)
+        pipeline = self.filter_panel.filters_selector.get_pipeline()
+        encoder = self.encoder_settings()
+        settings = output_settings(pipeline, encoder)
+        paths = []
+        missing = []
+        for path in self.image_viewer.image_paths.values():
+            try:
+                if not manifest.is_current(path, settings):
+                    paths.append(path)
+            except OSError:
+                missing.append(path)
+        if len(missing) > 0:
+            QMessageBox.warning(self, 'Save Copies', f'Could not find {len(missing)} of the selected images, '
+                                'they were skipped:\n' + '\n'.join(missing[:MISSING_LISTED]))
+
+        # filters all images in the background starting from the cached full resolution result
+        # if there is one, then the writer threads save them into that folder while the
+        # workers go on to the next images, jpegs that are only flipped or rotated by right
+        # angles are saved by the workers with a lossless transform of the source instead
+        jobs = [save_job(self.cache, path, pipeline) for path in paths]
+        batch = self.scheduler.run(export_checkpoints, jobs, pipeline, path_to_folder, encoder, priority=SAVE_JOB_PRIORITY,
+                                   then=(self.writer, save_checkpoint, (path_to_folder, encoder)))
+        skipped = manifest.skipped
+
+        def saved(job, output_path):
+            try:
+                manifest.record(job[0], output_path, settings)
+            except OSError:
+                # the source was deleted while it was being saved, it is saved again next time
+                pass
+            self.statusBar().showMessage(f'Saved {batch.ended + 1}/{batch.total} images, {skipped} up to date')
+
+        batch.item_done.connect(saved)
+        batch.item_failed.connect(self.job_failed)
+        batch.finished.connect(manifest.close)
+        if batch.total == 0:
+            self.statusBar().showMessage(f'All {skipped} images are up to date')
+
+    def export_folder(self):
+        """
+        asks for a folder, then filters every image in it and its subdirectories and saves
+        them in the "output" folder inside it with the same subdirectories, the folder is
+        created the first time and reused after that
+        the images are streamed in the background, so folders of any size can be exported,
+        images whose output in the folder's manifest is up to date are skipped
+        :return: nothing
+        """
+        directory = QFileDialog.getExistingDirectory(self, 'Export Folder', self.side_panel.selected_dir)
+        if len(directory) == 0:
+            return
+        output_dir = make_output_folder(directory)
+        pipeline = self.filter_panel.filters_selector.get_pipeline()
+        export = FolderExport(self.executor, self.writer, directory, pipeline, output_dir, self.encoder_settings(), self)
+        export.progress.connect(lambda done, path: self.statusBar().showMessage(f'Exported {done} images: {path}'))
+        export.failed.connect(lambda error: self.statusBar().showMessage(f'Export stopped: {error}'))
+        export.image_failed.connect(lambda path, error: self.statusBar().showMessage(f'Could not export {path}: {error}'))
+        export.finished.connect(lambda: self.export_done(export))
+        self.exports.append(export)
+        export.start()
+
+    def export_done(self, export):
+        """
+        shows how an export went once it has ended
+        :param export: the FolderExport that ended
+        :return: nothing
+        """
+        self.exports.remove(export)
+        notes = []
+        if export.skipped > 0:
+            notes.append(f'{export.skipped} images were up to date')
+        if export.errors > 0:
+            notes.append(f'{export.errors} images could not be exported')
+        if len(notes) > 0:
+            self.statusBar().showMessage('Export done, ' + ', '.join(notes))
+
+    def shutdown(self):
+        """
+        stops everything running in the background, called when the app closes
+        :return: nothing
+        """
+        for export in self.exports:
+            export.requestInterruption()
+        self.scheduler.shutdown()
+        for export in self.exports:
+            export.wait()
+        self.writer.shutdown()
+        self.side_panel.stop()
+
+    def save_pipeline(self):
+        """
+        saves the checked filters and their settings to a json file
+        the file can be loaded again or used with `python -m image_filtering batch`
+        :return: nothing
+        """
+        path, _ = QFileDialog.getSaveFileName(self, 'Save Pipeline', self.side_panel.selected_dir, 'Pipeline (*.json)')
+        if len(path) > 0:
+            save_pipeline(self.filter_panel.filters_selector.get_pipeline(), path)
+
+    def load_pipeline(self):
+        """
+        checks the filters and sets their settings from a json file
+        :return: nothing
+        """
+        path, _ = QFileDialog.getOpenFileName(self, 'Load Pipeline', self.side_panel.selected_dir, 'Pipeline (*.json)')
+        if len(path) > 0:
+            try:
+                self.filter_panel.filters_selector.set_pipeline(load_pipeline(path))
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, 'Load Pipeline', f'Could not load pipeline: {e}')
 
 
 if __name__ == '__main__':
@@ -170,6 +437,7 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
 
     window = MainWindow()
+    app.aboutToQuit.connect(window.shutdown)
 
     # default to maximized screen
     window.showMaximized()
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from image_filtering import batch, profiling
+from image_filtering.batch import run_batch, output_settings, export_checkpoints, save_checkpoint
+from image_filtering.benchmark import synthetic_image
+from image_filtering.encoders import EncoderSettings
+from image_filtering.manifest import ExportManifest
+from image_filtering.pipeline import *
+
+
+PIPELINE = Pipeline((SharpenSpec(), SmoothSpec(4), RotateSpec(15)))
+FLIPS = Pipeline((FlipSpec(True), RotateSpec(90)))
+
+
+def make_sources(directory, count: int = 3) -> list:
+    """
+    :param directory: folder to save the images in
+    :param count: number of images
+    :return: paths of small synthetic jpegs
+    """
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'source{i}.jpg')
+        synthetic_image((64, 48), 'RGB', seed=i).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_batch_with_profiling_off(tmp_path):
+    profiling.disable()
+    paths = make_sources(tmp_path)
+    output_dir = str(tmp_path / 'output')
+    os.makedirs(output_dir)
+    with ExportManifest(output_dir) as manifest:
+        saved = dict(run_batch(paths, PIPELINE, output_dir, manifest=manifest))
+        assert sorted(saved) == sorted(paths)
+        for path, output_path in saved.items():
+            with Image.open(output_path) as im:
+                assert im.mode == 'RGBA'
+            assert manifest.is_current(path, output_settings(PIPELINE, EncoderSettings()))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch_goes_on_after_a_bad_image(tmp_path, workers):
+    paths = make_sources(tmp_path)
+    bad = str(tmp_path / 'bad.jpg')
+    with open(bad, 'w') as file:
+        file.write('not an image')
+    output_dir = str(tmp_path / 'output')
+    os.makedirs(output_dir)
+    errors = dict()
+    with ExportManifest(output_dir) as manifest:
+        saved = dict(run_batch(paths[:1] + [bad] + paths[1:], PIPELINE, output_dir, workers, manifest=manifest,
+                               failed=lambda path, error: errors.setdefault(path, error)))
+        assert sorted(saved) == sorted(paths)
+        assert list(errors) == [bad]
+        assert isinstance(errors[bad], UnidentifiedImageError)
+        assert not manifest.is_current(bad, output_settings(PIPELINE, EncoderSettings()))
+
+
+def test_batch_stops_on_a_bad_image_without_failed(tmp_path):
+    bad = str(tmp_path / 'bad.jpg')
+    with open(bad, 'w') as file:
+        file.write('not an image')
+    with pytest.raises(UnidentifiedImageError):
+        list(run_batch([bad], PIPELINE, str(tmp_path)))
+
+
+@pytest.mark.parametrize('force', [False, True])
+def test_batch_goes_on_after_a_missing_image(tmp_path, force):
+    paths = make_sources(tmp_path)
+    missing = str(tmp_path / 'missing.jpg')
+    output_dir = str(tmp_path / 'output')
+    os.makedirs(output_dir)
+    errors = dict()
+    with ExportManifest(output_dir) as manifest:
+        saved = dict(run_batch(paths[:1] + [missing] + paths[1:], PIPELINE, output_dir, manifest=manifest,
+                               force=force, failed=lambda path, error: errors.setdefault(path, error)))
+    assert sorted(saved) == sorted(paths)
+    assert list(errors) == [missing]
+    assert isinstance(errors[missing], FileNotFoundError)
+
+
+def test_batch_goes_on_after_an_image_is_deleted_while_filtered(tmp_path, monkeypatch):
+    paths = make_sources(tmp_path)
+    output_dir = str(tmp_path / 'output')
+    os.makedirs(output_dir)
+    record = ExportManifest.record
+
+    def deleted_first(self, path, output_path, settings):
+        if path == paths[0]:
+            os.remove(path)
+        record(self, path, output_path, settings)
+
+    monkeypatch.setattr(ExportManifest, 'record', deleted_first)
+    errors = dict()
+    with ExportManifest(output_dir) as manifest:
+        saved = dict(run_batch(paths, PIPELINE, output_dir, manifest=manifest,
+                               failed=lambda path, error: errors.setdefault(path, error)))
+    assert sorted(saved) == sorted(paths[1:])
+    assert list(errors) == [paths[0]]
+
+
+def test_lossless_save_skips_filtering(tmp_path, monkeypatch):
+    path = make_sources(tmp_path, 1)[0]
+    transformed = []
+
+    def save_lossless(source, pipeline, output_path, encoder):
+        transformed.append(source)
+        synthetic_image((48, 64), 'RGB').save(output_path)
+        return True
+
+    def filter_checkpoints(*args):
+        raise AssertionError('a lossless save was filtered')
+
+    monkeypatch.setattr(batch, 'save_lossless', save_lossless)
+    monkeypatch.setattr(batch, 'filter_checkpoints', filter_checkpoints)
+    job = (path, 1.0, 0, None, (len(FLIPS),))
+    results = export_checkpoints(job, FLIPS, str(tmp_path))
+    assert results == []
+    assert transformed == [path]
+    assert os.path.exists(save_checkpoint(job, results, str(tmp_path)))
+
+
+def test_export_checkpoints_filters_when_not_lossless(tmp_path):
+    path = make_sources(tmp_path, 1)[0]
+    job = (path, 1.0, 0, None, (len(FLIPS),))
+    results = export_checkpoints(job, FLIPS, str(tmp_path), EncoderSettings('png'))
+    assert [done for done, _ in results] == [len(FLIPS)]
+    output_path = save_checkpoint(job, results, str(tmp_path), EncoderSettings('png'))
+    with Image.open(output_path) as im:
+        assert im.size == (48, 64)
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from image_filtering.batch import filter_checkpoints
+from image_filtering.benchmark import synthetic_image
+from image_filtering.cache import (
+    ResultCache, image_bytes, checkpoint_stops, source_identity, preview_job, save_job, store_checkpoints
+)
+from image_filtering.pipeline import *
+
+
+PIPELINE = Pipeline((CropSpec(5, 5, 5, 5), SharpenSpec(), BlurSpec(1), FlipSpec(True)))
+SOURCE = ('image.png', 0, 0)
+
+
+def images(count: int, size: tuple = (10, 10)) -> list:
+    return [Image.new('RGB', size, (i, i, i)) for i in range(count)]
+
+
+def test_least_recently_used_is_dropped_over_budget():
+    ims = images(4)
+    cache = ResultCache(budget=3 * image_bytes(ims[0]))
+    for i, im in enumerate(ims[:3]):
+        cache.put(SOURCE, PIPELINE[:i + 1], im)
+    # using the first result keeps it, so the second one is the oldest
+    assert cache.get(SOURCE, PIPELINE[:1]) is ims[0]
+    cache.put(SOURCE, PIPELINE[:4], ims[3])
+    assert len(cache) == 3
+    assert cache.nbytes == 3 * image_bytes(ims[0])
+    assert cache.get(SOURCE, PIPELINE[:2]) is None
+    assert [cache.get(SOURCE, PIPELINE[:n]) for n in (1, 3, 4)] == [ims[0], ims[2], ims[3]]
+
+
+def test_budget_counts_bytes_not_images():
+    small, = images(1)
+    large = Image.new('RGBA', (20, 20))
+    cache = ResultCache(budget=image_bytes(large) + image_bytes(small))
+    cache.put(SOURCE, PIPELINE[:1], small)
+    cache.put(SOURCE, PIPELINE[:2], large)
+    assert len(cache) == 2
+    cache.put(SOURCE, PIPELINE[:3], small.copy())
+    assert cache.get(SOURCE, PIPELINE[:1]) is None
+    assert cache.nbytes <= cache.budget
+
+
+def test_images_over_budget_and_replaced_results():
+    ims = images(2)
+    cache = ResultCache(budget=image_bytes(ims[0]))
+    cache.put(SOURCE, PIPELINE, Image.new('RGB', (20, 20)))
+    assert len(cache) == 0 and cache.nbytes == 0
+    cache.put(SOURCE, PIPELINE, ims[0])
+    cache.put(SOURCE, PIPELINE, ims[1])
+    assert len(cache) == 1
+    assert cache.nbytes == image_bytes(ims[1])
+    assert cache.get(SOURCE, PIPELINE) is ims[1]
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_longest_prefix():
+    ims = images(2)
+    cache = ResultCache()
+    assert cache.longest_prefix(SOURCE, PIPELINE) == (0, None)
+    cache.put(SOURCE, PIPELINE[:1], ims[0])
+    cache.put(SOURCE, PIPELINE[:3], ims[1])
+    assert cache.longest_prefix(SOURCE, PIPELINE) == (3, ims[1])
+    # a pipeline that only shares the first filter
+    other = Pipeline(PIPELINE.specs[:1] + (SmoothSpec(2),))
+    assert cache.longest_prefix(SOURCE, other) == (1, ims[0])
+    assert cache.longest_prefix(('other.png', 0, 0), PIPELINE) == (0, None)
+
+
+def test_checkpoint_stops():
+    assert checkpoint_stops(4, 0) == (1, 2, 3, 4)
+    assert checkpoint_stops(4, 2) == (3, 4)
+    assert checkpoint_stops(4, 4) == (4,)
+    assert checkpoint_stops(0, 0) == (0,)
+
+
+def test_changed_filter_carries_on_from_the_cached_prefix(tmp_path):
+    path = str(tmp_path / 'source.png')
+    synthetic_image((64, 48), 'RGB').save(path)
+    cache = ResultCache()
+    source, job = preview_job(cache, path, PIPELINE)
+    assert job[2] == 0 and job[3] is None
+    store_checkpoints(cache, source, PIPELINE, filter_checkpoints(job, PIPELINE))
+    assert len(cache) == len(PIPELINE)
+
+    changed = Pipeline(PIPELINE.specs[:2] + (BlurSpec(2),) + PIPELINE.specs[3:])
+    source, job = preview_job(cache, path, changed)
+    _, _, done, im, stops = job
+    assert done == 2 and im is not None and stops == (3, 4)
+    results = filter_checkpoints(job, changed)
+    with Image.open(path) as original:
+        expected = changed.apply(original)
+    assert np.array_equal(np.asarray(results[-1][1]), np.asarray(expected))
+
+    # saving reuses the whole result once it is cached
+    store_checkpoints(cache, source, changed, results)
+    _, scale, done, im, stops = save_job(cache, path, changed)
+    assert (scale, done, stops) == (1.0, len(changed), (len(changed),))
+    assert im is results[-1][1]
+
+
+def test_edited_source_gets_a_new_identity(tmp_path):
+    path = str(tmp_path / 'source.png')
+    synthetic_image((64, 48), 'RGB').save(path)
+    before = source_identity(path)
+    synthetic_image((64, 48), 'RGB', seed=1).save(path)
+    os.utime(path, ns=(before[1] + 10**9, before[1] + 10**9))
+    assert source_identity(path) != before
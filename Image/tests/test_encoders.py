@@ -0,0 +1,105 @@
+import os
+
+import pytest
+from PIL import Image
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.encoders import EncoderSettings, prepare_image, write_image, OUTPUT_FORMATS, FORMAT_MODES
+
+
+MODES = ['1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'CMYK', 'I', 'I;16', 'F']
+
+
+def make_image(mode: str, transparency: bool = False) -> Image.Image:
+    """
+    :param mode: pixel mode of the image
+    :param transparency: give a P image a transparent colour
+    :return: small image in that mode
+    """
+    im = synthetic_image((33, 21), 'RGB').convert(mode)
+    if transparency:
+        im.info['transparency'] = 0
+    return im
+
+
+def has_alpha(im: Image.Image) -> bool:
+    return 'A' in im.getbands() or 'transparency' in im.info
+
+
+@pytest.mark.parametrize('output_format', list(OUTPUT_FORMATS))
+@pytest.mark.parametrize('mode', MODES)
+def test_prepared_mode_can_be_stored(output_format, mode):
+    im = make_image(mode)
+    prepared = prepare_image(im, output_format)
+    assert prepared.mode in FORMAT_MODES[output_format]
+    assert prepared.size == im.size
+    if mode in FORMAT_MODES[output_format]:
+        assert prepared is im
+    elif mode == 'I' and output_format == 'png':
+        assert prepared.mode == 'I;16'
+    elif has_alpha(im) and 'RGBA' in FORMAT_MODES[output_format]:
+        assert prepared.mode == 'RGBA'
+    elif mode in ('1', 'LA', 'I', 'I;16', 'F') and 'L' in FORMAT_MODES[output_format]:
+        assert prepared.mode == 'L'
+    else:
+        assert prepared.mode == 'RGB'
+
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp'])
+def test_palette_transparency_is_kept_where_the_format_has_alpha(output_format):
+    prepared = prepare_image(make_image('P', transparency=True), output_format)
+    assert prepared.mode == ('RGBA' if output_format == 'webp' else 'RGB')
+
+
+@pytest.mark.parametrize('output_format', list(OUTPUT_FORMATS))
+@pytest.mark.parametrize('mode', MODES)
+def test_written_image_opens(tmp_path, output_format, mode):
+    im = make_image(mode)
+    output_path = str(tmp_path / ('output' + OUTPUT_FORMATS[output_format]))
+    assert write_image(im, output_path, EncoderSettings(output_format)) == output_path
+    with Image.open(output_path) as written:
+        assert written.format == output_format.upper()
+        assert written.size == im.size
+    assert im.mode == mode
+
+
+@pytest.mark.parametrize('path, output_format, extension', [
+    ('a/photo.JPG', 'jpeg', '.JPG'), ('a/photo.jpeg', 'jpeg', '.jpeg'), ('a/scan.tif', 'tiff', '.tif'),
+    ('a/icon.webp', 'webp', '.webp'), ('a/notes.png', 'png', '.png'), ('a/old.bmp', 'png', '.png'),
+    ('a/raw.ppm', 'png', '.png')
+])
+def test_source_format(path, output_format, extension):
+    settings = EncoderSettings('source')
+    assert settings.output_format(path) == output_format
+    assert settings.extension(path) == extension
+
+
+def test_jpeg_output_of_a_jpeg_written_as_source(tmp_path):
+    output_path = str(tmp_path / 'photo.jfif')
+    write_image(make_image('RGBA'), output_path, EncoderSettings('source'))
+    with Image.open(output_path) as written:
+        assert written.format == 'JPEG' and written.mode == 'RGB'
+
+
+@pytest.mark.parametrize('kwargs', [{'format': 'bmp'}, {'quality': 0}, {'quality': 101}, {'compress_level': 10}])
+def test_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        EncoderSettings(**kwargs)
+
+
+def test_key_changes_with_every_setting():
+    keys = {EncoderSettings(**kwargs).key() for kwargs in [
+        {}, {'format': 'jpeg'}, {'quality': 80}, {'compress_level': 6}, {'optimize': True}, {'lossless': False}
+    ]}
+    assert len(keys) == 6
+    assert EncoderSettings().key() == EncoderSettings().key()
+
+
+def test_compress_level_and_optimize(tmp_path):
+    im = make_image('RGB')
+    sizes = []
+    for settings in [EncoderSettings(compress_level=0), EncoderSettings(compress_level=9)]:
+        sizes.append(os.path.getsize(write_image(im, str(tmp_path / f'{settings.compress_level}.png'), settings)))
+    assert sizes[1] < sizes[0]
+    assert EncoderSettings('tiff', compress_level=0).save_options('tiff') == {'compression': 'raw'}
+    assert EncoderSettings('webp', optimize=True).save_options('webp')['method'] == 6
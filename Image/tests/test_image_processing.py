@@ -0,0 +1,39 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.image_processing import *
+
+
+TESTING_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testing_images')
+
+
+def images() -> list:
+    """
+    :return: synthetic images in every mode and a few of the testing images, scaled down
+    """
+    found = [synthetic_image((200, 150), mode) for mode in ('L', 'RGB', 'RGBA')]
+    for path in sorted(glob.glob(os.path.join(TESTING_IMAGES, '*.jpg')))[:3]:
+        with Image.open(path) as im:
+            found.append(im.reduce(4))
+    return found
+
+
+@pytest.mark.parametrize('intensity', range(SMOOTH_MAX_PASSES + 1, SMOOTH_TOLERANCE_INTENSITY + 1))
+def test_smooth_within_tolerance_of_iterated(intensity):
+    margin = SMOOTH_TOLERANCE_MARGIN
+    for im in images():
+        fast = np.asarray(smooth(im, intensity)).astype(np.int16)
+        iterated = np.asarray(smooth_iterated(im, intensity)).astype(np.int16)
+        assert fast.shape == iterated.shape
+        assert np.abs(fast - iterated)[margin:-margin, margin:-margin].max() <= SMOOTH_TOLERANCE
+
+
+@pytest.mark.parametrize('intensity', range(1, SMOOTH_MAX_PASSES + 1))
+def test_smooth_is_iterated_up_to_pass_limit(intensity):
+    for im in images():
+        assert np.array_equal(np.asarray(smooth(im, intensity)), np.asarray(smooth_iterated(im, intensity)))
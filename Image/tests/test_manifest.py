@@ -0,0 +1,87 @@
+import os
+
+from image_filtering.batch import run_batch, output_settings
+from image_filtering.benchmark import synthetic_image
+from image_filtering.encoders import EncoderSettings
+from image_filtering.manifest import ExportManifest
+from image_filtering.pipeline import *
+
+
+PIPELINE = Pipeline((SharpenSpec(), FlipSpec(True)))
+
+
+def export(sources: list, output_dir: str, pipeline: Pipeline = PIPELINE,
+           encoder: EncoderSettings = EncoderSettings()) -> tuple:
+    """
+    exports the sources into output_dir with its manifest
+    :return: (paths of the sources that were exported, number skipped)
+    """
+    with ExportManifest(output_dir) as manifest:
+        saved = [path for path, _ in run_batch(sources, pipeline, output_dir, manifest=manifest, encoder=encoder)]
+        return sorted(saved), manifest.skipped
+
+
+def make_sources(directory) -> tuple:
+    """
+    :return: (paths of small synthetic pngs, output folder)
+    """
+    paths = []
+    for i in range(3):
+        path = os.path.join(directory, f'source{i}.png')
+        synthetic_image((32, 24), 'RGB', seed=i).save(path)
+        paths.append(path)
+    output_dir = os.path.join(directory, 'output')
+    os.makedirs(output_dir)
+    return paths, output_dir
+
+
+def test_unchanged_sources_are_skipped(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    assert export(paths, output_dir) == (paths, 0)
+    assert export(paths, output_dir) == ([], 3)
+
+
+def test_pipeline_change_exports_again(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    export(paths, output_dir)
+    assert export(paths, output_dir, Pipeline((SharpenSpec(), FlipSpec(False)))) == (paths, 0)
+    assert export(paths, output_dir, Pipeline((SharpenSpec(),))) == (paths, 0)
+
+
+def test_encoder_change_exports_again(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    export(paths, output_dir, encoder=EncoderSettings('jpeg', 90))
+    assert export(paths, output_dir, encoder=EncoderSettings('jpeg', 80)) == (paths, 0)
+    assert export(paths, output_dir, encoder=EncoderSettings('jpeg', 80)) == ([], 3)
+    assert export(paths, output_dir, encoder=EncoderSettings('png')) == (paths, 0)
+
+
+def test_edited_source_exports_again(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    export(paths, output_dir)
+    stat = os.stat(paths[1])
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert export(paths, output_dir) == ([paths[1]], 2)
+
+
+def test_deleted_output_exports_again(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    with ExportManifest(output_dir) as manifest:
+        outputs = dict(run_batch(paths, PIPELINE, output_dir, manifest=manifest))
+    os.remove(outputs[paths[2]])
+    assert export(paths, output_dir) == ([paths[2]], 2)
+
+
+def test_record_is_kept_after_closing(tmp_path):
+    paths, output_dir = make_sources(tmp_path)
+    settings = output_settings(PIPELINE, EncoderSettings())
+    output_path = os.path.join(output_dir, 'source0.png')
+    synthetic_image((32, 24), 'RGB').save(output_path)
+    with ExportManifest(output_dir) as manifest:
+        assert not manifest.is_current(paths[0], settings)
+        manifest.record(paths[0], output_path, settings)
+    with ExportManifest(output_dir) as manifest:
+        assert manifest.is_current(paths[0], settings)
+        assert not manifest.is_current(paths[0], output_settings(PIPELINE, EncoderSettings('webp')))
+        assert not manifest.is_current(paths[1], settings)
+        assert manifest.skipped == 1
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_filtering import batch
+from image_filtering.batch import filter_file
+from image_filtering.benchmark import synthetic_image
+from image_filtering.mapped import map_image, open_mapped, array_image
+from image_filtering.numpy_backend import to_array
+from image_filtering.pipeline import *
+from image_filtering.planner import plan_pipeline
+from image_filtering.tiled import run_bands
+
+
+# formats and modes whose files are stored uncompressed, tga and bmp are stored bottom up
+# and bmp and tga with their channels reversed
+MAPPABLE = [
+    ('ppm', 'L'), ('ppm', 'RGB'), ('bmp', 'L'), ('bmp', 'RGB'), ('tga', 'L'), ('tga', 'RGB'),
+    ('tiff', 'L'), ('tiff', 'RGB'), ('tiff', 'RGBA')
+]
+PIPELINES = [
+    Pipeline((CropSpec(5, 5, 5, 5), RotateSpec(-90), ScanSpec(180), SharpenSpec())),
+    Pipeline((CropSpec(10, 0, 10, 0), SharpenSpec(), SmoothSpec(3), FlipSpec(True))),
+    Pipeline((GreyscaleSpec(), SharpenSpec(), BlurSpec(1), RotateSpec(90), FlipSpec(False), EmbossSpec())),
+    Pipeline((ScanSpec(200), RotateSpec(15), FlipSpec(False), CropSpec(5, 5, 5, 5), SharpenSpec(),
+              BlurSpec(2), SmoothSpec(SMOOTH_MAX_PASSES + 2), EmbossSpec(), GreyscaleSpec()))
+]
+
+
+def save_source(tmp_path, extension: str, mode: str, size: tuple = (97, 61)) -> str:
+    """
+    :return: path of a synthetic image saved uncompressed, with an odd width so rows are padded
+    """
+    path = str(tmp_path / f'source.{extension}')
+    synthetic_image(size, mode).save(path)
+    return path
+
+
+def decoded(path: str) -> np.ndarray:
+    with Image.open(path) as im:
+        return to_array(im)
+
+
+@pytest.mark.parametrize('extension, mode', MAPPABLE)
+def test_mapped_pixels_match_decoded(tmp_path, extension, mode):
+    path = save_source(tmp_path, extension, mode)
+    with Image.open(path) as im:
+        arr = map_image(im)
+    assert arr is not None
+    assert not arr.flags.writeable
+    assert np.array_equal(arr, decoded(path))
+
+
+@pytest.mark.parametrize('extension, mode', [('png', 'RGB'), ('jpg', 'RGB'), ('tga', 'RGBA'), ('bmp', 'RGBA')])
+def test_files_that_cant_be_mapped(tmp_path, extension, mode):
+    with Image.open(save_source(tmp_path, extension, mode)) as im:
+        assert map_image(im) is None
+
+
+def test_only_large_images_are_opened_mapped(tmp_path):
+    path = save_source(tmp_path, 'ppm', 'RGB')
+    assert open_mapped(path) is None
+    assert open_mapped(path, min_pixels=97 * 61 - 1) is not None
+
+
+@pytest.mark.parametrize('band_bytes', [1, 97 * 3 * 7, 1 << 20], ids=['one_row', 'bands', 'whole'])
+@pytest.mark.parametrize('pipeline', PIPELINES)
+@pytest.mark.parametrize('extension, mode', MAPPABLE)
+def test_bands_match_decoded(tmp_path, extension, mode, pipeline, band_bytes):
+    path = save_source(tmp_path, extension, mode)
+    with Image.open(path) as im:
+        arr = map_image(im)
+        im.load()
+        expected = pipeline.apply(im)
+    planned = plan_pipeline(pipeline, (arr.shape[1], arr.shape[0]), mode).pipeline
+    for run in (pipeline, planned):
+        result = array_image(run_bands(arr, run, band_bytes))
+        assert result.mode == expected.mode
+        assert np.array_equal(to_array(result), to_array(expected))
+
+
+@pytest.mark.parametrize('extension, mode', MAPPABLE)
+def test_filter_file_maps_large_images(tmp_path, monkeypatch, extension, mode):
+    path = save_source(tmp_path, extension, mode)
+    mapped = []
+
+    def open_small_mapped(source):
+        arr = open_mapped(source, min_pixels=0)
+        mapped.append(arr is not None)
+        return arr
+
+    monkeypatch.setattr(batch, 'open_mapped', open_small_mapped)
+    pipeline = PIPELINES[0]
+    with Image.open(path) as im:
+        expected = pipeline.apply(im)
+    assert np.array_equal(to_array(filter_file(path, pipeline)), to_array(expected))
+    assert mapped == [True]
+
+
+@pytest.mark.parametrize('channels', [1, 3, 4])
+def test_array_image_of_views(channels):
+    arr = np.random.default_rng(0).integers(0, 256, (61, 97, channels), dtype=np.uint8)
+    for view in (arr, arr[::-1], arr[:, ::-1], arr[10:20, 5:50], arr[:0]):
+        im = array_image(view)
+        assert im.size == (view.shape[1], view.shape[0])
+        assert np.array_equal(to_array(im), view)
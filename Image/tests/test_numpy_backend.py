@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.numpy_backend import NumpyBackend, to_array
+from image_filtering.pipeline import *
+from image_filtering.planner import plan_pipeline
+
+
+SPECS = [
+    ScanSpec(0), ScanSpec(150), ScanSpec(255), RotateSpec(90), RotateSpec(-90), RotateSpec(180), RotateSpec(15),
+    FlipSpec(True), FlipSpec(False), CropSpec(10, 5, 20, 15), SharpenSpec(), BlurSpec(0), BlurSpec(2),
+    SmoothSpec(1), SmoothSpec(2), EmbossSpec(), GreyscaleSpec()
+]
+PIPELINES = [
+    Pipeline((CropSpec(5, 5, 5, 5), RotateSpec(-90), ScanSpec(180), SharpenSpec())),
+    Pipeline((CropSpec(10, 0, 10, 0), SharpenSpec(), SmoothSpec(3), FlipSpec(True))),
+    Pipeline((GreyscaleSpec(), SharpenSpec(), BlurSpec(1), RotateSpec(90), FlipSpec(False), EmbossSpec())),
+    Pipeline((ScanSpec(200), RotateSpec(15), FlipSpec(False), CropSpec(5, 5, 5, 5), SharpenSpec(),
+              BlurSpec(2), SmoothSpec(4), EmbossSpec(), GreyscaleSpec()))
+]
+
+
+def assert_same(result, expected):
+    assert result.mode == expected.mode
+    assert result.size == expected.size
+    assert np.array_equal(to_array(result), to_array(expected))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('spec', SPECS, ids=lambda spec: spec.name)
+def test_filter_matches_pil(mode, spec):
+    im = synthetic_image((97, 61), mode)
+    pipeline = Pipeline((spec,))
+    assert_same(NumpyBackend().apply(pipeline, im), pipeline.apply(im))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('pipeline', PIPELINES)
+def test_planned_pipeline_matches_pil(mode, pipeline):
+    im = synthetic_image((97, 61), mode)
+    planned = plan_pipeline(pipeline, im.size, im.mode).pipeline
+    # one backend for every image, like a worker process, so stale buffers would show up
+    backend = NumpyBackend()
+    for _ in range(2):
+        assert_same(backend.apply(planned, im), pipeline.apply(im))
+
+
+@pytest.mark.parametrize('crop', [CropSpec(50, 0, 50, 0), CropSpec(0, 50, 0, 50), CropSpec(50, 50, 50, 50)])
+@pytest.mark.parametrize('spec', SPECS + [SmoothSpec(SMOOTH_MAX_PASSES + 2)], ids=lambda spec: spec.name)
+def test_image_cropped_to_nothing(crop, spec):
+    im = synthetic_image((97, 61), 'RGB')
+    pipeline = Pipeline((crop, spec))
+    assert_same(NumpyBackend().apply(pipeline, im), pipeline.apply(im))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('specs', [
+    (SmoothSpec(SMOOTH_MAX_PASSES + 1),),
+    (SmoothSpec(SMOOTH_MAX_PASSES + 3),),
+    # the smooth reads an array the backend owns, which its blur passes must not write over
+    (GreyscaleSpec(), SmoothSpec(SMOOTH_MAX_PASSES + 2)),
+    (BlurSpec(1), SmoothSpec(SMOOTH_MAX_PASSES + 1)),
+    (RotateSpec(90), CropSpec(5, 5, 5, 5), SmoothSpec(SMOOTH_MAX_PASSES + 4))
+])
+def test_smooth_above_pass_limit_matches_pil(mode, specs):
+    im = synthetic_image((97, 61), mode)
+    pipeline = Pipeline(specs)
+    expected = pipeline.apply(im)
+    result = NumpyBackend().apply(pipeline, im)
+    assert_same(result, expected)
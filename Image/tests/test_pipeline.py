@@ -0,0 +1,34 @@
+import pytest
+
+from image_filtering.pipeline import *
+
+
+@pytest.mark.parametrize('data', [
+    {'filter': 'flip', 'horizontal': 'false'},
+    {'filter': 'flip', 'horizontal': 0},
+    {'filter': 'blur', 'intensity': 3.7},
+    {'filter': 'blur', 'intensity': '3'},
+    {'filter': 'smooth', 'intensity': True},
+    {'filter': 'rotate', 'angle': '90'},
+    {'filter': 'rotate', 'angle': 90, 'resample': 3},
+    {'filter': 'crop', 'left': None},
+    {'filter': 'scan', 'threshold': [200]}
+])
+def test_wrong_parameter_types_are_refused(data):
+    with pytest.raises(ValueError):
+        spec_from_dict(data)
+
+
+def test_numbers_are_stored_as_their_field_type():
+    assert spec_from_dict({'filter': 'blur', 'intensity': 3.0}) == BlurSpec(3)
+    assert RotateSpec(90) == RotateSpec(90.0)
+    assert RotateSpec(90).to_dict() == {'filter': 'rotate', 'angle': 90.0, 'resample': 'nearest'}
+    assert type(CropSpec(10, 5, 0, 0).left) is float
+
+
+def test_pipeline_round_trips_through_json():
+    pipeline = Pipeline((ScanSpec(180), RotateSpec(-90), FlipSpec(False), CropSpec(5, 2.5, 5, 0), SharpenSpec(),
+                         BlurSpec(2), SmoothSpec(3), EmbossSpec(), GreyscaleSpec()))
+    loaded = Pipeline.from_json(pipeline.to_json())
+    assert loaded == pipeline
+    assert loaded.key() == pipeline.key()
@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+import pytest
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.numpy_backend import to_array
+from image_filtering.pipeline import *
+from image_filtering.planner import (
+    ConvertSpec, plan_pipeline, lower, push_crops, move_conversions, fold_transposes, drop_conversions, output_mode
+)
+
+
+SEED = 2024
+RUNS = 300
+
+
+def random_spec(rng: random.Random) -> FilterSpec:
+    """
+    :param rng: random generator
+    :return: a filter with random parameters, transposes and crops drawn the most as the
+    planner moves those around
+    """
+    kind = rng.choice(['rotate', 'rotate', 'flip', 'flip', 'crop', 'crop', 'greyscale', 'emboss', 'scan',
+                       'sharpen', 'blur', 'smooth'])
+    if kind == 'rotate':
+        return RotateSpec(rng.choice([90, -90, 180, 270, 360, 15, -30]))
+    if kind == 'flip':
+        return FlipSpec(rng.random() < 0.5)
+    if kind == 'crop':
+        return CropSpec(*(rng.randrange(0, 30) for _ in range(4)))
+    if kind == 'greyscale':
+        return GreyscaleSpec()
+    if kind == 'emboss':
+        return EmbossSpec()
+    if kind == 'scan':
+        return ScanSpec(rng.randrange(0, 256))
+    if kind == 'sharpen':
+        return SharpenSpec()
+    if kind == 'blur':
+        return BlurSpec(rng.randrange(0, 3))
+    return SmoothSpec(rng.randrange(1, 4))
+
+
+def random_cases():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        size = (rng.randrange(8, 60), rng.randrange(8, 60))
+        specs = tuple(random_spec(rng) for _ in range(rng.randrange(1, 6)))
+        yield size, rng.choice(['L', 'RGB', 'RGBA']), Pipeline(specs)
+
+
+def test_random_plans_match_listed_filters():
+    for size, mode, pipeline in random_cases():
+        im = synthetic_image(size, mode)
+        expected = pipeline.apply(im)
+        plan = plan_pipeline(pipeline, im.size, im.mode)
+        result = plan.apply(im)
+        explain = f'{size} {mode}\n{plan.describe()}'
+        assert result.mode == expected.mode, explain
+        assert result.size == expected.size, explain
+        assert np.array_equal(to_array(result), to_array(expected)), explain
+
+        planned_mode = mode
+        for spec in plan.pipeline:
+            planned_mode = output_mode(spec, planned_mode)
+        assert planned_mode == expected.mode, explain
+
+
+def test_every_rewrite_is_noted():
+    for size, mode, pipeline in random_cases():
+        ops = lower(pipeline, size)
+        notes = []
+        passes = [
+            lambda: push_crops(ops, size, notes), lambda: move_conversions(ops, mode, notes),
+            lambda: fold_transposes(ops, notes), lambda: drop_conversions(ops, mode, notes)
+        ]
+        changed = True
+        while changed:
+            changed = False
+            for rewrite in passes:
+                noted = len(notes)
+                if rewrite():
+                    assert len(notes) > noted, f'{size} {mode} {pipeline} -> {ops}'
+                    changed = True
+                    break
+
+
+@pytest.mark.parametrize('flip', [FlipSpec(True), FlipSpec(False)])
+def test_moved_greyscale_is_noted(flip):
+    plan = plan_pipeline(Pipeline((flip, GreyscaleSpec())), (40, 30), 'RGB')
+    assert plan.pipeline[0] == ConvertSpec('L')
+    assert any(note.startswith('moved convert to L before flip') for note in plan.notes)
+    assert 'moved convert to L before flip' in plan.describe()
@@ -0,0 +1,29 @@
+import json
+
+from image_filtering import profiling
+from image_filtering.profiling import enable, disable, stage, load_trace
+
+
+def profiled_run(trace_dir, count: int) -> list:
+    """
+    :param trace_dir: folder the traces are written to
+    :param count: number of stages to record
+    :return: the events of the run
+    """
+    enable(str(trace_dir))
+    try:
+        for i in range(count):
+            with stage('decode', path=f'image{i}.png'):
+                pass
+    finally:
+        disable()
+    return load_trace(str(trace_dir))
+
+
+def test_traces_of_earlier_runs_are_replaced(tmp_path):
+    events = profiled_run(tmp_path, 3)
+    assert len(events) == 3
+    # as if left by a worker process of the earlier run
+    (tmp_path / 'trace-1.jsonl').write_text(''.join(json.dumps(event) + '\n' for event in events))
+    assert len(profiled_run(tmp_path, 2)) == 2
+    assert profiling._profiler is None
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.thumbnail_cache import ThumbnailCache
+
+
+BOX = 32
+
+
+def make_sources(directory, count: int = 3) -> list:
+    paths = []
+    for i in range(count):
+        path = str(directory / f'source{i}.png')
+        synthetic_image((120, 80), 'RGB', seed=i).save(path)
+        paths.append(path)
+    return paths
+
+
+def used_times(cache_path: str) -> dict:
+    """
+    :return: used time of every thumbnail in the file by path, as another instance of the app sees it
+    """
+    connection = sqlite3.connect(cache_path)
+    try:
+        return dict(connection.execute('SELECT path, used FROM thumbnails').fetchall())
+    finally:
+        connection.close()
+
+
+def test_thumbnails_are_kept_between_runs(tmp_path):
+    paths = make_sources(tmp_path)
+    cache_path = str(tmp_path / 'cache' / 'thumbnails.sqlite')
+    cache = ThumbnailCache(cache_path)
+    made = [cache.thumbnail(path, BOX) for path in paths]
+    cache.close()
+    cache = ThumbnailCache(cache_path)
+    try:
+        for path, im in zip(paths, made):
+            stored = cache.get(path, BOX)
+            assert stored is not None and stored.size == im.size and max(im.size) <= BOX
+        assert cache.get(paths[0], BOX * 2) is None
+    finally:
+        cache.close()
+
+
+def test_use_is_written_on_commit_only(tmp_path):
+    paths = make_sources(tmp_path)
+    cache_path = str(tmp_path / 'thumbnails.sqlite')
+    cache = ThumbnailCache(cache_path)
+    try:
+        for path in paths:
+            cache.thumbnail(path, BOX)
+        cache.commit()
+        before = used_times(cache_path)
+        assert cache.get(paths[0], BOX) is not None
+        # reading holds no write lock, so other instances can still write
+        other = sqlite3.connect(cache_path, timeout=0)
+        other.execute('UPDATE thumbnails SET used = 0 WHERE path LIKE ?', ('%source2.png',))
+        other.commit()
+        other.close()
+        assert used_times(cache_path) == dict(before, **{p: 0 for p in before if p.endswith('source2.png')})
+        cache.commit()
+        after = used_times(cache_path)
+        assert max(after, key=after.get).endswith('source0.png')
+    finally:
+        cache.close()
+
+
+def test_least_recently_used_is_dropped(tmp_path):
+    paths = make_sources(tmp_path)
+    cache = ThumbnailCache(str(tmp_path / 'thumbnails.sqlite'))
+    try:
+        for path in paths:
+            cache.thumbnail(path, BOX)
+        cache.commit()
+        cache.get(paths[0], BOX)
+        sizes = dict(cache.connection.execute('SELECT path, LENGTH(data) FROM thumbnails').fetchall())
+        # room for all but the second one
+        cache.max_bytes = sum(sizes.values()) - sizes[os.path.abspath(paths[1])]
+        cache.commit()
+        assert cache.get(paths[0], BOX) is not None
+        assert cache.get(paths[1], BOX) is None
+        assert cache.get(paths[2], BOX) is not None
+    finally:
+        cache.close()
+
+
+def test_edited_image_is_made_again(tmp_path):
+    path, = make_sources(tmp_path, 1)
+    cache = ThumbnailCache(str(tmp_path / 'thumbnails.sqlite'))
+    try:
+        cache.thumbnail(path, BOX)
+        synthetic_image((60, 120), 'RGB').save(path)
+        assert cache.get(path, BOX) is None
+        assert cache.thumbnail(path, BOX).size == (16, 32)
+    finally:
+        cache.close()
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from image_filtering.benchmark import synthetic_image
+from image_filtering.numpy_backend import to_array
+from image_filtering.pipeline import *
+from image_filtering.planner import plan_pipeline
+from image_filtering.tiled import run_tiled, run_bands
+
+
+SPECS = [
+    ScanSpec(150), RotateSpec(90), RotateSpec(15), FlipSpec(True), FlipSpec(False), CropSpec(10, 5, 20, 15),
+    SharpenSpec(), BlurSpec(1), SmoothSpec(2), SmoothSpec(4), EmbossSpec(), GreyscaleSpec()
+]
+PIPELINES = [
+    Pipeline((SharpenSpec(), BlurSpec(1), SmoothSpec(3))),
+    Pipeline((CropSpec(5, 5, 5, 5), RotateSpec(-90), ScanSpec(180), SharpenSpec())),
+    Pipeline((ScanSpec(200), RotateSpec(15), FlipSpec(False), SharpenSpec(), EmbossSpec(), GreyscaleSpec()))
+]
+
+
+def assert_same(result, expected):
+    assert result.mode == expected.mode
+    assert result.size == expected.size
+    assert np.array_equal(to_array(result), to_array(expected))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('spec', SPECS, ids=lambda spec: spec.name)
+def test_tiled_filter_matches_pil(mode, spec):
+    # small tiles so the image is split into many of them, with halos crossing tile edges
+    im = synthetic_image((150, 110), mode)
+    pipeline = Pipeline((spec,))
+    assert_same(run_tiled(im, pipeline, tile_size=32, workers=2), pipeline.apply(im))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('pipeline', PIPELINES)
+def test_tiled_planned_pipeline_matches_pil(mode, pipeline):
+    im = synthetic_image((150, 110), mode)
+    planned = plan_pipeline(pipeline, im.size, im.mode).pipeline
+    assert_same(run_tiled(im, planned, tile_size=32), pipeline.apply(im))
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('pipeline', PIPELINES)
+def test_bands_match_pil(mode, pipeline):
+    im = synthetic_image((150, 110), mode)
+    # a band of a few rows so the halos cross many band edges
+    result = run_bands(to_array(im), pipeline, band_bytes=150 * len(mode) * 3)
+    assert np.array_equal(result, to_array(pipeline.apply(im)))
+
+
+@pytest.mark.parametrize('spec', SPECS, ids=lambda spec: spec.name)
+def test_tiled_image_cropped_to_nothing(spec):
+    im = synthetic_image((150, 110), 'RGB')
+    pipeline = Pipeline((CropSpec(50, 0, 50, 0), spec))
+    assert_same(run_tiled(im, pipeline, tile_size=32), pipeline.apply(im))
+    assert np.array_equal(run_bands(to_array(im), pipeline), to_array(pipeline.apply(im)))